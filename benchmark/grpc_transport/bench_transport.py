@@ -0,0 +1,124 @@
+"""Throughput and memory of uploads through the aggregator's gRPC transport.
+
+Each configuration (payload size, compression, chunking) runs in a fresh pair of
+processes: a client, which uploads a payload to a JobService server several times,
+and the server. It reports the upload throughput, and the peak RSS of the server
+(which reassembles the payload) and of the client.
+
+    python benchmark/grpc_transport/bench_transport.py --sizes 1 10 100 500 --chunk_size 4
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from concurrent import futures
+
+import grpc
+
+import fedscale.core.channels.job_api_pb2 as job_api_pb2
+import fedscale.core.channels.job_api_pb2_grpc as job_api_pb2_grpc
+from fedscale.core.channels.channel_context import (ClientConnections,
+                                                    CompleteRequestFields,
+                                                    get_channel_options,
+                                                    merge_chunks)
+
+MB = 1024 * 1024
+
+
+class EchoServicer(job_api_pb2_grpc.JobServiceServicer):
+    """Accepts uploads and replies with an empty response"""
+
+    def CLIENT_EXECUTE_COMPLETION(self, request, context):
+        return job_api_pb2.ServerResponse(event='N', meta=b'', data=str(len(request.data_result)).encode())
+
+    def CLIENT_EXECUTE_COMPLETION_STREAM(self, request_iterator, context):
+        return self.CLIENT_EXECUTE_COMPLETION(merge_chunks(request_iterator), context)
+
+
+def make_payload(size, kind):
+    if kind == 'random':
+        return os.urandom(size)
+    # float32 weights around zero, which compress moderately
+    block = bytes(range(256)) * 16 + bytes(4096)
+    return block * (size // len(block)) + block[:size % len(block)]
+
+
+def peak_rss():
+    """Peak RSS (MB) of this process"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def serve(queue, stop):
+    """Serve EchoServicer until stop is set, then report the peak RSS of the server process"""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4), options=get_channel_options(server=True))
+    job_api_pb2_grpc.add_JobServiceServicer_to_server(EchoServicer(), server)
+    port = server.add_insecure_port('localhost:0')
+    server.start()
+    queue.put(port)
+    stop.wait()
+    server.stop(0)
+    queue.put(peak_rss())
+
+
+def run_config(config, queue):
+    server_queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(server_queue, stop))
+    server.start()
+    port = server_queue.get()
+
+    connection = ClientConnections('localhost', port, compression=config['compression'],
+                                   compression_threshold=config['compression_threshold'],
+                                   chunk_size=config['chunk_size'])
+    connection.connect_to_server()
+    payload = make_payload(config['size'], config['payload'])
+    # as the executor sends uploads, without copying the payload into a message
+    request = CompleteRequestFields(client_id='1', executor_id='1', event='upload_model',
+                                    status=True, msg=None, meta_result=None, data_result=payload)
+
+    # warm up the connection
+    connection.execute_completion_future(
+        job_api_pb2.CompleteRequest(client_id='1', executor_id='1', data_result=b'0')).result()
+    start_time = time.time()
+    for _ in range(config['repeat']):
+        response = connection.execute_completion_future(request).result()
+        assert int(response.data) == len(payload)
+    duration = time.time() - start_time
+
+    connection.close_sever_connection()
+    stop.set()
+    server_rss = server_queue.get()
+    server.join()
+    queue.put({'throughput': config['size'] * config['repeat'] / MB / duration,
+               'server_rss': server_rss, 'client_rss': peak_rss()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 10, 50, 100, 500], help='payload sizes (MB)')
+    parser.add_argument('--compression', type=str, nargs='+', default=['none', 'gzip'])
+    parser.add_argument('--compression_threshold', type=int, default=MB)
+    parser.add_argument('--chunk_size', type=float, nargs='+', default=[0, 4], help='chunk sizes (MB), 0 for unary')
+    parser.add_argument('--payload', type=str, default='weights', choices=['weights', 'random'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size (MB)':>10} {'compression':>12} {'chunk (MB)':>11} {'MB/s':>10} "
+          f"{'server RSS (MB)':>16} {'client RSS (MB)':>16}")
+    for size in args.sizes:
+        for compression in args.compression:
+            for chunk_size in args.chunk_size:
+                config = {'size': int(size * MB), 'compression': compression,
+                          'compression_threshold': args.compression_threshold,
+                          'chunk_size': int(chunk_size * MB), 'payload': args.payload, 'repeat': args.repeat}
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target=run_config, args=(config, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                print(f"{size:>10g} {compression:>12} {chunk_size:>11g} "
+                      f"{result['throughput']:>10.1f} {result['server_rss']:>16.1f} {result['client_rss']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
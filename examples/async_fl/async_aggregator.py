@@ -8,6 +8,7 @@ import torch
 from fedscale.core import commons
 from fedscale.core.aggregation.aggregator import Aggregator
 from fedscale.core.channels import job_api_pb2
+from fedscale.core.internal.event_clock import EventClock
 from fedscale.core.logger.aggragation import *
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -35,41 +36,34 @@ class AsyncAggregator(Aggregator):
         if self.experiment_mode == commons.SIMULATION_MODE:
             # NOTE: We try to remove dummy events as much as possible in simulations,
             # by removing the stragglers/offline clients in overcommitment"""
-            sampledClientsReal = []
-            startTimes = []
-            endTimes = []
-            completed_client_clock = {}
-
-            start_time = self.global_virtual_clock
+            sampled_ids = np.asarray(sampled_clients, dtype=np.int64)
             constant_checkin_period = self.args.arrival_interval
-            # 1. remove dummy clients that are not available to the end of training
-            for client_to_run in sampled_clients:
-                client_cfg = self.client_conf.get(client_to_run, self.args)
-                exe_cost = self.client_manager.getCompletionTime(client_to_run,
-                                                                 batch_size=client_cfg.batch_size,
-                                                                 upload_step=client_cfg.local_steps,
-                                                                 upload_size=self.model_update_size,
-                                                                 download_size=self.model_update_size)
-
-                roundDuration = exe_cost['computation'] + \
-                    exe_cost['communication']
-                # if the client is not active by the time of collection, we consider it is lost in this round
-                start_time += constant_checkin_period
-                if self.client_manager.isClientActive(client_to_run, roundDuration + start_time):
-                    sampledClientsReal.append(client_to_run)
-                    completed_client_clock[client_to_run] = exe_cost
-                    startTimes.append(start_time)
-                    self.client_start_time[client_to_run] = start_time
-                    self.client_round_duration[client_to_run] = roundDuration
-                    endTimes.append(roundDuration + start_time)
-
-            num_clients_to_collect = min(
-                num_clients_to_collect, len(sampledClientsReal))
+            start_times = self.global_virtual_clock + constant_checkin_period * np.arange(1, len(sampled_ids) + 1)
+            start_time = start_times[-1].item() if len(start_times) > 0 else self.global_virtual_clock
+
+            batch_size, local_steps = self.get_client_batch_conf(sampled_clients)
+            computation, communication = self.client_manager.get_completion_time_bulk(
+                sampled_ids, batch_size=batch_size, upload_step=local_steps,
+                upload_size=self.model_update_size * self.upload_ratio, download_size=self.model_update_size)
+            durations = computation + communication
+
+            # 1. remove dummy clients that go offline before the end of training
+            _, online_until = self.client_manager.is_clients_active(sampled_ids, start_times)
+            event_clock = EventClock(self.global_virtual_clock)
+            event_clock.schedule(sampled_ids, start_times, durations, online_until)
+
             # 2. sort & execute clients based on completion time
-            sortedWorkersByCompletion = sorted(
-                range(len(endTimes)), key=lambda k: endTimes[k])
-            top_k_index = sortedWorkersByCompletion[:num_clients_to_collect]
-            clients_to_run = [sampledClientsReal[k] for k in top_k_index]
+            clients_to_run, _, _, _ = event_clock.collect(min(num_clients_to_collect, len(sampled_ids)))
+
+            completed_client_clock = {}
+            index = {client_id: i for i, client_id in enumerate(sampled_ids.tolist())}
+            for client_to_run in clients_to_run:
+                i = index[client_to_run]
+                completed_client_clock[client_to_run] = {'computation': computation[i].item(),
+                                                         'communication': communication[i].item()}
+                self.client_start_time[client_to_run] = start_times[i].item()
+                self.client_round_duration[client_to_run] = durations[i].item()
+
             return (clients_to_run,
                     start_time,
                     completed_client_clock)  # dict : string the speed for each client
@@ -302,10 +296,10 @@ class AsyncAggregator(Aggregator):
                 client_id, current_event, meta, data = self.sever_events_queue.popleft()
 
                 if current_event == commons.UPLOAD_MODEL:
-                    self.client_completion_handler(
-                        self.deserialize_response(data))
+                    results = self.deserialize_upload(data)
+                    self.client_completion_handler(results)
                     if len(self.stats_util_accumulator) == self.async_buffer_size:
-                        clientID = self.deserialize_response(data)['clientId']
+                        clientID = results['clientId']
                         self.round_stamp.append(
                             self.client_round_duration[clientID] + self.client_start_time[clientID])
                         self.round_completion_handler()
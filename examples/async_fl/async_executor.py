@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import pickle
 
-import fedscale.core.channels.job_api_pb2 as job_api_pb2
 from fedscale.core.execution.executor import Executor
 from fedscale.core.execution.rlclient import RLClient
 from fedscale.core.logger.execution import *
@@ -91,19 +90,13 @@ class AsyncExecutor(Executor):
                     client_id, train_res = self.Train(train_config)
 
                     # Upload model updates
-                    future_call = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION.future(
-                        job_api_pb2.CompleteRequest(client_id=str(client_id), executor_id=self.executor_id,
-                                                    event=commons.UPLOAD_MODEL, status=True, msg=None,
-                                                    meta_result=None, data_result=self.serialize_response(train_res)
-                                                    ))
-                    future_call.add_done_callback(lambda _response: self.dispatch_worker_events(_response.result()))
+                    self.upload_results(client_id, commons.UPLOAD_MODEL, train_res)
 
                 elif current_event == commons.MODEL_TEST:
                     self.Test(self.deserialize_response(request.meta))
 
                 elif current_event == commons.UPDATE_MODEL:
-                    broadcast_config = self.deserialize_response(request.data)
-                    self.UpdateModel(broadcast_config)
+                    self.UpdateModel(self.deserialize_models(request.data))
                     time.sleep(5)
 
                 elif current_event == commons.SHUT_DOWN:
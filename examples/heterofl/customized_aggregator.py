@@ -29,7 +29,7 @@ class Customized_Aggregator(Aggregator):
 
             exe_cost = self.client_manager.getCompletionTime(client_to_run,
                                     batch_size=client_cfg.batch_size, upload_step=client_cfg.local_steps,
-                                    upload_size=self.model_update_size, download_size=self.model_update_size)
+                                    upload_size=self.model_update_size * self.upload_ratio, download_size=self.model_update_size)
 
             roundDuration = exe_cost['computation'] + exe_cost['communication']
             # if the client is not active by the time of collection, we consider it is lost in this round
@@ -3,6 +3,7 @@
 from collections import defaultdict
 from fedscale.core.model_manager import Model_Manager
 from concurrent import futures
+import heapq
 
 import grpc
 import csv
@@ -11,10 +12,17 @@ from torch.utils.tensorboard import SummaryWriter
 import fedscale.core.channels.job_api_pb2_grpc as job_api_pb2_grpc
 from fedscale.core import commons
 from fedscale.core.channels import job_api_pb2
+from fedscale.core.channels.channel_context import (BatchResponses, get_channel_options, get_compression,
+                                                    get_payload_size, merge_chunks)
+from fedscale.core.channels.rpc_stats import RpcStats
+from fedscale.core.channels.shared_memory import ModelPublisher, SharedMemoryHandle, SharedMemoryReader
 from fedscale.core.logger.aggragation import *
+from fedscale.core.internal.client_clock import ClientClock
+from fedscale.core.internal.event_clock import EventClock
 from fedscale.core.resource_manager import ResourceManager
-
-MAX_MESSAGE_LENGTH = 1*1024*1024*1024  # 1GB
+from fedscale.core.storage.profile_store import DeviceProfileStore, load_device_profile_store
+from fedscale.dataloaders.divide_data import get_client_executor
+from fedscale.utils.compressor.codec import EncodedTensor, decode_tensor, load_compressor
 
 class Aggregator(job_api_pb2_grpc.JobServiceServicer):
     """This centralized aggregator collects training/testing feedbacks from executors
@@ -45,6 +53,18 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         self.connection_timeout = self.args.connection_timeout
         self.executors = None
         self.grpc_server = None
+        self.model_publisher = None
+        self.upload_reader = None
+        self.rpc_stats = None
+        # global models are serialized once per round, off the RPC threads
+        self.serialization_pool = futures.ThreadPoolExecutor(max_workers=1)
+        # round of the serialized global models, and their futures keyed by the ids of the models sent
+        self.serialized_round = None
+        self.serialized_models = {}
+        # executor id -> ids of the models it is sent in this round, None for all
+        self.executor_model_ids = {}
+        # responses to the recent batches of reports of each executor
+        self.batch_responses = BatchResponses()
 
         # ======== Event Queue =======
         self.individual_client_events = {}    # Unicast
@@ -53,6 +73,8 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
 
         # ======== runtime information ========
         self.num_of_clients = 0
+        self.client_profiles = {}
+        self.client_profile_arrays = None
 
         # NOTE: sampled_participants = sampled_executors in deployment,
         # because every participant is an executor. However, in simulation mode,
@@ -104,6 +126,12 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         self.train_loss_buffer = []
         self.model_to_test = []
         self.test_received = 0
+        self.training_executors = []
+        # executor id -> clients it runs in this round, None if unknown
+        self.executor_tasks = None
+        # clients upload compressed deltas, which shrinks the simulated upload
+        compressor = load_compressor(args)
+        self.upload_ratio = 1. if compressor is None else compressor.compression_ratio()
 
     def __init__(self, args):
         logging.info(f"Job args {args}")
@@ -145,13 +173,17 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         else:
             self.executors = list(range(self.args.num_participants))
 
-        # initiate a server process
+        # initiate a server process, with a thread per executor by default,
+        # so that pings of idle executors do not queue behind uploads
+        max_workers = self.args.grpc_max_workers
+        if max_workers <= 0:
+            max_workers = max(20, 2 * len(self.executors))
+        self.rpc_stats = RpcStats(max_workers)
+        logging.info(f"Serving RPCs with {max_workers} threads")
+
         self.grpc_server = grpc.server(
-            futures.ThreadPoolExecutor(max_workers=20),
-            options=[
-                ('grpc.max_send_message_length', MAX_MESSAGE_LENGTH),
-                ('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH),
-            ],
+            futures.ThreadPoolExecutor(max_workers=max_workers),
+            options=get_channel_options(self.args.grpc_keepalive_time, self.args.grpc_keepalive_timeout, server=True),
         )
         job_api_pb2_grpc.add_JobServiceServicer_to_server(
             self, self.grpc_server)
@@ -163,9 +195,14 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         self.grpc_server.start()
 
     def init_data_communication(self):
-        """For jumbo traffics (e.g., training results).
+        """For jumbo traffics (e.g., training results). With the shared memory transport,
+        models and training results are exchanged through shared memory segments, and
+        gRPC only carries their handles.
         """
-        pass
+        if self.args.transport == 'shared_memory':
+            logging.info("Initiating shared memory data plane ...")
+            self.model_publisher = ModelPublisher(prefix=f'fs_model_{os.getpid()}')
+            self.upload_reader = SharedMemoryReader()
 
     def init_model(self):
         """Load the model architecture
@@ -229,9 +266,13 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             device_cap_file_path (string): File path for the client capacity
 
         Returns:
-            dictionary: Return the client profiles/traces
+            dictionary: Return the client profiles/traces, or a DeviceProfileStore
+            if args.device_profile_store is set
 
         """
+        if self.args.device_profile_store is not None:
+            return load_device_profile_store(self.args)
+
         global_client_profile = {}
         cap = {}
         if os.path.exists(device_cap_file_path):
@@ -252,6 +293,39 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
                 global_client_profile[clientId]['macs'] = cap[int(clientId)-1]
         return global_client_profile
 
+    def get_client_profiles_bulk(self, mapped_ids):
+        """System profiles of many clients as arrays
+
+        Args:
+            mapped_ids (np.ndarray of int): Client ids in the profiles
+
+        Returns:
+            dictionary: Return 'computation', 'communication' and 'macs' arrays, with the
+            default profile for clients without a profile
+
+        """
+        default_profile = {'computation': 1.0, 'communication': 1.0, 'macs': 1000000000.0}
+        if isinstance(self.client_profiles, DeviceProfileStore):
+            return self.client_profiles.get_profiles(mapped_ids, default_profile)
+
+        if self.client_profile_arrays is None:
+            # id-indexed columns, where clients without a profile hold the default profile
+            profile_ids = np.array([int(client_id) for client_id in self.client_profiles], dtype=np.int64)
+            num_slots = int(profile_ids.max()) + 1 if len(profile_ids) > 0 else 0
+            self.client_profile_arrays = {}
+            for key, default in default_profile.items():
+                column = np.full(num_slots, default, dtype=np.float64)
+                column[profile_ids] = [float(profile.get(key, default)) for profile in self.client_profiles.values()]
+                self.client_profile_arrays[key] = column
+
+        mapped_ids = np.asarray(mapped_ids, dtype=np.int64)
+        profiles = {}
+        for key, column in self.client_profile_arrays.items():
+            in_range = (mapped_ids >= 0) & (mapped_ids < len(column))
+            profiles[key] = np.full(len(mapped_ids), default_profile[key], dtype=np.float64)
+            profiles[key][in_range] = column[mapped_ids[in_range]]
+        return profiles
+
     def client_register_handler(self, executorId, info):
         """Triggered once receive new executor registration.
         
@@ -260,25 +334,33 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             info (dictionary): Executor information
 
         """
-        logging.info(f"Loading {len(info['size'])} client traces ...")
-        for _size in info['size']:
-            # since the worker rankId starts from 1, we also configure the initial dataId as 1
-            mapped_id = (self.num_of_clients+1) % len(
-                self.client_profiles) if len(self.client_profiles) > 0 else 1
-            systemProfile = self.client_profiles.get(
-                mapped_id, {'computation': 1.0, 'communication': 1.0, 'macs': 1000000000.0})
+        sizes = np.asarray(info['size'], dtype=np.int64)
+        logging.info(f"Loading {len(sizes)} client traces ...")
 
-            clientId = (
-                self.num_of_clients+1) if self.experiment_mode == commons.SIMULATION_MODE else executorId
-            self.client_manager.register_client(
-                executorId, clientId, size=_size, speed=systemProfile)
-
-            # need to register different duration for different rounds
-            # So oort is invalidated? So we need to use random method instead
-            self.client_manager.registerDuration(clientId, batch_size=self.args.batch_size,
-                                                 upload_step=self.args.local_steps, upload_size=self.model_manager.get_model_update_size_all(), download_size=self.model_manager.get_model_update_size_all())
-            self.num_of_clients += 1
+        # since the worker rankId starts from 1, we also configure the initial dataId as 1
+        client_ids = np.arange(self.num_of_clients+1, self.num_of_clients+1+len(sizes), dtype=np.int64)
+        mapped_ids = client_ids % len(self.client_profiles) if len(self.client_profiles) > 0 else np.ones_like(client_ids)
+        system_profiles = self.get_client_profiles_bulk(mapped_ids)
 
+        if self.experiment_mode == commons.SIMULATION_MODE:
+            self.client_manager.register_clients(
+                executorId, client_ids, sizes=sizes, speeds=system_profiles)
+            registered_ids = client_ids
+        else:
+            # every executor is a client in deployment
+            for index, _size in enumerate(sizes.tolist()):
+                self.client_manager.register_client(
+                    executorId, executorId, size=_size,
+                    speed={key: value[index].item() for key, value in system_profiles.items()})
+            registered_ids = np.full(len(sizes), int(executorId), dtype=np.int64)
+
+        # need to register different duration for different rounds
+        # So oort is invalidated? So we need to use random method instead
+        update_size = self.model_manager.get_model_update_size_all()
+        self.client_manager.register_durations(registered_ids, batch_size=self.args.batch_size,
+                                               upload_step=self.args.local_steps, upload_size=update_size * self.upload_ratio,
+                                               download_size=update_size)
+        self.num_of_clients += len(sizes)
 
         logging.info("Info of all feasible clients {}".format(
             self.client_manager.getDataInfo()))
@@ -324,57 +406,69 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
 
         Returns:
             tuple: Return the sampled clients and client execution information in the last round.
+            The completion times are an array in ascending order, and the client clock and
+            capacities are mappings backed by arrays (see ClientClock). With args.round_deadline,
+            fewer than num_clients_to_collect clients may be returned.
 
         """
         if self.experiment_mode == commons.SIMULATION_MODE:
             # NOTE: We try to remove dummy events as much as possible in simulations,
             # by removing the stragglers/offline clients in overcommitment"""
-            sampledClientsReal = []
-            completionTimes = []
-            completed_client_clock = {}
-            clients_cap = {}
-
-            # 1. remove dummy clients that are not available to the end of training
-            for client_to_run in sampled_clients:
-                client_cfg = self.client_conf.get(client_to_run, self.args)
-                model_id = 0 # reduce to one model running
-                exe_cost = self.client_manager.getCompletionTime(client_to_run,
-                                                                 batch_size=client_cfg.batch_size, upload_step=client_cfg.local_steps,
-                                                                 upload_size=self.model_manager.get_model_update_size(model_id), download_size=self.model_manager.get_model_update_size(model_id))
-                                                                #  upload_size=self.model_update_size[model_id], download_size=self.model_update_size[model_id])
-
-                cap = self.client_manager.get_capacity(client_to_run)
-                roundDuration = exe_cost['computation'] + \
-                    exe_cost['communication']
-                # if the client is not active by the time of collection, we consider it is lost in this round
-                if self.client_manager.isClientActive(client_to_run, roundDuration + self.global_virtual_clock) or self.args.data_map_file is None:
-                    sampledClientsReal.append(client_to_run)
-                    completionTimes.append(roundDuration)
-                    completed_client_clock[client_to_run] = exe_cost
-                    clients_cap[client_to_run] = cap
-
-            num_clients_to_collect = min(
-                num_clients_to_collect, len(completionTimes))
-            # 2. get the top-k completions to remove stragglers
-            sortedWorkersByCompletion = sorted(
-                range(len(completionTimes)), key=lambda k: completionTimes[k])
-            top_k_index = sortedWorkersByCompletion[:num_clients_to_collect]
-            clients_to_run = [sampledClientsReal[k] for k in top_k_index]
-
-            dummy_clients = [sampledClientsReal[k]
-                             for k in sortedWorkersByCompletion[num_clients_to_collect:]]
-            round_duration = completionTimes[top_k_index[-1]]
-            completionTimes.sort()
+            sampled_ids = np.asarray(sampled_clients, dtype=np.int64)
+            batch_size, local_steps = self.get_client_batch_conf(sampled_clients)
+            model_id = 0 # reduce to one model running
+            update_size = self.model_manager.get_model_update_size(model_id)
+
+            computation, communication = self.client_manager.get_completion_time_bulk(
+                sampled_ids, batch_size=batch_size, upload_step=local_steps,
+                upload_size=update_size * self.upload_ratio, download_size=update_size)
+            durations = computation + communication
+
+            # 1. clients that go offline before finishing their training are dropped
+            online_until = None
+            if self.args.data_map_file is not None:
+                _, online_until = self.client_manager.is_clients_active(sampled_ids, self.global_virtual_clock)
+
+            # 2. replay start/finish/offline events until enough clients complete (or the deadline),
+            # so the remaining stragglers and dropped clients are never dispatched to executors
+            event_clock = EventClock(self.global_virtual_clock)
+            event_clock.schedule(sampled_ids, self.global_virtual_clock, durations, online_until)
+            deadline = self.global_virtual_clock + self.args.round_deadline if self.args.round_deadline > 0 else None
+            clients_to_run, finish_times, dummy_clients, dropped_clients = event_clock.collect(
+                num_clients_to_collect, deadline)
+            if len(dropped_clients) > 0:
+                logging.info(f"{len(dropped_clients)} sampled clients go offline before completion")
+
+            completion_times = finish_times - self.global_virtual_clock
+            # without any finished client, the round lasts until the last client goes offline
+            round_duration = completion_times[-1].item() if len(completion_times) > 0 \
+                else event_clock.now - self.global_virtual_clock
+            if deadline is not None and len(clients_to_run) < num_clients_to_collect:
+                # the missing clients are waited for until the deadline
+                round_duration = max(round_duration, self.args.round_deadline)
+
+            completed_client_clock = ClientClock(
+                sampled_ids, computation, communication,
+                capacity=self.client_manager.get_capacity_bulk(sampled_ids))
 
             return (clients_to_run, dummy_clients,
                     completed_client_clock, round_duration,
-                    completionTimes[:num_clients_to_collect], clients_cap)
+                    completion_times, completed_client_clock.get_capacities())
         else:
             completed_client_clock = {
                 client: {'computation': 1, 'communication': 1} for client in sampled_clients}
             completionTimes = [1 for c in sampled_clients]
+            clients_cap = {client: self.client_manager.get_capacity(client) for client in sampled_clients}
             return (sampled_clients, sampled_clients, completed_client_clock,
-                    1, completionTimes)
+                    1, completionTimes, clients_cap)
+
+    def get_client_batch_conf(self, sampled_clients):
+        """Batch size and local steps of the sampled clients, as scalars if no client overrides them"""
+        if not any(client in self.client_conf for client in sampled_clients):
+            return self.args.batch_size, self.args.local_steps
+        client_cfgs = [self.client_conf.get(client, self.args) for client in sampled_clients]
+        return (np.array([cfg.batch_size for cfg in client_cfgs], dtype=np.float64),
+                np.array([cfg.local_steps for cfg in client_cfgs], dtype=np.float64))
 
     def run(self):
         """Start running the aggregator server by setting up execution 
@@ -388,6 +482,7 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         self.save_last_param()
 
         self.client_profiles = self.load_client_profile(device_info_file_path=self.args.device_conf_file, device_cap_file_path=self.args.device_cap_file)
+        self.client_profile_arrays = None
 
         self.event_monitor()
 
@@ -440,6 +535,35 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         
         self.update_lock.release()
 
+    def partial_completion_handler(self, partial):
+        """Handle the summed updates of several clients of one model (a PartialAggregate),
+        pre-aggregated by an edge aggregator or an executor"""
+        assert self.args.gradient_policy not in ['q-fedavg'], "q-fedavg needs the update of every client"
+
+        for results in partial.clients + partial.skipped:
+            client_id = results['clientId']
+            assert self.mapped_models[client_id] == partial.model_id, \
+                f"client {client_id} is not assigned model {partial.model_id}"
+            self.stats_util_accumulator.append(results['utility'])
+            self.loss_accumulator.append(results['moving_loss'])
+            self.client_manager.register_feedback(client_id, results['utility'],
+                                                  auxi=math.sqrt(results['moving_loss']),
+                                                  time_stamp=self.round,
+                                                  duration=self.virtual_client_clock[client_id]['computation'] +
+                                                  self.virtual_client_clock[client_id]['communication'])
+            results['cap'] = self.client_manager.get_capacity(client_id)
+
+        self.update_lock.acquire()
+        for p in partial.weight_sums:
+            if isinstance(partial.weight_sums[p], EncodedTensor):
+                # summed deltas compressed by the executor
+                partial.weight_sums[p] = decode_tensor(partial.weight_sums[p])
+            elif isinstance(partial.weight_sums[p], list):
+                partial.weight_sums[p] = np.asarray(partial.weight_sums[p], dtype=np.float32)
+            partial.weight_sums[p] = torch.from_numpy(np.asarray(partial.weight_sums[p])).to(device=self.device)
+        self.model_manager.partial_aggregation(partial, partial.model_id)
+        self.update_lock.release()
+
     def aggregate_client_weights(self, results, client_id):
         """May aggregate client updates on the fly"""
         """
@@ -449,14 +573,27 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         # Start to take the average of updates, and we do not keep updates to save memory
         # Importance of each update is 1/#_of_participants
 
+        comming_model_id = self.mapped_models[client_id]
+
         # check weight type
+        base_weights = None
         for p in results['update_weight']:
+            if isinstance(results['update_weight'][p], EncodedTensor):
+                # compressed delta against the global model broadcasted in this round
+                delta = torch.from_numpy(decode_tensor(results['update_weight'][p])).to(device=self.device)
+                if results.get('delta', False):
+                    # deltas are aggregated as they are
+                    results['update_weight'][p] = delta
+                    continue
+                if base_weights is None:
+                    base_weights = self.model_manager.models[comming_model_id].torch_model.state_dict()
+                results['update_weight'][p] = base_weights[p] + delta.to(dtype=base_weights[p].dtype)
+                continue
             if isinstance(results['update_weight'][p], list):
                 results['update_weight'][p] = np.asarray(results['update_weight'][p], dtype=np.float32)
             results['update_weight'][p] = torch.from_numpy(
                 results['update_weight'][p]).to(device=self.device)
-        
-        comming_model_id = self.mapped_models[client_id]
+
         results['cap'] = self.client_manager.get_capacity(client_id)
         self.model_manager.weight_aggregation(results, comming_model_id)
             
@@ -482,7 +619,7 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         logging.info(f"check macs after transformation {self.model_manager.get_all_macs()}")
 
     def write_stats(self):
-        # int          int               int       list(int)       list(dict) list(dict)    list(float)
+        # int          int               int       list(int)       np.ndarray list(dict)    list(float)
         num_models, num_converging, num_converged, trained_rounds, utilities, curr_loss, model_average_loss \
             = self.model_manager.check_status()
         trained_clients = [client_id for client_id in self.mapped_models]
@@ -493,7 +630,7 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             model_id = self.mapped_models[client_id]
             model_clients[model_id] += 1
             model_loss[model_id] += curr_loss[model_id][client_id]
-            client_utility[client_id] = utilities[model_id][client_id]
+            client_utility[client_id] = self.model_manager.get_utility(client_id, model_id)
         average_loss = sum(model_average_loss) / float(len(model_average_loss))
         write_aggregated_stats(self.round, num_model=num_models, num_converging=num_converging,
                                num_converged=num_converged, average_loss=average_loss, 
@@ -526,7 +663,7 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             self.running_training_cost += client_training_cost
         
         logging.info(f"round {self.round}, running trainig cost: {self.running_training_cost}")
-        self.model_manager.save_models()
+        self.save_model()
 
         if self.round > 1:
             self.model_manager.update_utility(self.mapped_models, self.current_clients_cap)
@@ -561,6 +698,8 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         # dump round completion information to tensorboard
         if len(self.loss_accumulator):
             self.log_train_result(avg_loss)
+        if self.rpc_stats is not None:
+            self.log_rpc_stats()
         if self.model_manager.is_converging() and self.args.enforce_transform < 0:
             logging.info("FL Transforming")
             self.transform_model()
@@ -577,14 +716,33 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
                 select_num_participants=self.args.num_participants, overcommitment=self.args.overcommitment)
         (clientsToRun, round_stragglers, virtual_client_clock, round_duration, flatten_client_duration, clients_cap) = self.tictak_client_tasks(
             self.sampled_participants, self.args.num_participants)
-        
+
+        # every sampled client may go offline before finishing, then skip past their offline events and re-sample
+        resample_attempts = 0
+        while len(clientsToRun) == 0 and self.args.data_map_file is not None and resample_attempts < 10:
+            logging.warning(f"All {len(self.sampled_participants)} sampled clients go offline before completion, "
+                            f"re-sample participants {round_duration:.1f} s later")
+            self.global_virtual_clock += max(round_duration, 1.)
+            self.sampled_participants = self.select_participants(
+                select_num_participants=self.args.num_participants, overcommitment=self.args.overcommitment)
+            (clientsToRun, round_stragglers, virtual_client_clock, round_duration, flatten_client_duration, clients_cap) = self.tictak_client_tasks(
+                self.sampled_participants, self.args.num_participants)
+            resample_attempts += 1
+
         self.current_clientsToRun = clientsToRun
         self.current_clients_cap = clients_cap
 
         logging.info(f"Selected participants to run: {clientsToRun}")
         # Issue requests to the resource manager; Tasks ordered by the completion time
         self.mapped_models, self.model_in_training = self.model_manager.assign_tasks_hybrid(clientsToRun, clients_cap)
-        self.resource_manager.register_tasks(clientsToRun)
+        executor_tasks = None
+        if self.experiment_mode == commons.SIMULATION_MODE:
+            executor_tasks = self.get_executor_tasks(clientsToRun)
+            self.executor_tasks = executor_tasks
+        else:
+            # every executor is a client in deployment
+            self.executor_tasks = {str(client_id): [client_id] for client_id in clientsToRun}
+        self.resource_manager.register_tasks(clientsToRun, executor_tasks)
         logging.info(f"model(s) {self.model_in_training} will be trained in the next round")
         logging.info(f"model assignment: {self.mapped_models}")
         self.tasks_round = len(clientsToRun)
@@ -593,14 +751,18 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         if self.experiment_mode == commons.SIMULATION_MODE:
             self.sampled_executors = list(
                 self.individual_client_events.keys())
+            # only executors with planned tasks are asked to train
+            self.training_executors = self.sampled_executors if executor_tasks is None else [
+                executor_id for executor_id in self.sampled_executors if len(executor_tasks.get(executor_id, ())) > 0]
         else:
             self.sampled_executors = [str(c_id)
                                       for c_id in self.sampled_participants]
+            self.training_executors = self.sampled_executors
 
         self.save_last_param()
         self.round_stragglers = round_stragglers
         self.virtual_client_clock = virtual_client_clock
-        self.flatten_client_duration = numpy.array(flatten_client_duration)
+        self.flatten_client_duration = numpy.asarray(flatten_client_duration)
         self.round_duration = round_duration
         self.model_manager.reset_model_in_update()
 
@@ -611,7 +773,7 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             self.broadcast_aggregator_events(commons.SHUT_DOWN)
         elif self.round % self.args.eval_interval == 0:# or self.round == 1:
             self.test_result_accumulator = [[] for _ in range(len(self.model_manager.models))]
-            self.model_manager.save_models()
+            self.save_model()
             self.model_to_test = self.model_manager.get_active_model_ids()
             logging.info(f"start to test model(s): {self.model_to_test}")
             self.broadcast_aggregator_events(commons.UPDATE_MODEL)
@@ -620,6 +782,16 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             self.broadcast_aggregator_events(commons.UPDATE_MODEL)
             self.broadcast_aggregator_events(commons.START_ROUND)
 
+    def log_rpc_stats(self):
+        """Log the latency of RPC handlers in the last round, and warn if the thread pool saturated"""
+        stats, max_in_flight = self.rpc_stats.summary()
+        for method, method_stats in stats.items():
+            logging.info(f"{method}: {method_stats['count']} calls, p50 {method_stats['p50']:.1f} ms, "
+                         f"p99 {method_stats['p99']:.1f} ms, max {method_stats['max']:.1f} ms")
+            self.log_writer.add_scalar(f'RPC/{method}_p99 (ms)', method_stats['p99'], self.round)
+        if max_in_flight >= self.rpc_stats.max_workers:
+            logging.warning(f"All {self.rpc_stats.max_workers} RPC threads were busy, consider a larger grpc_max_workers")
+
     def log_train_result(self, avg_loss):
         """Log training result on TensorBoard
         """
@@ -628,8 +800,9 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             'FAR/time_to_train_loss (min)', avg_loss, self.global_virtual_clock/60.)
         self.log_writer.add_scalar(
             'FAR/round_duration (min)', self.round_duration/60., self.round)
-        self.log_writer.add_histogram(
-            'FAR/client_duration (min)', self.flatten_client_duration, self.round)
+        if len(self.flatten_client_duration) > 0:
+            self.log_writer.add_histogram(
+                'FAR/client_duration (min)', self.flatten_client_duration, self.round)
 
     def log_test_result(self):
         """Log testing result on TensorBoard
@@ -654,6 +827,14 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         """
         return pickle.loads(responses)
 
+    def deserialize_upload(self, data):
+        """Deserialize the training result of a client, reading it from the
+        executor's upload slot if the executor sent a shared memory handle"""
+        result = self.deserialize_response(data)
+        if isinstance(result, SharedMemoryHandle):
+            result = self.deserialize_response(self.upload_reader.read_and_release(result))
+        return result
+
     def serialize_response(self, responses):
         """ Serialize the response to send to server upon assigned job completion
 
@@ -667,79 +848,47 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         return pickle.dumps(responses)
 
     def testing_completion_handler(self, results):
-        """Each executor will handle a subset of testing dataset
+        """Each executor will handle a subset of testing dataset, and report the
+        results of all models under test in one completion
         
         Args:
-            results (dictionary): The client test results.
+            results (dictionary): The client test results, keyed by model id.
 
         """
         self.test_received += 1
-        assert results['model_id'] == self.model_to_test[0]
-        model_id = results['model_id']
+        model_ids = results['model_id']
+        assert model_ids == self.model_to_test
         results = results['results']
 
         # track client test results
-        if len(results) > 1:
-            model_macs = self.model_manager.get_all_macs()
-            for result in results:
-                client_id = result['client_id']
-                accuracy = result['acc']
-                if client_id not in self.client_accuracy:
-                    self.client_accuracy[client_id] = .0
-                # logging.info(self.client_profiles.keys())
-                if self.args.disable_hardware:
-                    if accuracy > self.client_accuracy[client_id]:
-                        self.client_accuracy[client_id] = accuracy
-                        self.client_best_model[client_id] = model_id
-                else:
-                    if model_macs[model_id] <= float(self.client_profiles[client_id]['macs'])\
-                        and accuracy > self.client_accuracy[client_id]:
-                        self.client_accuracy[client_id] = accuracy
-                        self.client_best_model[client_id] = model_id
-                    
-
-        # List append is thread-safe
-        self.test_result_accumulator[model_id] += results
+        model_macs = self.model_manager.get_all_macs()
+        for model_id in model_ids:
+            if len(results[model_id]) > 1:
+                for result in results[model_id]:
+                    client_id = result['client_id']
+                    accuracy = result['acc']
+                    if client_id not in self.client_accuracy:
+                        self.client_accuracy[client_id] = .0
+                    if self.args.disable_hardware:
+                        if accuracy > self.client_accuracy[client_id]:
+                            self.client_accuracy[client_id] = accuracy
+                            self.client_best_model[client_id] = model_id
+                    else:
+                        if model_macs[model_id] <= float(self.client_profiles[client_id]['macs'])\
+                            and accuracy > self.client_accuracy[client_id]:
+                            self.client_accuracy[client_id] = accuracy
+                            self.client_best_model[client_id] = model_id
+
+            # List append is thread-safe
+            self.test_result_accumulator[model_id] += results[model_id]
 
         # Have collected all testing results
         if self.test_received == len(self.executors):
             self.test_received = 0
-            accumulator = self.test_result_accumulator[model_id][0]
-            for i in range(1, len(self.test_result_accumulator[model_id])):
-                if self.args.task == "detection":
-                    for key in accumulator:
-                        if key == "boxes":
-                            for j in range(self.imdb.num_classes):
-                                accumulator[key][j] = accumulator[key][j] + \
-                                    self.test_result_accumulator[model_id][i][key][j]
-                        else:
-                            accumulator[key] += self.test_result_accumulator[model_id][i][key]
-                else:
-                    for key in accumulator:
-                        accumulator[key] += self.test_result_accumulator[model_id][i][key]
-            if self.args.task == "detection":
-                self.testing_history['perf'][self.round] = {'round': self.round, 'clock': self.global_virtual_clock,
-                                                            'model_id': model_id,
-                                                            'top_1': round(accumulator['top_1']*100.0/len(self.test_result_accumulator[model_id]), 4),
-                                                            'top_5': round(accumulator['top_5']*100.0/len(self.test_result_accumulator[model_id]), 4),
-                                                            'loss': accumulator['test_loss'],
-                                                            'test_len': accumulator['test_len']
-                                                            }
-            else:
-                self.testing_history['perf'][self.round] = {'round': self.round, 'clock': self.global_virtual_clock,
-                                                            'model_id': model_id,
-                                                            'top_1': round(accumulator['top_1']/accumulator['test_len']*100.0, 4),
-                                                            'top_5': round(accumulator['top_5']/accumulator['test_len']*100.0, 4),
-                                                            'loss': accumulator['test_loss']/accumulator['test_len'],
-                                                            'test_len': accumulator['test_len']
-                                                            }
-
-            logging.info("FL Testing for model {} in round: {}, virtual_clock: {}, top_1: {} %, top_5: {} %, test loss: {:.4f}, test len: {}"
-                         .format(self.model_to_test[0], self.round, self.global_virtual_clock, self.testing_history['perf'][self.round]['top_1'],
-                                 self.testing_history['perf'][self.round]['top_5'], self.testing_history['perf'][self.round]['loss'],
-                                 self.testing_history['perf'][self.round]['test_len']))
-            self.model_accuracy[model_id] = self.testing_history['perf'][self.round]['top_1']
-            self.model_to_test.pop(0)
+            for model_id in model_ids:
+                self.model_testing_completion_handler(model_id)
+            self.model_to_test = []
+
             # Dump the testing result
             with open(os.path.join(logDir, 'testing_perf'), 'wb') as fout:
                 pickle.dump(self.testing_history, fout)
@@ -749,20 +898,57 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
 
             # calculate average accuracy
             self.average_test_accuracy = 0.
-            logging.info(f"debug check average test accuracy: {self.average_test_accuracy}")
-            count_a = 0
             for client_id in self.client_accuracy:
                 self.average_test_accuracy += self.client_accuracy[client_id]
-                count_a += 1
-            logging.info(f"debug check number of client: {count_a}")
-            logging.info(f"debug check average test accuracy sum: {self.average_test_accuracy}")
             if len(self.client_accuracy) > 0:
                 self.average_test_accuracy /= len(self.client_accuracy)
-            logging.info(f"debug check final average: {self.average_test_accuracy}")
+            logging.info(f"Average best-model test accuracy of {len(self.client_accuracy)} clients: {self.average_test_accuracy}")
             self.client_accuracy = {}
 
+            self.broadcast_events_queue.append(commons.START_ROUND)
 
-            self.broadcast_events_queue.append(commons.START_ROUND if len(self.model_to_test) == 0 else commons.MODEL_TEST)
+    def model_testing_completion_handler(self, model_id):
+        """Merge the test results reported by all executors for one model
+
+        Args:
+            model_id (int): The id of the tested model.
+
+        """
+        accumulator = self.test_result_accumulator[model_id][0]
+        for i in range(1, len(self.test_result_accumulator[model_id])):
+            if self.args.task == "detection":
+                for key in accumulator:
+                    if key == "boxes":
+                        for j in range(self.imdb.num_classes):
+                            accumulator[key][j] = accumulator[key][j] + \
+                                self.test_result_accumulator[model_id][i][key][j]
+                    else:
+                        accumulator[key] += self.test_result_accumulator[model_id][i][key]
+            else:
+                for key in accumulator:
+                    accumulator[key] += self.test_result_accumulator[model_id][i][key]
+        if self.args.task == "detection":
+            self.testing_history['perf'][self.round] = {'round': self.round, 'clock': self.global_virtual_clock,
+                                                        'model_id': model_id,
+                                                        'top_1': round(accumulator['top_1']*100.0/len(self.test_result_accumulator[model_id]), 4),
+                                                        'top_5': round(accumulator['top_5']*100.0/len(self.test_result_accumulator[model_id]), 4),
+                                                        'loss': accumulator['test_loss'],
+                                                        'test_len': accumulator['test_len']
+                                                        }
+        else:
+            self.testing_history['perf'][self.round] = {'round': self.round, 'clock': self.global_virtual_clock,
+                                                        'model_id': model_id,
+                                                        'top_1': round(accumulator['top_1']/accumulator['test_len']*100.0, 4),
+                                                        'top_5': round(accumulator['top_5']/accumulator['test_len']*100.0, 4),
+                                                        'loss': accumulator['test_loss']/accumulator['test_len'],
+                                                        'test_len': accumulator['test_len']
+                                                        }
+
+        logging.info("FL Testing for model {} in round: {}, virtual_clock: {}, top_1: {} %, top_5: {} %, test loss: {:.4f}, test len: {}"
+                     .format(model_id, self.round, self.global_virtual_clock, self.testing_history['perf'][self.round]['top_1'],
+                             self.testing_history['perf'][self.round]['top_5'], self.testing_history['perf'][self.round]['loss'],
+                             self.testing_history['perf'][self.round]['test_len']))
+        self.model_accuracy[model_id] = self.testing_history['perf'][self.round]['top_1']
 
     def broadcast_aggregator_events(self, event):
         """Issue tasks (events) to aggregator worker processes by adding grpc request event
@@ -788,6 +974,57 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         for client_id in clients:
             self.individual_client_events[client_id].append(event)
 
+    def get_executor_tasks(self, clientsToRun):
+        """Plan the clients each executor runs in this round. With lazy partition, each client
+        is pinned to the executor that holds its data. With executor pre-aggregation, which needs
+        to know the clients of each executor in advance, clients are assigned in the order of
+        completion to the executor with the least planned training cost (MACs x training steps).
+        Otherwise, there is no plan, and executors take the next client from the shared queue
+        once they are done, so that faster executors run more clients.
+
+        Args:
+            clientsToRun (list of int): Clients ordered by the completion time.
+
+        Returns:
+            dictionary: executor id -> clients to run on it, in the order of clientsToRun, or None.
+
+        """
+        executor_tasks = collections.defaultdict(list)
+        if self.args.lazy_partition:
+            for client_id in clientsToRun:
+                executor_rank = get_client_executor(client_id, len(self.executors), self.num_of_clients)
+                executor_tasks[str(executor_rank)].append(client_id)
+            return executor_tasks
+        if not self.args.executor_pre_aggregation:
+            return None
+
+        if self.args.local_training == 'step':
+            client_steps = [self.args.local_steps] * len(clientsToRun)
+        else:
+            client_sizes = self.client_manager.get_client_size_bulk(clientsToRun)
+            client_steps = [max(1, self.args.local_steps * int(size) // self.args.batch_size) for size in client_sizes]
+
+        executor_loads = [(0., executor_id) for executor_id in sorted(self.individual_client_events.keys())]
+        for client_id, steps in zip(clientsToRun, client_steps):
+            load, executor_id = heapq.heappop(executor_loads)
+            executor_tasks[executor_id].append(client_id)
+            cost = self.model_manager.get_model_mac(self.mapped_models[client_id]) * steps
+            heapq.heappush(executor_loads, (load + cost, executor_id))
+        return executor_tasks
+
+    def get_executor_plan(self, executor_id):
+        """Number of clients of each model that executor_id trains in this round,
+        which tells pre-aggregators when the updates of a model are complete
+
+        Returns:
+            dictionary: model id -> number of clients, or None if the plan is unknown.
+        """
+        if self.executor_tasks is None:
+            return None
+        plan = collections.Counter(self.mapped_models[client_id]
+                                   for client_id in self.executor_tasks.get(executor_id, ()))
+        return dict(plan)
+
     def get_client_conf(self, clientId):
         """Training configurations that will be applied on clients,
         developers can further define personalized client config here.
@@ -825,25 +1062,98 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             # model = self.mapped_models[next_clientId]
             model = self.mapped_models[next_clientId] # reduce to one model
             config = self.get_client_conf(next_clientId)
-            train_config = {'client_id': next_clientId, 'task_config': config}
+            train_config = {'client_id': next_clientId, 'task_config': config,
+                            'round': self.round, 'executor_plan': self.get_executor_plan(executorId)}
         return train_config, model
 
     def get_test_config(self, client_id):
-        """FL model testing on clients"""
+        """FL model testing on clients, all models under test are evaluated in one task"""
 
-        return {'client_id': client_id}, self.model_to_test[0]
+        return {'client_id': client_id}, list(self.model_to_test)
 
-    def get_global_model(self):
+    def get_global_model(self, model_ids=None):
         """Get global model that would be used by all FL clients (in default FL)
 
+        Args:
+            model_ids (tuple of int, optional): Ids of the models to send, the others are None. All models if None.
+
         Returns:
             PyTorch or TensorFlow module: Based on the executor's machine learning framework, initialize and return the model for training.
 
         """
         models = self.model_manager.get_all_models()
+        if model_ids is not None:
+            models = [model if model_id in model_ids else None for model_id, model in enumerate(models)]
         # logging.info(f"upload model {models[0].state_dict()} to client")
         return models
 
+    def get_executor_model_ids(self, executor_id):
+        """Ids of the models executor_id needs in this round: the models assigned to its
+        clients, and the models under test. None (all models) if its tasks are unknown.
+
+        Returns:
+            tuple of int: Sorted model ids, or None.
+        """
+        if self.executor_tasks is None or self.model_publisher is not None:
+            # one copy of all models in shared memory serves every executor
+            return None
+        model_ids = {self.mapped_models[client_id] for client_id in self.executor_tasks.get(executor_id, ())}
+        model_ids.update(self.model_to_test)
+        return tuple(sorted(model_ids))
+
+    def serialize_global_model(self, model_ids=None):
+        """Serialize the global models, or publish them in shared memory and serialize the handle
+
+        Returns:
+            bytes: UPDATE_MODEL data for the executors that need model_ids.
+        """
+        data = self.serialize_response(self.get_global_model(model_ids))
+        if self.model_publisher is not None:
+            data = self.serialize_response(self.model_publisher.publish(data))
+        return data
+
+    def prepare_global_model(self, executor_ids=None):
+        """Start serializing the global models of this round on the serialization pool,
+        once per distinct set of models that executors need
+
+        Args:
+            executor_ids (list of string, optional): Executors to prepare for, defaults to sampled executors.
+
+        """
+        with self.update_lock:
+            if self.serialized_round != self.round:
+                self.serialized_round = self.round
+                self.serialized_models = {}
+                self.executor_model_ids = {}
+
+            for executor_id in (self.sampled_executors if executor_ids is None else executor_ids):
+                if executor_id in self.executor_model_ids:
+                    continue
+                model_ids = self.get_executor_model_ids(executor_id)
+                self.executor_model_ids[executor_id] = model_ids
+                if model_ids not in self.serialized_models:
+                    self.serialized_models[model_ids] = self.serialization_pool.submit(
+                        self.serialize_global_model, model_ids)
+
+    def get_serialized_global_model(self, executor_id):
+        """Serialized global models that executor_id needs in this round, shared by the
+        executors that need the same models"""
+        self.prepare_global_model([executor_id])
+        with self.update_lock:
+            future = self.serialized_models[self.executor_model_ids[executor_id]]
+        return future.result()
+
+    def republish_global_model(self, executor_id):
+        """Publish the global models that executor_id needs again, as their copy in shared
+        memory was overwritten before it was read, and serve the new copy to the executors
+        fetching the same models later"""
+        self.prepare_global_model([executor_id])
+        with self.update_lock:
+            model_ids = self.executor_model_ids[executor_id]
+            future = self.serialization_pool.submit(self.serialize_global_model, model_ids)
+            self.serialized_models[model_ids] = future
+        return future.result()
+
     def get_shutdown_config(self, client_id):
         """Shutdown config for client, developers can further define personalized client config here.
 
@@ -870,6 +1180,11 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             ServerResponse: Server response to registeration request
 
         """
+        with self.rpc_stats.track('CLIENT_REGISTER'):
+            return self.register_handler(request)
+
+    def register_handler(self, request):
+        """Admit the executor of a CLIENT_REGISTER request"""
 
         # NOTE: client_id = executor_id in deployment,
         # while multiple client_id uses the same executor_id (VMs) in simulations
@@ -897,10 +1212,28 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             ServerResponse: Server response to ping request
 
         """
+        with self.rpc_stats.track('CLIENT_PING'):
+            response = self.ping_handler(request.executor_id, request.client_id)
+            self.set_response_compression(context, response)
+            return response
+
+    def set_response_compression(self, context, response):
+        """Compress responses with large payloads (e.g., UPDATE_MODEL)"""
+        compression = get_compression(self.args.grpc_compression, get_payload_size(response),
+                                      self.args.grpc_compression_threshold)
+        if compression != grpc.Compression.NoCompression:
+            context.set_compression(compression)
+
+    def ping_handler(self, executor_id, client_id):
+        """Pop the next event of the executor, and build its response
+
+        Returns:
+            ServerResponse: Server response carrying the next event
+        """
         # NOTE: client_id = executor_id in deployment,
         # while multiple client_id may use the same executor_id (VMs) in simulations
-        executor_id, client_id = request.executor_id, request.client_id
         response_data = response_msg = commons.DUMMY_RESPONSE
+        serialized_data = None
 
         if len(self.individual_client_events[executor_id]) == 0:
             # send dummy response
@@ -920,14 +1253,14 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             elif current_event == commons.MODEL_TEST:
                 response_msg, response_data = self.get_test_config(int(executor_id))
             elif current_event == commons.UPDATE_MODEL:
-                response_data = self.get_global_model()
+                serialized_data = self.get_serialized_global_model(executor_id)
             elif current_event == commons.SHUT_DOWN:
                 response_msg = self.get_shutdown_config(int(executor_id))
 
         if current_event != commons.DUMMY_EVENT:
             logging.info(f"Issue EVENT ({current_event}) to EXECUTOR ({executor_id}) and CLIENT {client_id} ")
-        response_msg, response_data = self.serialize_response(
-            response_msg), self.serialize_response(response_data)
+        response_msg = self.serialize_response(response_msg)
+        response_data = self.serialize_response(response_data) if serialized_data is None else serialized_data
         # NOTE: in simulation mode, response data is pickle for faster (de)serialization
         response = job_api_pb2.ServerResponse(event=current_event,
                                           meta=response_msg, data=response_data)
@@ -946,7 +1279,37 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             ServerResponse: Server response to job completion request
 
         """
+        with self.rpc_stats.track('CLIENT_EXECUTE_COMPLETION'):
+            response = self.execute_completion_handler(request)
+            self.set_response_compression(context, response)
+            return response
+
+    def CLIENT_EXECUTE_COMPLETION_STREAM(self, request_iterator, context):
+        """FL clients complete the execution task, with the result streamed in chunks.
 
+        Args:
+            request_iterator (iterator of CompleteRequest): Chunks of the complete request from executor.
+
+        Returns:
+            ServerResponse: Server response to job completion request
+
+        """
+        return self.CLIENT_EXECUTE_COMPLETION(merge_chunks(request_iterator), context)
+
+    def execute_completion_handler(self, request):
+        """Queue the result of a CLIENT_EXECUTE_COMPLETION request, and respond with the next event"""
+        if request.event == commons.BATCH_REPORT:
+            return self.batch_completion_handler(request)
+        if request.event == commons.UPDATE_MODEL:
+            # the executor failed to read the models published in shared memory
+            return job_api_pb2.ServerResponse(event=commons.UPDATE_MODEL,
+                                              meta=self.serialize_response(commons.DUMMY_RESPONSE),
+                                              data=self.republish_global_model(request.executor_id))
+        self.completion_report_handler(request)
+        return self.ping_handler(request.executor_id, request.client_id)
+
+    def completion_report_handler(self, request):
+        """Queue the result of a completion report"""
         executor_id, client_id, event = request.executor_id, request.client_id, request.event
         execution_status, execution_msg = request.status, request.msg
         meta_result, data_result = request.meta_result, request.data_result
@@ -962,12 +1325,55 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
                 self.individual_client_events[executor_id].append(
                         commons.CLIENT_TRAIN)
 
-        elif event in (commons.MODEL_TEST, commons.UPLOAD_MODEL):
+        elif event in (commons.MODEL_TEST, commons.UPLOAD_MODEL, commons.UPLOAD_PARTIAL):
             self.add_event_handler(
                 executor_id, client_id, event, meta_result, data_result)
         else:
             logging.error(f"Received undefined event {event} from client {client_id}")
-        return self.CLIENT_PING(request, context)
+
+    def batch_completion_handler(self, request):
+        """Handle the completion reports that an executor batches into one request (see
+        --control_batch_size), and respond with up to max_events of its pending events.
+        Each batch carries a per-executor sequence number, and a retransmitted batch gets
+        the response of the original without its reports being queued twice. Batches
+        sent concurrently by an executor may arrive out of order.
+
+        Returns:
+            ServerResponse: BATCH_EVENT response carrying the pending events
+        """
+        executor_id, seq = request.executor_id, request.batch_seq
+        is_new, response = self.batch_responses.claim(executor_id, seq)
+        if not is_new:
+            logging.warning(f"Executor {executor_id} retransmits batch {seq}")
+            if response is not None:
+                return response
+            return job_api_pb2.ServerResponse(event=commons.DUMMY_EVENT,
+                                              meta=self.serialize_response(commons.DUMMY_RESPONSE),
+                                              data=self.serialize_response(commons.DUMMY_RESPONSE))
+
+        try:
+            for report in request.reports:
+                self.completion_report_handler(report)
+
+            events = []
+            pending_events = self.individual_client_events[executor_id]
+            while len(events) < request.max_events and len(pending_events) > 0:
+                response = self.ping_handler(executor_id, request.client_id)
+                if response.event == commons.DUMMY_EVENT:
+                    break
+                events.append(response)
+                if response.event == commons.CLIENT_TRAIN and commons.CLIENT_TRAIN not in pending_events \
+                        and self.resource_manager.has_next_task(executor_id):
+                    # prefetch the next task, instead of waiting for the report of this one
+                    pending_events.append(commons.CLIENT_TRAIN)
+        except Exception:
+            # let the retransmission of the batch be handled again
+            self.batch_responses.release(executor_id, seq)
+            raise
+
+        response = job_api_pb2.ServerResponse(event=commons.BATCH_EVENT, events=events)
+        self.batch_responses.complete(executor_id, seq, response)
+        return response
 
     def event_monitor(self):
         """Activate event handler according to the received new message
@@ -979,11 +1385,20 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
             if len(self.broadcast_events_queue) > 0:
                 current_event = self.broadcast_events_queue.popleft()
 
-                if current_event in (commons.UPDATE_MODEL, commons.MODEL_TEST):
+                if current_event == commons.UPDATE_MODEL:
+                    self.prepare_global_model()
+                    self.dispatch_client_events(current_event)
+
+                elif current_event == commons.MODEL_TEST:
                     self.dispatch_client_events(current_event)
 
                 elif current_event == commons.START_ROUND:
-                    self.dispatch_client_events(commons.CLIENT_TRAIN)
+                    if self.tasks_round == 0:
+                        # no upload will arrive to complete the round
+                        logging.warning(f"No sampled client completes round {self.round}, complete it right away")
+                        self.round_completion_handler()
+                    else:
+                        self.dispatch_client_events(commons.CLIENT_TRAIN, self.training_executors)
 
                 elif current_event == commons.SHUT_DOWN:
                     self.dispatch_client_events(commons.SHUT_DOWN)
@@ -995,7 +1410,12 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
 
                 if current_event == commons.UPLOAD_MODEL:
                     self.client_completion_handler(
-                        self.deserialize_response(data), int(client_id))
+                        self.deserialize_upload(data), int(client_id))
+                    if len(self.stats_util_accumulator) == self.tasks_round:
+                        self.round_completion_handler()
+
+                elif current_event == commons.UPLOAD_PARTIAL:
+                    self.partial_completion_handler(self.deserialize_upload(data))
                     if len(self.stats_util_accumulator) == self.tasks_round:
                         self.round_completion_handler()
 
@@ -1015,6 +1435,9 @@ class Aggregator(job_api_pb2_grpc.JobServiceServicer):
         """
         logging.info(f"Terminating the aggregator ...")
         time.sleep(5)
+        if self.model_publisher is not None:
+            self.model_publisher.close()
+            self.upload_reader.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+from concurrent import futures
+
+import grpc
+
+import fedscale.core.channels.job_api_pb2_grpc as job_api_pb2_grpc
+from fedscale.core import commons
+from fedscale.core.aggregation.partial_aggregate import PartialAggregate, can_pre_aggregate
+from fedscale.core.channels import job_api_pb2
+from fedscale.core.channels.channel_context import (BatchResponses, ClientConnections, CompleteRequestFields,
+                                                    get_channel_options, merge_chunks)
+from fedscale.core.logger.execution import *
+
+
+class EdgeAggregator(job_api_pb2_grpc.JobServiceServicer):
+    """Intermediate aggregator between a group of executors and the (root) aggregator.
+
+    Executors connect to the edge aggregator as if it were the aggregator (--ps_ip and
+    --ps_port of the executors point to the edge), and it relays their control messages
+    to the root. Client updates are summed per model into a PartialAggregate instead,
+    and one partial aggregate per model is forwarded to the root once all the clients
+    that the edge's executors train on that model in this round have uploaded. The
+    number of clients comes from the executor plan in the training config of each
+    executor (Aggregator.get_executor_plan), which is only planned with --executor_pre_aggregation
+    or --lazy_partition. Updates that cannot be summed (e.g.,
+    compressed absolute weights) are relayed as they are, and still count towards the
+    clients of their model. The partial aggregates held are forwarded as they are when
+    the plans become unknown, or a new round starts.
+
+    A partial aggregate is forwarded on behalf of the executor whose request completes it,
+    and the events of the aggregator's responses are returned to that executor. It is kept
+    until the aggregator acknowledges it, and a failed forwarding is retried with the next
+    request of any executor.
+
+    Args:
+        args (dictionary): Variable arguments for fedscale runtime config.
+
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.root_communicator = ClientConnections(
+            args.ps_ip, args.ps_port, compression=args.grpc_compression,
+            compression_threshold=args.grpc_compression_threshold, chunk_size=args.grpc_chunk_size,
+            keepalive_time=args.grpc_keepalive_time, keepalive_timeout=args.grpc_keepalive_timeout)
+        self.grpc_server = None
+        self.lock = threading.Lock()
+
+        # executors connected to this edge
+        self.executors = set()
+        # round of the partial aggregates, and whether the executor plans are known
+        self.round = None
+        self.plan_known = True
+        # (round, executor id) whose plan is counted in expected
+        self.seen_plans = set()
+        # model id -> clients expected and received in this round
+        self.expected = collections.Counter()
+        self.received = collections.Counter()
+        self.partials = {}
+        # partial aggregates to forward, kept until the aggregator acknowledges them
+        self.outbox = []
+        # responses to the recent batches of reports of each executor
+        self.batch_responses = BatchResponses()
+
+    def run(self):
+        """Connect to the root aggregator and serve the executors of this edge"""
+        self.root_communicator.connect_to_server()
+
+        max_workers = self.args.grpc_max_workers if self.args.grpc_max_workers > 0 else 20
+        self.grpc_server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=max_workers),
+            options=get_channel_options(self.args.grpc_keepalive_time, self.args.grpc_keepalive_timeout, server=True),
+        )
+        job_api_pb2_grpc.add_JobServiceServicer_to_server(self, self.grpc_server)
+        port = '[::]:{}'.format(self.args.edge_port)
+        logging.info(f'%%%%%%%%%% Opening edge aggregator server using port {port} %%%%%%%%%%')
+        self.grpc_server.add_insecure_port(port)
+        self.grpc_server.start()
+        self.grpc_server.wait_for_termination()
+        self.root_communicator.close_sever_connection()
+
+    def track_response(self, executor_id, response):
+        """Learn the plan of executor_id from the training tasks issued to it, and
+        stop once every executor of this edge is shut down"""
+        if response.event == commons.BATCH_EVENT:
+            for event in response.events:
+                self.track_response(executor_id, event)
+        elif response.event == commons.CLIENT_TRAIN:
+            train_config = pickle.loads(response.meta)
+            with self.lock:
+                self.start_round(train_config.get('round'))
+                plan = train_config.get('executor_plan')
+                if plan is None:
+                    if self.plan_known:
+                        # no more clients can be expected, so forward what is held
+                        self.plan_known = False
+                        self.take_partials()
+                elif (self.round, executor_id) not in self.seen_plans:
+                    self.seen_plans.add((self.round, executor_id))
+                    self.expected.update(plan)
+
+        elif response.event == commons.SHUT_DOWN:
+            with self.lock:
+                self.executors.discard(executor_id)
+                if len(self.executors) == 0:
+                    logging.info("All executors of this edge are shut down")
+                    self.grpc_server.stop(grace=5)
+        return response
+
+    def start_round(self, round):
+        """Reset the per-round state when the first task of a new round is seen"""
+        if round == self.round:
+            return
+        if len(self.partials) > 0:
+            logging.warning(f"Round {self.round} ends with clients of models {list(self.partials.keys())} "
+                            f"still expected, forwarding the updates held")
+            self.take_partials()
+        self.round = round
+        self.plan_known = True
+        self.seen_plans = set()
+        self.expected = collections.Counter()
+        self.received = collections.Counter()
+        self.partials = {}
+
+    def CLIENT_REGISTER(self, request, context):
+        with self.lock:
+            self.executors.add(request.executor_id)
+        logging.info(f"Executor {request.executor_id} registers through this edge")
+        return self.root_communicator.stub.CLIENT_REGISTER(request)
+
+    def take_partials(self, model_ids=None):
+        """Move the partial aggregates of model_ids (all of them by default) to the outbox.
+        Must be called with self.lock held."""
+        for model_id in list(self.partials.keys()) if model_ids is None else model_ids:
+            partial = self.partials.pop(model_id)
+            logging.info(f"Forward the updates of {len(partial)} clients of model {model_id} to the aggregator")
+            self.outbox.append(partial)
+
+    def respond(self, request, response):
+        """Track the response to the request of an executor, and forward the partial aggregates
+        in the outbox on its behalf. Those that fail to be forwarded are put back.
+
+        Returns:
+            ServerResponse: response, or a BATCH_EVENT response with the events of every response.
+        """
+        responses = [self.track_response(request.executor_id, response)]
+        with self.lock:
+            partials, self.outbox = self.outbox, []
+        for index, partial in enumerate(partials):
+            try:
+                response = self.root_communicator.execute_completion_future(CompleteRequestFields(
+                    client_id=request.client_id, executor_id=request.executor_id, event=commons.UPLOAD_PARTIAL,
+                    status=True, msg=None, meta_result=None, data_result=pickle.dumps(partial))).result()
+            except grpc.RpcError as e:
+                logging.warning(f"Failed to forward the partial aggregate of model {partial.model_id} "
+                                f"to the aggregator {e}. Will retry with the next request.")
+                with self.lock:
+                    self.outbox = partials[index:] + self.outbox
+                break
+            responses.append(self.track_response(request.executor_id, response))
+
+        if len(responses) == 1:
+            return responses[0]
+        events = []
+        for response in responses:
+            events.extend(response.events if response.event == commons.BATCH_EVENT else [response])
+        return job_api_pb2.ServerResponse(event=commons.BATCH_EVENT,
+                                          events=[event for event in events if event.event != commons.DUMMY_EVENT])
+
+    def CLIENT_PING(self, request, context):
+        return self.respond(request, self.root_communicator.stub.CLIENT_PING(request))
+
+    def CLIENT_EXECUTE_COMPLETION(self, request, context):
+        if request.event in (commons.UPLOAD_MODEL, commons.UPLOAD_PARTIAL):
+            return self.respond(request, self.upload_handler(request))
+        if request.event == commons.BATCH_REPORT:
+            return self.batch_handler(request)
+        return self.respond(request, self.root_communicator.execute_completion_future(request).result())
+
+    def CLIENT_EXECUTE_COMPLETION_STREAM(self, request_iterator, context):
+        return self.CLIENT_EXECUTE_COMPLETION(merge_chunks(request_iterator), context)
+
+    def pre_aggregate(self, request):
+        """Add the update of a client, or the partial aggregate of an executor (see
+        --executor_pre_aggregation), to the partial aggregate of its model, which is moved
+        to the outbox once all the expected clients of the model are received
+
+        Returns:
+            CompleteRequest or CompleteRequestFields: request itself if it cannot be
+            pre-aggregated and is to be relayed, otherwise None.
+        """
+        results = pickle.loads(request.data_result)
+        if isinstance(results, PartialAggregate):
+            model_id, delta, num_clients = results.model_id, results.delta, len(results)
+        elif isinstance(results, dict) and 'model_id' in results and can_pre_aggregate(results):
+            model_id, delta, num_clients = results['model_id'], results.get('delta', False), 1
+        else:
+            if isinstance(results, dict) and 'model_id' in results:
+                with self.lock:
+                    if self.plan_known:
+                        # the relayed client is not waited for
+                        self.count_received(results['model_id'], 1)
+            return request
+
+        with self.lock:
+            if not self.plan_known:
+                return request
+            if model_id not in self.partials:
+                self.partials[model_id] = PartialAggregate(model_id, delta=delta)
+            if isinstance(results, PartialAggregate):
+                self.partials[model_id].merge(results)
+            else:
+                self.partials[model_id].add(results)
+            self.count_received(model_id, num_clients)
+        return None
+
+    def count_received(self, model_id, num_clients):
+        """Count num_clients received of model_id, moving its partial aggregate to the
+        outbox once all of them are. Must be called with self.lock held."""
+        self.received[model_id] += num_clients
+        if self.received[model_id] >= self.expected[model_id] and model_id in self.partials:
+            self.take_partials([model_id])
+
+    def upload_handler(self, request):
+        """Pre-aggregate an upload. The executor gets the response of the relay,
+        or of a ping on its behalf, to carry its next event."""
+        upload = self.pre_aggregate(request)
+        if upload is None:
+            return self.root_communicator.stub.CLIENT_PING(
+                job_api_pb2.PingRequest(client_id=request.client_id, executor_id=request.executor_id))
+        return self.root_communicator.execute_completion_future(upload).result()
+
+    def batch_handler(self, request):
+        """Pre-aggregate the uploads in a batch of reports (see --control_batch_size), and
+        forward the batch with the other reports and the sequence number of the executor.
+        If the forwarding fails, the retransmission of the batch forwards the same reports,
+        as its uploads must not be pre-aggregated twice."""
+        executor_id, seq = request.executor_id, request.batch_seq
+        is_new, state = self.batch_responses.claim(executor_id, seq)
+        if not is_new:
+            logging.warning(f"Executor {executor_id} retransmits batch {seq}")
+            if state is not None:
+                return state
+            return job_api_pb2.ServerResponse(event=commons.DUMMY_EVENT, meta=pickle.dumps(commons.DUMMY_RESPONSE),
+                                              data=pickle.dumps(commons.DUMMY_RESPONSE))
+
+        forward = state
+        try:
+            if forward is None:
+                reports = []
+                for report in request.reports:
+                    if report.event in (commons.UPLOAD_MODEL, commons.UPLOAD_PARTIAL):
+                        report = self.pre_aggregate(report)
+                    if report is not None:
+                        reports.append(report)
+                forward = job_api_pb2.CompleteRequest(
+                    client_id=request.client_id, executor_id=executor_id, event=commons.BATCH_REPORT,
+                    status=True, msg=None, reports=reports, batch_seq=seq, max_events=request.max_events)
+            response = self.root_communicator.execute_completion_future(forward).result()
+        except Exception:
+            self.batch_responses.release(executor_id, seq, forward)
+            raise
+        # the retransmission also gets the events of the partial aggregates forwarded with the batch
+        response = self.respond(request, response)
+        self.batch_responses.complete(executor_id, seq, response)
+        return response
+
+if __name__ == "__main__":
+    edge_aggregator = EdgeAggregator(args)
+    edge_aggregator.run()
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+from fedscale.utils.compressor.codec import EncodedTensor, decode_tensor
+
+
+def can_pre_aggregate(results):
+    """Whether the update of a client can be summed with others before reaching the aggregator.
+    Compressed absolute weights can only be decoded against the global model on the aggregator."""
+    if results.get('delta', False):
+        return True
+    return not any(isinstance(weight, EncodedTensor) for weight in results['update_weight'].values())
+
+
+class PartialAggregate(object):
+    """Sum of the updates of several clients that trained the same model, with the
+    number of clients summed into each weight, so that the aggregator adds it to its
+    buffers and counts (see SuperModel.partial_weight_aggregation) as if the clients
+    were aggregated one by one. The feedback of each client (loss, utility, gradient
+    norms) is kept as it is.
+
+    Args:
+        model_id (int): Model trained by the clients.
+        delta (bool): Whether the clients uploaded deltas instead of weights.
+
+    """
+
+    def __init__(self, model_id, delta=False):
+        self.model_id = model_id
+        self.delta = delta
+        # param name -> sum of the weights, and the number of clients in it
+        self.weight_sums = {}
+        self.counts = {}
+        # param name -> shape and number of clients whose delta is zero, for params not in weight_sums
+        self.unchanged = {}
+        # training results of the clients without their weights
+        self.clients = []
+        # training results of the clients with a NaN loss, which are not aggregated
+        self.skipped = []
+
+    def __len__(self):
+        return len(self.clients) + len(self.skipped)
+
+    def add(self, results):
+        """Add the training result of a client"""
+        feedback = {key: value for key, value in results.items()
+                    if key not in ('update_weight', 'unchanged_weight')}
+        if math.isnan(results['moving_loss']):
+            self.skipped.append(feedback)
+            return
+
+        for p, weight in results['update_weight'].items():
+            if isinstance(weight, EncodedTensor):
+                weight = decode_tensor(weight)
+            elif isinstance(weight, list):
+                weight = np.asarray(weight, dtype=np.float32)
+
+            if weight.ndim == 0:
+                # scalars (e.g., num_batches_tracked) are not averaged, the last one is kept
+                self.weight_sums[p] = weight.copy()
+                self.counts[p] = 1
+            elif p in self.weight_sums:
+                self.weight_sums[p] += weight
+                self.counts[p] += 1
+            else:
+                self.weight_sums[p] = weight.copy()
+                self.counts[p] = 1 + self.unchanged.pop(p, (None, 0))[1]
+
+        for p, shape in results.get('unchanged_weight', {}).items():
+            self.add_unchanged(p, shape, 1)
+
+        self.clients.append(feedback)
+
+    def add_unchanged(self, p, shape, num):
+        """Count num clients whose delta of p is zero, i.e., that add nothing to its sum"""
+        if p in self.weight_sums:
+            self.counts[p] += num
+        elif p in self.unchanged:
+            self.unchanged[p] = (self.unchanged[p][0], self.unchanged[p][1] + num)
+        else:
+            self.unchanged[p] = (tuple(shape), num)
+
+    def merge(self, other):
+        """Add the clients of another PartialAggregate of the same model"""
+        assert self.model_id == other.model_id and self.delta == other.delta
+        for p, weight_sum in other.weight_sums.items():
+            if isinstance(weight_sum, EncodedTensor):
+                weight_sum = decode_tensor(weight_sum)
+            if p in self.weight_sums and weight_sum.ndim > 0:
+                self.weight_sums[p] += weight_sum
+                self.counts[p] += other.counts[p]
+            else:
+                self.weight_sums[p] = weight_sum
+                self.counts[p] = other.counts[p] + self.unchanged.pop(p, (None, 0))[1]
+        for p, (shape, num) in other.unchanged.items():
+            self.add_unchanged(p, shape, num)
+        self.clients += other.clients
+        self.skipped += other.skipped
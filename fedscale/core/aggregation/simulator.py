@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import importlib
+
+from fedscale.core import commons
+from fedscale.core.aggregation.aggregator import Aggregator
+from fedscale.core.logger.aggragation import *
+from fedscale.dataloaders.divide_data import load_partition_map
+
+
+class LossCurveModel(object):
+    """Synthetic learning curve that stands in for local training in the system simulation.
+
+    Subclass it and override training_loss, test_result or gradient_norms to plug in
+    another curve, e.g., one fitted on the logs of a real run.
+
+    Args:
+        args (dictionary): Variable arguments for fedscale runtime config.
+        seed (int): Seed of the noise.
+        initial_loss (float): Loss of an untrained model.
+        min_loss (float): Loss the first model converges to.
+        decay (float): Power-law decay of the loss over trained rounds.
+        size_exponent (float): How much larger models lower the converged loss, w.r.t. their MACs.
+        noise (float): Standard deviation of the multiplicative client noise.
+
+    """
+
+    def __init__(self, args, seed=1, initial_loss=2.3, min_loss=0.5, decay=0.5, size_exponent=0.1, noise=0.1):
+        self.args = args
+        self.rng = np.random.RandomState(seed)
+        self.initial_loss = initial_loss
+        self.min_loss = min_loss
+        self.decay = decay
+        self.size_exponent = size_exponent
+        self.noise = noise
+        self.base_macs = None
+
+    def expected_loss(self, macs, trained_round):
+        """Loss of a model of macs MACs after trained_round rounds"""
+        if self.base_macs is None:
+            self.base_macs = macs
+        min_loss = self.min_loss * (macs / self.base_macs) ** (-self.size_exponent)
+        return min_loss + (self.initial_loss - min_loss) * (1. + trained_round) ** (-self.decay)
+
+    def training_loss(self, model_id, macs, trained_round, client_id):
+        return self.expected_loss(macs, trained_round) * float(np.exp(self.noise * self.rng.randn()))
+
+    def test_result(self, model_id, macs, trained_round, test_len=10000):
+        """Test result in the format of model_test_module.test_model"""
+        loss = self.expected_loss(macs, trained_round)
+        accuracy = float(np.exp(-loss))
+        return {'top_1': accuracy * test_len, 'top_5': min(1., 5. * accuracy) * test_len,
+                'test_loss': loss * test_len, 'test_len': test_len}
+
+    def gradient_norms(self, model_id, layers):
+        """Relative gradient norm of each candidate layer, which drives layer selection in model_scale"""
+        return {layer[1]: float(value) for layer, value in zip(layers, self.rng.uniform(size=len(layers)))}
+
+
+def load_loss_model(args):
+    """Create the loss curve model named by args.sim_loss_model ("module:Class"), or the default one"""
+    if args.sim_loss_model is None:
+        return LossCurveModel(args)
+    module_name, class_name = args.sim_loss_model.split(':')
+    return getattr(importlib.import_module(module_name), class_name)(args)
+
+
+class SystemSimulator(Aggregator):
+    """Trace-driven, system-only simulation of the aggregator.
+
+    It runs in-process without executors and gRPC. Client sampling, straggler
+    simulation (tictak_client_tasks), model assignment and transformation are the
+    same as in Aggregator, but local training and testing are replaced with a
+    synthetic loss curve, and no model weights are updated or saved. Client
+    completions are processed in order of their virtual finish time, and the same
+    stats CSVs are written, so scheduling policies can be compared cheaply.
+
+    Args:
+        args (dictionary): Variable arguments for fedscale runtime config.
+        loss_model (LossCurveModel, optional): Synthetic loss curve, defaults to args.sim_loss_model.
+
+    """
+
+    def __init__(self, args, loss_model=None):
+        Aggregator.__init__(self, args)
+        self.loss_model = loss_model if loss_model is not None else load_loss_model(args)
+        # (virtual finish time, client id) of the clients running in this round
+        self.client_events = []
+
+    def run(self):
+        """Register clients from the data map and run the event loop, without executors"""
+        self.setup_env()
+        self.executors = [0]
+        self.individual_client_events = {'1': collections.deque()}
+
+        self.init_model()
+        self.client_profiles = self.load_client_profile(device_info_file_path=self.args.device_conf_file,
+                                                        device_cap_file_path=self.args.device_cap_file)
+        self.client_profile_arrays = None
+
+        self.client_register_handler('1', {'size': self.get_client_sizes()})
+        self.model_manager.reset_all_curr_loss()
+        self.round_completion_handler()
+
+        self.event_monitor()
+
+    def get_client_sizes(self):
+        """Number of samples of each client, from the data map or uniform without it"""
+        if self.args.data_map_file is not None:
+            _, offsets, _ = load_partition_map(self.args.data_map_file, self.args.partition_cache_dir)
+            return np.diff(offsets)
+        num_clients = self.args.num_participants
+        return np.full(num_clients, self.args.batch_size * self.args.local_steps, dtype=np.int64)
+
+    def save_last_param(self):
+        pass
+
+    def round_weight_handler(self):
+        pass
+
+    def save_model(self):
+        pass
+
+    def start_round(self):
+        """Schedule the completion of every client in this round on the virtual clock"""
+        self.client_events = []
+        for client_id in self.current_clientsToRun:
+            clock = self.virtual_client_clock[client_id]
+            heapq.heappush(self.client_events, (self.global_virtual_clock + clock['computation'] + clock['communication'],
+                                                client_id))
+        if self.tasks_round == 0:
+            self.round_completion_handler()
+
+    def simulate_client(self, client_id):
+        """Synthetic training result of client_id, in the format of the executor's"""
+        model_id = self.mapped_models[client_id]
+        super_model = self.model_manager.models[model_id]
+        loss = self.loss_model.training_loss(model_id, super_model.macs, super_model.trained_round, client_id)
+        trained_size = self.args.batch_size * self.args.local_steps
+        return {'clientId': client_id, 'update_weight': {}, 'moving_loss': loss,
+                'trained_size': trained_size, 'success': True, 'utility': loss * trained_size,
+                'grad_dict': self.loss_model.gradient_norms(model_id, self.model_manager.get_candidate_layers(model_id))}
+
+    def simulate_testing(self):
+        """Synthetic test results of the models under test, as reported by one executor"""
+        results = {}
+        for model_id in self.model_to_test:
+            super_model = self.model_manager.models[model_id]
+            results[model_id] = [self.loss_model.test_result(model_id, super_model.macs, super_model.trained_round)]
+        self.testing_completion_handler({'executorId': '1', 'results': results, 'model_id': list(self.model_to_test)})
+
+    def event_monitor(self):
+        """Discrete-event loop over the virtual clock"""
+        logging.info("Start system simulation ...")
+        start_time = time.time()
+
+        while True:
+            if len(self.broadcast_events_queue) > 0:
+                current_event = self.broadcast_events_queue.popleft()
+
+                if current_event == commons.START_ROUND:
+                    self.start_round()
+                elif current_event == commons.MODEL_TEST:
+                    self.simulate_testing()
+                elif current_event == commons.SHUT_DOWN:
+                    break
+                # UPDATE_MODEL needs no action, as no executor keeps a copy of the models
+
+            elif len(self.client_events) > 0:
+                _, client_id = heapq.heappop(self.client_events)
+                self.client_completion_handler(self.simulate_client(client_id), client_id)
+                if len(self.stats_util_accumulator) == self.tasks_round:
+                    self.round_completion_handler()
+
+            else:
+                logging.error("System simulation runs out of events")
+                break
+
+        logging.info(f"Simulated {self.round} rounds ({round(self.global_virtual_clock)} s of virtual time) "
+                     f"in {round(time.time() - start_time, 2)} s")
+
+
+if __name__ == "__main__":
+    simulator = SystemSimulator(args)
+    simulator.run()
@@ -1,33 +1,232 @@
+import collections
 import logging
+import threading
 
 import grpc
 
+import fedscale.core.channels.job_api_pb2 as job_api_pb2
 import fedscale.core.channels.job_api_pb2_grpc as job_api_pb2_grpc
 
 MAX_MESSAGE_LENGTH = 1*1024*1024*1024  # 1GB
+# batched reports are flushed before their payloads exceed this size
+MAX_BATCH_BYTES = 256*1024*1024
+
+COMPRESSION = {'none': grpc.Compression.NoCompression,
+               'gzip': grpc.Compression.Gzip,
+               'deflate': grpc.Compression.Deflate}
+
+
+def get_channel_options(keepalive_time=0, keepalive_timeout=20, server=False):
+    """gRPC options of the aggregator server and executor channels
+
+    Args:
+        keepalive_time (float): Seconds between keepalive pings on idle connections, disabled if <= 0.
+        keepalive_timeout (float): Seconds to wait for a keepalive ack before closing the connection.
+        server (bool): Whether the options are for the server, which must accept the pings.
+
+    Returns:
+        list of tuple: gRPC options.
+    """
+    options = [
+        ('grpc.max_send_message_length', MAX_MESSAGE_LENGTH),
+        ('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH),
+    ]
+    if keepalive_time > 0:
+        options += [
+            ('grpc.keepalive_time_ms', int(keepalive_time * 1000)),
+            ('grpc.keepalive_timeout_ms', int(keepalive_timeout * 1000)),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+        ]
+        if server:
+            options += [('grpc.http2.min_ping_interval_without_data_ms', int(keepalive_time * 1000))]
+    return options
+
+
+def get_compression(algorithm, payload_size, threshold):
+    """Compression of a message with payload_size bytes, as only large payloads are worth compressing"""
+    if algorithm == 'none' or payload_size < threshold:
+        return grpc.Compression.NoCompression
+    return COMPRESSION[algorithm]
+
+
+# Fields of a CompleteRequest whose data_result may be any bytes-like object, so that a large
+# payload is neither copied into a message before it is chunked, nor after it is reassembled
+CompleteRequestFields = collections.namedtuple(
+    'CompleteRequestFields', ['client_id', 'executor_id', 'event', 'status', 'msg', 'meta_result', 'data_result'])
+
+
+def to_complete_request(request):
+    """CompleteRequest of a CompleteRequest or CompleteRequestFields"""
+    if isinstance(request, CompleteRequestFields):
+        return job_api_pb2.CompleteRequest(
+            client_id=request.client_id, executor_id=request.executor_id, event=request.event,
+            status=request.status, msg=request.msg, meta_result=request.meta_result,
+            data_result=bytes(request.data_result) if request.data_result is not None else None)
+    return request
+
+
+def chunk_request(request, chunk_size):
+    """Split the data_result of a CompleteRequest (or CompleteRequestFields) into chunks. The first
+    chunk carries all the other fields, and the following ones only data_result. Each chunk is
+    copied out of a memoryview of the payload when it is sent, so that at most one chunk is
+    copied at a time (messages only take bytes)."""
+    data = memoryview(request.data_result)
+    yield job_api_pb2.CompleteRequest(
+        client_id=request.client_id, executor_id=request.executor_id, event=request.event,
+        status=request.status, msg=request.msg, meta_result=request.meta_result,
+        data_result=data[:chunk_size].tobytes())
+    for offset in range(chunk_size, len(data), chunk_size):
+        yield job_api_pb2.CompleteRequest(data_result=data[offset:offset + chunk_size].tobytes())
+
+
+def merge_chunks(request_iterator):
+    """Reassemble the CompleteRequest split by chunk_request. Chunks are appended to one
+    bytearray as they arrive, rather than kept and joined, and the request is returned as
+    CompleteRequestFields, as a message would copy the payload once more.
+
+    Returns:
+        CompleteRequestFields: The request, with a bytearray data_result.
+    """
+    request = next(request_iterator)
+    data = bytearray(request.data_result)
+    for chunk in request_iterator:
+        data += chunk.data_result
+    return CompleteRequestFields(
+        client_id=request.client_id, executor_id=request.executor_id, event=request.event,
+        status=request.status, msg=request.msg, meta_result=request.meta_result, data_result=data)
+
+
+def get_payload_size(message):
+    """Size of the payload of a CompleteRequest (or CompleteRequestFields) or ServerResponse,
+    including the payloads of the reports or events that it batches"""
+    if isinstance(message, job_api_pb2.ServerResponse):
+        return len(message.data) + sum(len(event.data) for event in message.events)
+    if isinstance(message, CompleteRequestFields):
+        return len(message.data_result or b'')
+    return len(message.data_result) + sum(len(report.data_result) for report in message.reports)
+
+
+# claim of a batch whose handling is in progress
+_IN_FLIGHT = object()
+
+
+class BatchResponses(object):
+    """Responses to the recent batches of reports of each executor, keyed by their sequence
+    numbers. A retransmitted batch gets the response of the original, waiting for it if
+    the original is still handled, while batches that an executor sends concurrently may
+    arrive out of order. A batch whose handling fails is released to be handled again.
+
+    Args:
+        window (int): Batches older than the newest one by window are forgotten.
+
+    """
+
+    def __init__(self, window=16):
+        self.window = window
+        # executor id -> sequence number -> response, _IN_FLIGHT while the batch is handled
+        self.responses = collections.defaultdict(dict)
+        # executor id -> sequence number -> state left by the failed handling of the batch
+        self.retry_states = collections.defaultdict(dict)
+        self.condition = threading.Condition()
+
+    def claim(self, executor_id, seq):
+        """Claim batch seq of executor_id to handle it, or wait for the response of the
+        original if it is still handled
+
+        Returns:
+            tuple: (True, the state passed to release by a failed handling, if any) if the
+            batch is to be handled, otherwise (False, the response of the original, or None
+            if it is forgotten)
+        """
+        with self.condition:
+            responses = self.responses[executor_id]
+            while responses.get(seq) is _IN_FLIGHT:
+                self.condition.wait()
+            if seq in responses:
+                return False, responses[seq]
+            if seq in self.retry_states[executor_id]:
+                responses[seq] = _IN_FLIGHT
+                return True, self.retry_states[executor_id].pop(seq)
+            if len(responses) > 0 and seq <= max(responses) - self.window:
+                return False, None
+            responses[seq] = _IN_FLIGHT
+            # batches still in flight are kept, as their retransmissions wait for them
+            newest = max(responses)
+            for old_seq in [old_seq for old_seq, response in responses.items()
+                            if old_seq <= newest - self.window and response is not _IN_FLIGHT]:
+                del responses[old_seq]
+            return True, None
+
+    def complete(self, executor_id, seq, response):
+        """Keep the response of batch seq of executor_id for retransmissions"""
+        with self.condition:
+            self.responses[executor_id][seq] = response
+            self.condition.notify_all()
+
+    def release(self, executor_id, seq, state=None):
+        """Release the claim of batch seq of executor_id after its handling fails, so that
+        its retransmission is handled again, starting from state"""
+        with self.condition:
+            self.responses[executor_id].pop(seq, None)
+            if state is not None:
+                self.retry_states[executor_id][seq] = state
+            self.condition.notify_all()
 
 
 class ClientConnections(object):
-    """"Clients build connections to the cloud aggregator."""
+    """"Clients build connections to the cloud aggregator.
+
+    Args:
+        aggregator_address (string): Address of the aggregator.
+        base_port (int): Port of the aggregator.
+        compression (string): 'none', 'gzip' or 'deflate', applied to requests of at least compression_threshold bytes.
+        compression_threshold (int): Smallest payload (bytes) to compress.
+        chunk_size (int): Uploads larger than chunk_size bytes are streamed in chunks, disabled if <= 0.
+        keepalive_time (float): Seconds between keepalive pings, disabled if <= 0.
+        keepalive_timeout (float): Seconds to wait for a keepalive ack.
 
-    def __init__(self, aggregator_address, base_port=18888):
+    """
+
+    def __init__(self, aggregator_address, base_port=18888, compression='none', compression_threshold=1024*1024,
+                 chunk_size=0, keepalive_time=0, keepalive_timeout=20):
         self.base_port = base_port
         self.aggregator_address = aggregator_address
         self.channel = None
         self.stub = None
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.chunk_size = chunk_size
+        self.keepalive_time = keepalive_time
+        self.keepalive_timeout = keepalive_timeout
 
     def connect_to_server(self):
         logging.info('%%%%%%%%%% Opening grpc connection to ' +
                      self.aggregator_address + ' %%%%%%%%%%')
         self.channel = grpc.insecure_channel(
             '{}:{}'.format(self.aggregator_address, self.base_port),
-            options=[
-                ('grpc.max_send_message_length', MAX_MESSAGE_LENGTH),
-                ('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH),
-            ]
+            options=get_channel_options(self.keepalive_time, self.keepalive_timeout)
         )
         self.stub = job_api_pb2_grpc.JobServiceStub(self.channel)
 
+    def execute_completion_future(self, request):
+        """Report a completion with a (possibly large) data_result asynchronously, compressing
+        large payloads, and streaming payloads larger than chunk_size in chunks
+
+        Args:
+            request (CompleteRequest or CompleteRequestFields): The completion. Large payloads are
+                better passed as CompleteRequestFields, which are chunked without a full copy.
+
+        Returns:
+            grpc.Future: future of the ServerResponse.
+        """
+        compression = get_compression(self.compression, get_payload_size(request), self.compression_threshold)
+        # a batch of reports (see --control_batch_size) is not chunked, as only data_result is
+        if 0 < self.chunk_size < len(request.data_result or b''):
+            return self.stub.CLIENT_EXECUTE_COMPLETION_STREAM.future(
+                chunk_request(request, self.chunk_size), compression=compression)
+        return self.stub.CLIENT_EXECUTE_COMPLETION.future(to_complete_request(request), compression=compression)
+
     def close_sever_connection(self):
         logging.info(
             '%%%%%%%%%% Closing grpc connection to the aggregator %%%%%%%%%%')
@@ -15,20 +15,25 @@ class JobServiceStub(object):
             channel: A grpc.Channel.
         """
         self.CLIENT_REGISTER = channel.unary_unary(
-            '/fedscale.JobService/CLIENT_REGISTER',
-            request_serializer=job__api__pb2.RegisterRequest.SerializeToString,
-            response_deserializer=job__api__pb2.ServerResponse.FromString,
-        )
+                '/fedscale.JobService/CLIENT_REGISTER',
+                request_serializer=job__api__pb2.RegisterRequest.SerializeToString,
+                response_deserializer=job__api__pb2.ServerResponse.FromString,
+                )
         self.CLIENT_PING = channel.unary_unary(
-            '/fedscale.JobService/CLIENT_PING',
-            request_serializer=job__api__pb2.PingRequest.SerializeToString,
-            response_deserializer=job__api__pb2.ServerResponse.FromString,
-        )
+                '/fedscale.JobService/CLIENT_PING',
+                request_serializer=job__api__pb2.PingRequest.SerializeToString,
+                response_deserializer=job__api__pb2.ServerResponse.FromString,
+                )
         self.CLIENT_EXECUTE_COMPLETION = channel.unary_unary(
-            '/fedscale.JobService/CLIENT_EXECUTE_COMPLETION',
-            request_serializer=job__api__pb2.CompleteRequest.SerializeToString,
-            response_deserializer=job__api__pb2.ServerResponse.FromString,
-        )
+                '/fedscale.JobService/CLIENT_EXECUTE_COMPLETION',
+                request_serializer=job__api__pb2.CompleteRequest.SerializeToString,
+                response_deserializer=job__api__pb2.ServerResponse.FromString,
+                )
+        self.CLIENT_EXECUTE_COMPLETION_STREAM = channel.stream_unary(
+                '/fedscale.JobService/CLIENT_EXECUTE_COMPLETION_STREAM',
+                request_serializer=job__api__pb2.CompleteRequest.SerializeToString,
+                response_deserializer=job__api__pb2.ServerResponse.FromString,
+                )
 
 
 class JobServiceServicer(object):
@@ -52,82 +57,110 @@ class JobServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def CLIENT_EXECUTE_COMPLETION_STREAM(self, request_iterator, context):
+        """CLIENT_EXECUTE_COMPLETION with data_result split into chunks
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_JobServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
-        'CLIENT_REGISTER': grpc.unary_unary_rpc_method_handler(
-            servicer.CLIENT_REGISTER,
-            request_deserializer=job__api__pb2.RegisterRequest.FromString,
-            response_serializer=job__api__pb2.ServerResponse.SerializeToString,
-        ),
-        'CLIENT_PING': grpc.unary_unary_rpc_method_handler(
-            servicer.CLIENT_PING,
-            request_deserializer=job__api__pb2.PingRequest.FromString,
-            response_serializer=job__api__pb2.ServerResponse.SerializeToString,
-        ),
-        'CLIENT_EXECUTE_COMPLETION': grpc.unary_unary_rpc_method_handler(
-            servicer.CLIENT_EXECUTE_COMPLETION,
-            request_deserializer=job__api__pb2.CompleteRequest.FromString,
-            response_serializer=job__api__pb2.ServerResponse.SerializeToString,
-        ),
+            'CLIENT_REGISTER': grpc.unary_unary_rpc_method_handler(
+                    servicer.CLIENT_REGISTER,
+                    request_deserializer=job__api__pb2.RegisterRequest.FromString,
+                    response_serializer=job__api__pb2.ServerResponse.SerializeToString,
+            ),
+            'CLIENT_PING': grpc.unary_unary_rpc_method_handler(
+                    servicer.CLIENT_PING,
+                    request_deserializer=job__api__pb2.PingRequest.FromString,
+                    response_serializer=job__api__pb2.ServerResponse.SerializeToString,
+            ),
+            'CLIENT_EXECUTE_COMPLETION': grpc.unary_unary_rpc_method_handler(
+                    servicer.CLIENT_EXECUTE_COMPLETION,
+                    request_deserializer=job__api__pb2.CompleteRequest.FromString,
+                    response_serializer=job__api__pb2.ServerResponse.SerializeToString,
+            ),
+            'CLIENT_EXECUTE_COMPLETION_STREAM': grpc.stream_unary_rpc_method_handler(
+                    servicer.CLIENT_EXECUTE_COMPLETION_STREAM,
+                    request_deserializer=job__api__pb2.CompleteRequest.FromString,
+                    response_serializer=job__api__pb2.ServerResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
-        'fedscale.JobService', rpc_method_handlers)
+            'fedscale.JobService', rpc_method_handlers)
     server.add_generic_rpc_handlers((generic_handler,))
 
- # This class is part of an EXPERIMENTAL API.
-
 
+ # This class is part of an EXPERIMENTAL API.
 class JobService(object):
     """Missing associated documentation comment in .proto file."""
 
     @staticmethod
     def CLIENT_REGISTER(request,
-                        target,
-                        options=(),
-                        channel_credentials=None,
-                        call_credentials=None,
-                        insecure=False,
-                        compression=None,
-                        wait_for_ready=None,
-                        timeout=None,
-                        metadata=None):
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
         return grpc.experimental.unary_unary(request, target, '/fedscale.JobService/CLIENT_REGISTER',
-                                             job__api__pb2.RegisterRequest.SerializeToString,
-                                             job__api__pb2.ServerResponse.FromString,
-                                             options, channel_credentials,
-                                             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+            job__api__pb2.RegisterRequest.SerializeToString,
+            job__api__pb2.ServerResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
     @staticmethod
     def CLIENT_PING(request,
-                    target,
-                    options=(),
-                    channel_credentials=None,
-                    call_credentials=None,
-                    insecure=False,
-                    compression=None,
-                    wait_for_ready=None,
-                    timeout=None,
-                    metadata=None):
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
         return grpc.experimental.unary_unary(request, target, '/fedscale.JobService/CLIENT_PING',
-                                             job__api__pb2.PingRequest.SerializeToString,
-                                             job__api__pb2.ServerResponse.FromString,
-                                             options, channel_credentials,
-                                             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+            job__api__pb2.PingRequest.SerializeToString,
+            job__api__pb2.ServerResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
     @staticmethod
     def CLIENT_EXECUTE_COMPLETION(request,
-                                  target,
-                                  options=(),
-                                  channel_credentials=None,
-                                  call_credentials=None,
-                                  insecure=False,
-                                  compression=None,
-                                  wait_for_ready=None,
-                                  timeout=None,
-                                  metadata=None):
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
         return grpc.experimental.unary_unary(request, target, '/fedscale.JobService/CLIENT_EXECUTE_COMPLETION',
-                                             job__api__pb2.CompleteRequest.SerializeToString,
-                                             job__api__pb2.ServerResponse.FromString,
-                                             options, channel_credentials,
-                                             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+            job__api__pb2.CompleteRequest.SerializeToString,
+            job__api__pb2.ServerResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def CLIENT_EXECUTE_COMPLETION_STREAM(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/fedscale.JobService/CLIENT_EXECUTE_COMPLETION_STREAM',
+            job__api__pb2.CompleteRequest.SerializeToString,
+            job__api__pb2.ServerResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class RpcStats(object):
+    """Latency and concurrency of the RPC handlers of the aggregator.
+
+    Handlers run on a thread pool of max_workers threads, so once max_workers RPCs
+    are in flight, new ones queue up in gRPC and their latency grows.
+
+    Args:
+        max_workers (int): Number of threads serving RPCs.
+
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @contextmanager
+    def track(self, method):
+        """Time the handler of one RPC of method"""
+        start_time = time.time()
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.latencies[method].append(time.time() - start_time)
+
+    def summary(self):
+        """Latency percentiles (ms) of each method and the peak concurrency since the last summary
+
+        Returns:
+            tuple: ({method: {'count', 'p50', 'p99', 'max'}}, max RPCs in flight)
+        """
+        with self.lock:
+            latencies, self.latencies = self.latencies, defaultdict(list)
+            max_in_flight, self.max_in_flight = self.max_in_flight, self.in_flight
+
+        stats = {}
+        for method, values in latencies.items():
+            values = np.array(values) * 1000.
+            stats[method] = {'count': len(values), 'p50': float(np.percentile(values, 50)),
+                             'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+        return stats, max_in_flight
@@ -0,0 +1,216 @@
+import collections
+import logging
+import os
+import struct
+import time
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    resource_tracker = shared_memory = None
+
+# header of a model segment: version, payload size
+MODEL_HEADER = struct.Struct('QQ')
+# header of an upload slot: state (SLOT_FREE or SLOT_FULL), payload size
+SLOT_HEADER = struct.Struct('QQ')
+SLOT_FREE, SLOT_FULL = 0, 1
+
+# Sent over gRPC in place of the payload, which lives in segment name at [offset, offset + size)
+SharedMemoryHandle = collections.namedtuple('SharedMemoryHandle', ['name', 'version', 'offset', 'size'])
+
+
+def check_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError("Shared memory transport requires Python >= 3.8 (multiprocessing.shared_memory)")
+
+
+def _create_segment(name, size):
+    check_shared_memory()
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # left behind by a crashed run with the same pid
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+def _attach_segment(name):
+    """Attach to a segment owned by another process. The resource tracker would otherwise
+    unlink the segment when this process exits, so it is unregistered here."""
+    check_shared_memory()
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    return segment
+
+
+class ModelPublisher(object):
+    """Aggregator side of the shared memory transport: publishes the serialized global
+    models for co-located executors.
+
+    Two segments are used in turn, so that executors still copying the previous version
+    are not overwritten by the next one. A segment is re-created when the models outgrow it.
+    The version in the header of a segment is cleared while its payload is written, so
+    that readers can tell a copy that overlaps an overwrite (see SharedMemoryReader.read).
+
+    Args:
+        prefix (string): Prefix of the segment names, unique per job.
+
+    """
+
+    def __init__(self, prefix=None):
+        self.prefix = prefix or f'fs_model_{os.getpid()}'
+        self.segments = [None, None]
+        self.generations = [0, 0]
+        self.version = 0
+
+    def publish(self, payload):
+        """Write payload into the next segment
+
+        Returns:
+            SharedMemoryHandle: handle for the executors to read the payload.
+        """
+        self.version += 1
+        index = self.version % 2
+        segment = self.segments[index]
+        if segment is None or segment.size < MODEL_HEADER.size + len(payload):
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+            self.generations[index] += 1
+            # leave room for the models to grow, e.g., after model transformation
+            segment = _create_segment(f'{self.prefix}_{index}_{self.generations[index]}',
+                                      MODEL_HEADER.size + int(len(payload) * 1.25) + 1)
+            self.segments[index] = segment
+
+        # versions start at 1, so 0 marks a segment being written
+        MODEL_HEADER.pack_into(segment.buf, 0, 0, 0)
+        segment.buf[MODEL_HEADER.size:MODEL_HEADER.size + len(payload)] = payload
+        MODEL_HEADER.pack_into(segment.buf, 0, self.version, len(payload))
+        return SharedMemoryHandle(segment.name, self.version, MODEL_HEADER.size, len(payload))
+
+    def close(self):
+        for segment in self.segments:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self.segments = [None, None]
+
+
+class UploadSlots(object):
+    """Executor side of the shared memory transport: a ring of upload slots that this
+    executor writes training results into, and the aggregator releases after reading.
+
+    Args:
+        executor_id (string): Id of this executor.
+        num_slots (int): Number of uploads in flight.
+
+    """
+
+    def __init__(self, executor_id, num_slots=4):
+        self.prefix = f'fs_upload_{os.getpid()}_{executor_id}'
+        self.segments = [None] * num_slots
+        self.generations = [0] * num_slots
+        self.next_slot = 0
+
+    def _wait_free_slot(self):
+        """Index of the next free slot, waiting for the aggregator if all of them are in flight"""
+        start_time = time.time()
+        while True:
+            for _ in range(len(self.segments)):
+                index = self.next_slot
+                self.next_slot = (self.next_slot + 1) % len(self.segments)
+                segment = self.segments[index]
+                if segment is None or SLOT_HEADER.unpack_from(segment.buf, 0)[0] == SLOT_FREE:
+                    return index
+            if time.time() - start_time > 60:
+                logging.warning(f"All {len(self.segments)} upload slots are still in flight")
+                start_time = time.time()
+            time.sleep(0.001)
+
+    def write(self, payload):
+        """Write payload into a free slot
+
+        Returns:
+            SharedMemoryHandle: handle for the aggregator to read and release the slot.
+        """
+        index = self._wait_free_slot()
+        segment = self.segments[index]
+        if segment is None or segment.size < SLOT_HEADER.size + len(payload):
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+            self.generations[index] += 1
+            segment = _create_segment(f'{self.prefix}_{index}_{self.generations[index]}',
+                                      SLOT_HEADER.size + int(len(payload) * 1.25) + 1)
+            self.segments[index] = segment
+
+        segment.buf[SLOT_HEADER.size:SLOT_HEADER.size + len(payload)] = payload
+        SLOT_HEADER.pack_into(segment.buf, 0, SLOT_FULL, len(payload))
+        return SharedMemoryHandle(segment.name, self.generations[index], SLOT_HEADER.size, len(payload))
+
+    def close(self):
+        for segment in self.segments:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self.segments = [None] * len(self.segments)
+
+
+class SharedMemoryReader(object):
+    """Reads payloads of segments owned by other processes, keeping them attached.
+
+    Executors read model segments (read), the aggregator reads upload slots and hands
+    them back to their executors (read_and_release).
+    """
+
+    def __init__(self):
+        self.segments = {}
+        # segment name without its generation -> latest attached name
+        self.latest_names = {}
+
+    def _attach(self, name):
+        if name not in self.segments:
+            # the owner re-created this segment with a larger size, so drop the stale mapping
+            key = name.rsplit('_', 1)[0]
+            if key in self.latest_names:
+                self.detach(self.latest_names[key])
+            self.latest_names[key] = name
+            self.segments[name] = _attach_segment(name)
+        return self.segments[name]
+
+    def read(self, handle):
+        """Copy of the model payload of handle, or None if the publisher has overwritten it,
+        or re-created the segment with a larger size. The version is checked both before and
+        after copying, as the publisher may start overwriting the segment during the copy."""
+        try:
+            segment = self._attach(handle.name)
+        except FileNotFoundError:
+            return None
+        if MODEL_HEADER.unpack_from(segment.buf, 0)[0] != handle.version:
+            return None
+        payload = bytes(segment.buf[handle.offset:handle.offset + handle.size])
+        if MODEL_HEADER.unpack_from(segment.buf, 0)[0] != handle.version:
+            return None
+        return payload
+
+    def read_and_release(self, handle):
+        """Copy of the upload payload of handle, handing the slot back to its executor"""
+        segment = self._attach(handle.name)
+        payload = bytes(segment.buf[handle.offset:handle.offset + handle.size])
+        SLOT_HEADER.pack_into(segment.buf, 0, SLOT_FREE, 0)
+        return payload
+
+    def detach(self, name):
+        if name in self.segments:
+            self.segments.pop(name).close()
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+        self.latest_names = {}
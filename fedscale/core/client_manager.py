@@ -4,13 +4,16 @@ import pickle
 from random import Random
 from typing import Dict, List
 
-from fedscale.core.internal.client import Client
+import numpy as np
+
+from fedscale.core.internal.availability import AvailabilityTraces
+from fedscale.core.internal.client_registry import ClientRegistry
+from fedscale.core.storage.profile_store import load_device_profile_store
 
 
 class clientManager(object):
 
     def __init__(self, mode, args, sample_seed=233):
-        self.Clients = {}
         self.clientOnHosts = {}
         self.mode = mode
         self.filter_less = args.filter_less
@@ -36,10 +39,22 @@ class clientManager(object):
         self.user_trace = None
         self.args = args
 
-        if args.device_avail_file is not None:
+        self.availability = None
+        self.feasible_client_array = None
+
+        if args.device_profile_store is not None:
+            self.availability = load_device_profile_store(args).availability()
+        elif args.device_avail_file is not None:
             with open(args.device_avail_file, 'rb') as fin:
                 self.user_trace = pickle.load(fin)
             self.user_trace_keys = list(self.user_trace.keys())
+            # compile traces into interval arrays once, and drop the raw traces
+            self.availability = AvailabilityTraces.from_traces(
+                [self.user_trace[key] for key in self.user_trace_keys])
+            self.user_trace = None
+
+        # columnar client profiles; Clients[clientId] gives a per-client view
+        self.Clients = ClientRegistry(availability=self.availability)
 
     def registerClient(self, hostId, clientId, size, speed, duration=1):
         self.register_client(hostId, clientId, size, speed, duration)
@@ -55,15 +70,16 @@ class clientManager(object):
             duration (float): execution latency.
 
         """
-        uniqueId = self.getUniqueId(hostId, clientId)
-        user_trace = None if self.user_trace is None else self.user_trace[self.user_trace_keys[int(
-            clientId) % len(self.user_trace)]]
+        trace_row = -1 if self.availability is None else int(clientId) % self.availability.num_traces
+        feasible = size >= self.filter_less and size <= self.filter_more
 
-        self.Clients[uniqueId] = Client(hostId, clientId, speed, user_trace)
+        # infeasible clients are kept in the registry, but hidden from lookups
+        self.Clients.register(hostId, clientId, speed, size, trace_row=trace_row, feasible=feasible)
 
         # remove clients
-        if size >= self.filter_less and size <= self.filter_more:
+        if feasible:
             self.feasibleClients.append(clientId)
+            self.feasible_client_array = None
             self.feasible_samples += size
 
             if self.mode == "oort":
@@ -71,9 +87,36 @@ class clientManager(object):
                              'duration': duration,
                              }
                 self.ucbSampler.register_client(clientId, feedbacks=feedbacks)
-        else:
-            del self.Clients[uniqueId]
             
+    def register_clients(self, hostId: int, clientIds: np.ndarray, sizes: np.ndarray,
+                         speeds: Dict[str, np.ndarray], duration: float=1) -> None:
+        """Register many clients of one executor at once.
+
+        Args:
+            hostId (int): executor Id.
+            clientIds (np.ndarray of int): unique client Ids.
+            sizes (np.ndarray of int): number of samples on each client.
+            speeds (Dict[str, np.ndarray]): device speed of each client (e.g., computation, communication, and macs).
+            duration (float or np.ndarray): execution latency.
+
+        """
+        clientIds = np.asarray(clientIds, dtype=np.int64)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        trace_rows = None if self.availability is None else clientIds % self.availability.num_traces
+        feasible = (sizes >= self.filter_less) & (sizes <= self.filter_more)
+
+        self.Clients.register_bulk(hostId, clientIds, speeds, sizes, trace_rows=trace_rows, feasible=feasible)
+
+        self.feasibleClients.extend(clientIds[feasible].tolist())
+        self.feasible_client_array = None
+        self.feasible_samples += int(sizes[feasible].sum())
+
+        if self.mode == "oort":
+            feedbacks = {'reward': np.minimum(sizes[feasible], self.args.local_steps*self.args.batch_size),
+                         'duration': np.broadcast_to(duration, clientIds.shape)[feasible],
+                         }
+            self.ucbSampler.register_clients(clientIds[feasible], feedbacks=feedbacks)
+
     def getAllClients(self):
         return self.feasibleClients
 
@@ -92,15 +135,39 @@ class clientManager(object):
             self.ucbSampler.update_duration(
                 clientId, exe_cost['computation']+exe_cost['communication'])
 
+    def register_durations(self, clientIds, batch_size, upload_step, upload_size, download_size):
+        """Batch version of registerDuration"""
+        if self.mode == "oort":
+            clientIds = np.asarray(clientIds, dtype=np.int64)
+            rows = self.Clients.get_rows(clientIds)
+            clientIds = clientIds[self.Clients.feasible[rows]]
+            computation, communication = self.Clients.get_completion_time(
+                clientIds, batch_size=batch_size, upload_step=upload_step,
+                upload_size=upload_size, download_size=download_size)
+            self.ucbSampler.update_durations(clientIds, computation+communication)
+
     def getCompletionTime(self, clientId, batch_size, upload_step, upload_size, download_size):
         return self.Clients[self.getUniqueId(0, clientId)].getCompletionTime(
             batch_size=batch_size, upload_step=upload_step,
             upload_size=upload_size, download_size=download_size
         )
     
+    def get_completion_time_bulk(self, clientIds, batch_size, upload_step, upload_size, download_size):
+        """Completion time of many clients at once
+
+        Returns:
+            tuple of np.ndarray: (computation, communication) latency of each client.
+        """
+        return self.Clients.get_completion_time(
+            clientIds, batch_size=batch_size, upload_step=upload_step,
+            upload_size=upload_size, download_size=download_size)
+
     def get_capacity(self, clientId):
         return self.Clients[self.getUniqueId(0, clientId)].get_capacity()
 
+    def get_capacity_bulk(self, clientIds):
+        return self.Clients.get_capacity(clientIds)
+
     def registerSpeed(self, hostId, clientId, speed):
         uniqueId = self.getUniqueId(hostId, clientId)
         self.Clients[uniqueId].speed = speed
@@ -177,6 +244,9 @@ class clientManager(object):
     def getClientSize(self, clientId):
         return self.Clients[self.getUniqueId(0, clientId)].size
 
+    def get_client_size_bulk(self, clientIds):
+        return self.Clients.get_size(clientIds)
+
     def getSampleRatio(self, clientId, hostId, even=False):
         totalSampleInTraining = 0.
 
@@ -195,11 +265,13 @@ class clientManager(object):
             return 1./totalSampleInTraining
 
     def getFeasibleClients(self, cur_time):
-        if self.user_trace is None:
+        if self.availability is None:
             clients_online = self.feasibleClients
         else:
-            clients_online = [clientId for clientId in self.feasibleClients if self.Clients[self.getUniqueId(
-                0, clientId)].isActive(cur_time)]
+            if self.feasible_client_array is None:
+                self.feasible_client_array = np.array(self.feasibleClients, dtype=np.int64)
+            online, _ = self.Clients.is_active(self.feasible_client_array, cur_time)
+            clients_online = self.feasible_client_array[online].tolist()
 
         logging.info(f"Wall clock time: {round(cur_time)}, {len(clients_online)} clients online, " +
                      f"{len(self.feasibleClients)-len(clients_online)} clients offline")
@@ -209,6 +281,14 @@ class clientManager(object):
     def isClientActive(self, clientId, cur_time):
         return self.Clients[self.getUniqueId(0, clientId)].isActive(cur_time)
 
+    def is_clients_active(self, clientIds, cur_time):
+        """Which of these clients are online at cur_time (a scalar or one per client), and until when
+
+        Returns:
+            tuple of np.ndarray: (online, online_until)
+        """
+        return self.Clients.is_active(clientIds, cur_time)
+
     def select_participants(self, num_of_clients: int, cur_time: float=0) -> List[int]:
         """Select participating clients for current execution task.
 
@@ -228,11 +308,10 @@ class clientManager(object):
             return clients_online
 
         pickled_clients = None
-        clients_online_set = set(clients_online)
 
         if self.mode == "oort" and self.count > 1:
             pickled_clients = self.ucbSampler.select_participant(
-                num_of_clients, feasible_clients=clients_online_set)
+                num_of_clients, feasible_clients=clients_online)
         else:
             self.rng.shuffle(clients_online)
             client_len = min(num_of_clients, len(clients_online) - 1)
@@ -14,6 +14,9 @@ CLIENT_CONNECT = 'client_connect'
 CLIENT_TRAIN = 'client_train'
 DUMMY_EVENT = 'dummy_event'
 UPLOAD_MODEL = 'upload_model'
+UPLOAD_PARTIAL = 'upload_partial'
+BATCH_REPORT = 'batch_report'
+BATCH_EVENT = 'batch_event'
 
 # PLACEHOLD
 DUMMY_RESPONSE = 'N'
@@ -241,12 +241,64 @@ parser.add_argument('--weight_mode', type=str, default="inherit")
 parser.add_argument('--agg_mode', type=str, default="decay")
 parser.add_argument('--disable_hardware', type=str, default="False")
 parser.add_argument('--widen_ratio', type=int, default="False")
+parser.add_argument('--partition_cache_dir', type=str, default=None,
+                    help='directory of the cached partition maps, defaults to .partition_cache next to the data map file')
+parser.add_argument('--partition_method', type=str, default='uniform', choices=['uniform', 'dirichlet', 'quantity'],
+                    help='synthetic partition of the data when no data map file is given')
+parser.add_argument('--partition_alpha', type=float, default=0.5,
+                    help='concentration of the Dirichlet distribution used by the dirichlet and quantity partitions')
+parser.add_argument('--image_cache_dir', type=str, default=None,
+                    help='cache decoded femnist/openImg images as uint8 memory-mapped arrays in this directory')
+parser.add_argument('--lazy_partition', type=str, default='False',
+                    help='executors only partition the data of their own clients, and clients are trained on their executor')
+parser.add_argument('--device_profile_store', type=str, default=None,
+                    help='memory-mapped store of device profiles and availability traces, converted from the device files on first use and whenever they change')
+parser.add_argument('--round_deadline', type=float, default=-1,
+                    help='virtual time (s) after which a round aggregates the clients completed so far, disabled if <= 0')
+parser.add_argument('--sim_loss_model', type=str, default=None,
+                    help='loss curve model ("module:Class") of the system-only simulation, defaults to a power-law curve')
+parser.add_argument('--transport', type=str, default='grpc', choices=['grpc', 'shared_memory'],
+                    help='data plane of model broadcasts and uploads, shared_memory requires all executors on the aggregator host')
+parser.add_argument('--grpc_max_workers', type=int, default=0,
+                    help='threads serving the RPCs of the aggregator, defaults to max(20, 2 * #executors) if <= 0')
+parser.add_argument('--compressor', type=str, default='none', choices=['none', 'qsgd', 'topk'],
+                    help='codec of the weight deltas that clients upload')
+parser.add_argument('--quantize_bits', type=int, default=8, choices=[4, 8],
+                    help='bits per element of the qsgd compressor')
+parser.add_argument('--topk_ratio', type=float, default=0.01,
+                    help='fraction of the elements kept by the topk compressor')
+parser.add_argument('--error_feedback', type=str, default='False',
+                    help='keep the compression error of each client, and add it to its next upload')
+parser.add_argument('--grpc_compression', type=str, default='none', choices=['none', 'gzip', 'deflate'],
+                    help='compression of gRPC messages whose payload exceeds grpc_compression_threshold')
+parser.add_argument('--grpc_compression_threshold', type=int, default=1024*1024,
+                    help='smallest payload (bytes) of a gRPC message to compress')
+parser.add_argument('--grpc_chunk_size', type=int, default=0,
+                    help='uploads larger than this (bytes) are streamed to the aggregator in chunks, disabled if <= 0')
+parser.add_argument('--grpc_keepalive_time', type=float, default=0,
+                    help='seconds between keepalive pings on idle gRPC connections, disabled if <= 0')
+parser.add_argument('--grpc_keepalive_timeout', type=float, default=20,
+                    help='seconds to wait for a keepalive ack before the connection is considered broken')
+parser.add_argument('--edge_port', type=int, default=29600,
+                    help='port that an edge aggregator serves its executors on')
+parser.add_argument('--upload_delta', type=str, default='False',
+                    help='clients upload the deltas of changed tensors, which the aggregator averages and applies to the global model')
+parser.add_argument('--executor_pre_aggregation', type=str, default='False',
+                    help='executors sum the updates of their clients per model, and upload one partial aggregate per model per round; clients are then planned per executor instead of taken from a shared queue')
+parser.add_argument('--control_batch_size', type=int, default=0,
+                    help='executors batch up to this many completion reports into one request, which also fetches up to this many events, disabled if <= 0')
+parser.add_argument('--upload_pipeline_depth', type=int, default=0,
+                    help='executors serialize and send uploads on a background thread, with up to this many uploads queued and as many in flight, disabled if <= 0')
 
 args, unknown = parser.parse_known_args()
 args.use_cuda = eval(args.use_cuda)
 args.nas = eval(args.nas)
 args.soft_agg = eval(args.soft_agg)
 args.disable_hardware = eval(args.disable_hardware)
+args.lazy_partition = eval(args.lazy_partition)
+args.error_feedback = eval(args.error_feedback)
+args.upload_delta = eval(args.upload_delta)
+args.executor_pre_aggregation = eval(args.executor_pre_aggregation)
 
 
 datasetCategories = {'Mnist': 10, 'cifar10': 10, "imagenet": 1000, 'emnist': 47,
@@ -2,17 +2,23 @@
 import collections
 import gc
 import pickle
+import queue
 from argparse import Namespace
 
+import grpc
 import torch
 
 import fedscale.core.channels.job_api_pb2 as job_api_pb2
 from fedscale.core import commons
-from fedscale.core.channels.channel_context import ClientConnections
+from fedscale.core.aggregation.partial_aggregate import PartialAggregate, can_pre_aggregate
+from fedscale.core.channels.channel_context import MAX_BATCH_BYTES, ClientConnections, CompleteRequestFields
+from fedscale.core.channels.shared_memory import SharedMemoryHandle, SharedMemoryReader, UploadSlots
 from fedscale.core.execution.client import Client
 from fedscale.core.execution.data_processor import collate, voice_collate_fn
 from fedscale.core.execution.rlclient import RLClient
 from fedscale.core.logger.execution import *
+from fedscale.dataloaders.divide_data import get_client_partition
+from fedscale.utils.compressor.codec import load_compressor
 
 
 class Executor(object):
@@ -40,7 +46,41 @@ class Executor(object):
 
         # ======== channels ========
         self.aggregator_communicator = ClientConnections(
-            args.ps_ip, args.ps_port)
+            args.ps_ip, args.ps_port, compression=args.grpc_compression,
+            compression_threshold=args.grpc_compression_threshold, chunk_size=args.grpc_chunk_size,
+            keepalive_time=args.grpc_keepalive_time, keepalive_timeout=args.grpc_keepalive_timeout)
+        # completion reports waiting to be sent in one batch, and the sequence number of the next batch
+        self.control_batch_size = args.control_batch_size
+        self.pending_reports = []
+        self.batch_seq = 0
+        self.report_lock = threading.Lock()
+        # set whenever events are dispatched, so that the idle executor wakes up for them
+        self.events_ready = threading.Event()
+        self.upload_slots = None
+        self.model_reader = None
+        # serialized global models read from shared memory, in place of temp_model_path
+        self.model_bytes = None
+
+        # ======== upload compression ========
+        self.compressor = load_compressor(args)
+        self.upload_delta = args.upload_delta
+        # weights of the broadcasted models, which compressed deltas are taken against
+        self.global_weights = None
+
+        # ======== pre-aggregation ========
+        self.pre_aggregation = args.executor_pre_aggregation
+        # round of the partial aggregates, and model id -> clients left to train and their partial aggregate
+        self.partial_round = None
+        self.partial_pending = collections.Counter()
+        self.partials = {}
+
+        # ======== upload pipeline ========
+        # train results wait in upload_queue to be serialized and sent on upload_thread,
+        # and inflight_uploads bounds the uploads sent but not acknowledged yet
+        self.upload_pipeline_depth = args.upload_pipeline_depth
+        self.upload_queue = None
+        self.upload_thread = None
+        self.inflight_uploads = None
 
         # ======== runtime information ========
         self.collate_fn = None
@@ -65,6 +105,7 @@ class Executor(object):
         """
         self.init_control_communication()
         self.init_data_communication()
+        self.init_upload_pipeline()
 
     def setup_seed(self, seed=1):
         """Set random seed for reproducibility
@@ -86,9 +127,41 @@ class Executor(object):
         self.aggregator_communicator.connect_to_server()
 
     def init_data_communication(self):
-        """In charge of jumbo data traffics (e.g., fetch training result)
+        """In charge of jumbo data traffics (e.g., fetch training result).
+        With the shared memory transport, the broadcasted models are read from the aggregator's
+        segment, and training results are written into the upload slots of this executor.
         """
-        pass
+        if self.args.transport == 'shared_memory':
+            self.upload_slots = UploadSlots(self.executor_id)
+            self.model_reader = SharedMemoryReader()
+
+    def init_upload_pipeline(self):
+        """Serialize and send uploads on a background thread, so that the next client
+        trains while the update of the previous one is pickled and sent. Training blocks
+        once upload_pipeline_depth updates wait for serialization (backpressure)."""
+        if self.upload_pipeline_depth <= 0:
+            return
+        self.upload_queue = queue.Queue(maxsize=self.upload_pipeline_depth)
+        self.inflight_uploads = threading.BoundedSemaphore(self.upload_pipeline_depth)
+        self.upload_thread = threading.Thread(target=self.upload_worker, daemon=True)
+        self.upload_thread.start()
+
+    def upload_worker(self):
+        """Serialize and send the queued uploads, waiting while upload_pipeline_depth uploads are in flight"""
+        while True:
+            upload = self.upload_queue.get()
+            if upload is None:
+                break
+            self.inflight_uploads.acquire()
+            try:
+                future_call = self.send_upload(*upload)
+            except Exception as e:
+                logging.error(f"Failed to upload the results of client {upload[0]}: {e}")
+                future_call = None
+            if future_call is None:
+                self.inflight_uploads.release()
+            else:
+                future_call.add_done_callback(lambda _response: self.inflight_uploads.release())
 
     def init_model(self):
         """Get the model architecture used in training
@@ -115,37 +188,34 @@ class Executor(object):
         # load data partitioner (entire_train_data)
         logging.info("Data partitioner starts ...")
 
+        # with lazy partition, only the data of the clients held by this executor is partitioned,
+        # and the aggregator routes every client to its executor (see get_client_executor)
+        executor = (self.this_rank, self.num_executors) if self.args.lazy_partition else None
+
         training_sets = DataPartitioner(
             data=train_dataset, args=self.args, numOfClass=self.args.num_class)
         label_split = training_sets.partition_data_helper(
             num_clients=self.args.num_participants, data_map_file=self.args.data_map_file,
             # is_hetero_cifar = self.args.data_set == "cifar10")
-            is_hetero_cifar = False)
+            is_hetero_cifar = False, partition_method=self.args.partition_method, executor=executor)
 
         client_testing_sets = DataPartitioner(
             data=test_dataset, args=self.args, numOfClass=self.args.num_class, isTest=True)
         client_testing_sets.partition_data_helper(
-            num_clients=self.args.num_participants, data_map_file=self.args.test_data_map_file, label_split=label_split)
+            num_clients=self.args.num_participants, data_map_file=self.args.test_data_map_file, label_split=label_split,
+            partition_method=self.args.partition_method, executor=executor)
 
         server_testing_sets = DataPartitioner(
             data=test_dataset, args=self.args, numOfClass=self.args.num_class, isTest=True)
         server_testing_sets.partition_data_helper(
-                num_clients=self.num_executors)
+                num_clients=self.num_executors, executor=executor)
 
         assert len(client_testing_sets.getSize()) == len(training_sets.getSize())
 
         self.n_clients = len(client_testing_sets.getSize()['size'])
-
-        if self.this_rank != self.num_executors:
-            self.client_partition = list(range(
-                (self.this_rank - 1) * (self.n_clients // self.num_executors) + 1,
-                self.this_rank * (self.n_clients // self.num_executors) + 1
-            ))
-        else:
-            self.client_partition = list(range(
-                (self.this_rank - 1) * (self.n_clients // self.num_executors) + 1,
-                self.n_clients + 1
-            ))
+        client_partition = get_client_partition(
+            self.this_rank, self.num_executors, self.n_clients)
+        self.client_partition = list(client_partition)
 
         logging.info("Data partitioner completes ...")
         logging.info(f"Executor {self.this_rank} is partitioned with {len(self.client_partition)} clients: {self.client_partition}")
@@ -173,7 +243,11 @@ class Executor(object):
             request (string): Add grpc request from server (e.g. MODEL_TEST, MODEL_TRAIN) to event_queue.
         
         """
-        self.event_queue.append(request)
+        if request.event == commons.BATCH_EVENT:
+            self.event_queue.extend(request.events)
+        else:
+            self.event_queue.append(request)
+        self.events_ready.set()
 
     def deserialize_response(self, responses):
         """Deserialize the response from server
@@ -199,6 +273,42 @@ class Executor(object):
         """
         return pickle.dumps(responses)
 
+    def serialize_upload(self, train_res):
+        """Serialize the training result, writing it into an upload slot if
+        the shared memory transport is used, so that only its handle is sent"""
+        data = self.serialize_response(train_res)
+        if self.upload_slots is not None:
+            data = self.serialize_response(self.upload_slots.write(data))
+        return data
+
+    def deserialize_models(self, data, max_attempts=10):
+        """Deserialize the broadcasted global models, reading them from the
+        aggregator's segment if a shared memory handle was sent. Models that the
+        aggregator overwrites before they are read are fetched again."""
+        models = self.deserialize_response(data)
+        for _ in range(max_attempts):
+            if not isinstance(models, SharedMemoryHandle):
+                return models
+            model_bytes = self.model_reader.read(models)
+            if model_bytes is not None:
+                self.model_bytes = model_bytes
+                return self.deserialize_response(model_bytes)
+            logging.warning(f"Global models (version {models.version}) were overwritten before being read, "
+                            f"fetching them again")
+            models = self.deserialize_response(self.fetch_global_model())
+        raise RuntimeError(f"Failed to read the global models in {max_attempts} attempts")
+
+    def fetch_global_model(self):
+        """Ask the aggregator to publish the global models again
+
+        Returns:
+            bytes: UPDATE_MODEL data of the response.
+        """
+        response = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION(job_api_pb2.CompleteRequest(
+            client_id=self.executor_id, executor_id=self.executor_id, event=commons.UPDATE_MODEL,
+            status=False, msg=None, meta_result=None, data_result=None))
+        return response.data
+
     def UpdateModel(self, config):
         """Receive the broadcasted global model for current round
 
@@ -215,40 +325,185 @@ class Executor(object):
         client_conf = self.override_conf(train_config)
         train_res = self.training_handler(
             clientId=client_id, conf=client_conf, model_id=model_id)
+        train_res['model_id'] = model_id
 
-        # Report execution completion meta information
-        response = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION(
+        # Report execution completion meta information, without waiting for the
+        # response if the next client can train while the upload is in the pipeline
+        self.report_completion(
             job_api_pb2.CompleteRequest(
                 client_id=str(client_id), executor_id=self.executor_id,
                 event=commons.CLIENT_TRAIN, status=True, msg=None,
                 meta_result=None, data_result=None
-            )
+            ),
+            wait=self.upload_queue is None
         )
-        self.dispatch_worker_events(response)
 
         return client_id, train_res
 
+    def pre_aggregation_handler(self, train_config, train_res):
+        """Add the update of a client to the partial aggregate of its model in this round
+
+        Args:
+            train_config (dictionary): The training config of the client, with the round and the executor plan.
+            train_res (dictionary): The train result of the client.
+
+        Returns:
+            PartialAggregate: The partial aggregate of the model once all its clients planned on
+            this executor are in it, otherwise None.
+        """
+        if train_config['round'] != self.partial_round:
+            if len(self.partials) > 0:
+                logging.error(f"Round {self.partial_round} ends with clients of models {list(self.partials.keys())} "
+                              f"not uploaded to the aggregator")
+            self.partial_round = train_config['round']
+            self.partial_pending = collections.Counter(train_config['executor_plan'])
+            self.partials = {}
+
+        model_id = train_res['model_id']
+        if model_id not in self.partials:
+            self.partials[model_id] = PartialAggregate(model_id, delta=train_res.get('delta', False))
+        self.partials[model_id].add(train_res)
+        self.partial_pending[model_id] -= 1
+        if self.partial_pending[model_id] > 0:
+            return None
+
+        partial = self.partials.pop(model_id)
+        if self.compressor is not None and partial.delta:
+            partial.weight_sums = self.compressor.encode(('partial', model_id), partial.weight_sums)
+        return partial
+
+    def upload_results(self, client_id, event, results):
+        """Upload the results of client_id (a train result, or a PartialAggregate) asynchronously,
+        and dispatch the next event carried by the response. With the upload pipeline, the
+        results are only snapshotted here, and serialized and sent on the upload thread."""
+        if self.upload_queue is not None:
+            self.upload_queue.put((client_id, event, self.snapshot_results(results)))
+            return
+        self.send_upload(client_id, event, results)
+
+    def snapshot_results(self, results):
+        """Copy the trained weights that still share memory with the model (on CPU, .numpy()
+        does not copy), as the next client trains the same model in place"""
+        if not isinstance(results, dict) or self.args.use_cuda or results.get('delta', False):
+            return results
+        weights = results['update_weight']
+        if isinstance(weights, dict):
+            results['update_weight'] = {p: weight.copy() if isinstance(weight, np.ndarray) else weight
+                                        for p, weight in weights.items()}
+        else:
+            results['update_weight'] = [weight.copy() if isinstance(weight, np.ndarray) else weight
+                                        for weight in weights]
+        return results
+
+    def send_upload(self, client_id, event, results):
+        """Serialize and send the results of client_id
+
+        Returns:
+            grpc.Future: Future of the upload, or None if it is batched.
+        """
+        with self.report_lock:
+            num_uploads = sum(report.event in (commons.UPLOAD_MODEL, commons.UPLOAD_PARTIAL)
+                              for report in self.pending_reports)
+        if self.upload_slots is not None and num_uploads >= len(self.upload_slots.segments):
+            # buffered uploads hold every slot, which the aggregator only releases once they are sent
+            self.flush_reports()
+        data = self.serialize_upload(results)
+        if self.control_batch_size > 0:
+            self.report_completion(job_api_pb2.CompleteRequest(client_id=str(client_id), executor_id=self.executor_id,
+                                                               event=event, status=True, msg=None,
+                                                               meta_result=None, data_result=data))
+            return None
+        # the payload is not copied into a message before it is sent (see chunk_request)
+        future_call = self.aggregator_communicator.execute_completion_future(
+            CompleteRequestFields(client_id=str(client_id), executor_id=self.executor_id,
+                                  event=event, status=True, msg=None,
+                                  meta_result=None, data_result=data))
+        future_call.add_done_callback(lambda _response: self.dispatch_worker_events(_response.result()))
+        return future_call
+
+    def report_completion(self, request, wait=True):
+        """Report a completion to the aggregator, and dispatch the next event carried by the response.
+        With --control_batch_size, the report is buffered, and sent with others in one batch.
+
+        Args:
+            request (CompleteRequest): The completion report.
+            wait (bool): Whether to wait for the response, otherwise it is dispatched once received.
+        """
+        if self.control_batch_size <= 0:
+            if wait:
+                response = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION(request)
+                self.dispatch_worker_events(response)
+            else:
+                future_call = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION.future(request)
+                future_call.add_done_callback(lambda _response: self.dispatch_worker_events(_response.result()))
+            return
+
+        with self.report_lock:
+            self.pending_reports.append(request)
+            batch_full = len(self.pending_reports) >= self.control_batch_size or \
+                sum(len(report.data_result) for report in self.pending_reports) >= MAX_BATCH_BYTES
+        if batch_full:
+            self.flush_reports()
+
+    def flush_reports(self):
+        """Send the buffered completion reports in one BATCH_REPORT request, and dispatch
+        the events of the response. An empty batch serves as a ping for several events.
+        Only taking the reports and a sequence number holds report_lock, so that training
+        and the upload thread keep buffering (and may send the next batch) while this one
+        is sent. A failed batch is retransmitted with the same sequence number."""
+        with self.report_lock:
+            reports, self.pending_reports = self.pending_reports, []
+            seq = self.batch_seq
+            self.batch_seq += 1
+
+        request = job_api_pb2.CompleteRequest(
+            client_id=self.executor_id, executor_id=self.executor_id,
+            event=commons.BATCH_REPORT, status=True, msg=None, reports=reports,
+            batch_seq=seq, max_events=self.control_batch_size)
+
+        for attempt in range(3):
+            try:
+                response = self.aggregator_communicator.execute_completion_future(request).result()
+                break
+            except grpc.RpcError as e:
+                if attempt == 2:
+                    raise
+                logging.warning(f"Failed to send batch {seq} to aggregator {e}. Will retry in 5 sec.")
+                time.sleep(5)
+
+        self.dispatch_worker_events(response)
+
     def Test(self, config):
-        """Model Testing. By default, we test the accuracy on all data of clients in the test group"""
+        """Model Testing. By default, we test the accuracy on all data of clients in the test group.
+        All requested models are evaluated within one pass over the test data."""
 
-        test_res = self.testing_handler(args=self.args, model_id=config['model_id'])
-        test_res = {'executorId': self.this_rank, 'results': test_res, 'model_id': config['model_id']}
+        model_ids = config['model_id'] if isinstance(config['model_id'], list) else [config['model_id']]
+        test_res = self.testing_handler(args=self.args, model_ids=model_ids)
+        test_res = {'executorId': self.this_rank, 'results': test_res, 'model_id': model_ids}
 
         # Report execution completion information
-        response = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION(
+        self.report_completion(
             job_api_pb2.CompleteRequest(
                 client_id=str(config['client_id']), executor_id=self.executor_id,
                 event=commons.MODEL_TEST, status=True, msg=None,
                 meta_result=None, data_result=self.serialize_response(test_res)
             )
         )
-        self.dispatch_worker_events(response)
 
     def Stop(self):
         """Stop the current executor
         """
+        if self.upload_thread is not None:
+            # drain the upload pipeline, and wait for the uploads in flight
+            self.upload_queue.put(None)
+            self.upload_thread.join()
+            for _ in range(self.upload_pipeline_depth):
+                self.inflight_uploads.acquire()
         self.aggregator_communicator.close_sever_connection()
         self.received_stop_request = True
+        if self.upload_slots is not None:
+            self.model_reader.close()
+            self.upload_slots.close()
 
     def report_executor_info_handler(self):
         """Return the statistics of training dataset
@@ -268,12 +523,45 @@ class Executor(object):
         """
         self.model = model
         self.round += 1
+        if self.compressor is not None or self.upload_delta:
+            self.global_weights = [self.get_model_weights(m) for m in self.model]
 
         # logging.info(f"get model {self.model[0].state_dict()} from the server")
 
-        # Dump latest model to disk
-        with open(self.temp_model_path, 'wb') as model_out:
-            pickle.dump(self.model, model_out)
+        # Dump latest model to disk, unless its serialized copy is kept from shared memory
+        if self.model_bytes is None:
+            with open(self.temp_model_path, 'wb') as model_out:
+                pickle.dump(self.model, model_out)
+
+    def get_model_weights(self, model):
+        """Copy of the weights of model as numpy arrays, or None for a missing model"""
+        if model is None:
+            return None
+        return {p: tensor.detach().cpu().numpy().copy() for p, tensor in model.state_dict().items()}
+
+    def get_weight_deltas(self, weights, base_weights):
+        """Deltas of the trained weights against the downloaded ones. Tensors that did not change
+        (e.g., frozen layers), scalar counters (num_batches_tracked), and the profiling
+        buffers of thop (total_ops, total_params) are not uploaded. Only the shapes of the
+        unchanged tensors are, so that the aggregator still counts the client in their average.
+
+        Args:
+            weights (dict of np.ndarray): Trained weights.
+            base_weights (dict of np.ndarray): Weights of the downloaded model.
+
+        Returns:
+            tuple: Delta of each changed tensor (dict of np.ndarray), and shape of each unchanged tensor (dict of tuple).
+        """
+        deltas, unchanged = {}, {}
+        for p, weight in weights.items():
+            if 'total_ops' in p or 'total_params' in p or weight.ndim == 0 or p not in base_weights:
+                continue
+            delta = weight - base_weights[p]
+            if delta.any():
+                deltas[p] = delta
+            else:
+                unchanged[p] = weight.shape
+        return deltas, unchanged
 
     def load_global_model(self):
         """ Load last global model
@@ -282,6 +570,8 @@ class Executor(object):
             PyTorch or TensorFlow model: The lastest global model
 
         """
+        if self.model_bytes is not None:
+            return pickle.loads(self.model_bytes)
         with open(self.temp_model_path, 'rb') as model_in:
             model = pickle.load(model_in)
         return model
@@ -346,31 +636,45 @@ class Executor(object):
             train_res = client.train(
                 client_data=client_data, model=client_model, conf=conf)
 
+        base_weights = self.global_weights[model_id] if self.global_weights is not None else None
+        if self.upload_delta:
+            train_res['update_weight'], train_res['unchanged_weight'] = self.get_weight_deltas(
+                train_res['update_weight'], base_weights)
+            train_res['delta'] = True
+            base_weights = None
+        if self.compressor is not None and not (self.pre_aggregation and self.upload_delta):
+            # pre-aggregated deltas are compressed once summed (see pre_aggregation_handler)
+            train_res['update_weight'] = self.compressor.encode(
+                clientId, train_res['update_weight'], base_weights)
+
         return train_res
 
-    def testing_handler(self, args, model_id):
-        """Test model
+    def testing_handler(self, args, model_ids):
+        """Test models
         
         Args:
             args (dictionary): Variable arguments for fedscale runtime config. defaults to the setup in arg_parser.py
+            model_ids (list of int): Ids of the models to test.
 
         Returns:
-            dictionary: The test result
+            dictionary: The test results of each model, keyed by model id
 
         """
         evalStart = time.time()
         device = self.device
-        model = self.load_global_model()[model_id]
-        all_test_results = []
+        global_models = self.load_global_model()
+        models = {model_id: global_models[model_id] for model_id in model_ids}
+        all_test_results = {model_id: [] for model_id in model_ids}
         if self.task == 'rl':
             client = RLClient(args)
-            test_res = client.test(args, self.this_rank, model, device=device)
-            _, _, _, testResults = test_res
+            for model_id, model in models.items():
+                test_res = client.test(args, self.this_rank, model, device=device)
+                _, _, _, testResults = test_res
+                all_test_results[model_id].append(testResults)
         else:
             if self.round % self.args.client_eval_interval == 0:
-                all_test_results = self.client_testing(args, model_id, evalStart, device, model)
+                all_test_results = self.client_testing(args, models, evalStart, device)
             else:
-                all_test_results = []
                 data_loader = select_dataset(self.this_rank, self.server_testing_sets,
                                          batch_size=args.test_bsz, args=args,
                                          isTest=True, collate_fn=self.collate_fn
@@ -382,41 +686,44 @@ class Executor(object):
                     criterion = torch.nn.CrossEntropyLoss().to(device=device)
 
                 if self.args.engine == commons.PYTORCH:
-                    test_res = test_model(self.this_rank, model, data_loader,
+                    test_res = test_models(self.this_rank, models, data_loader,
                                         device=device, criterion=criterion, tokenizer=tokenizer)
                 else:
                     raise Exception(f"Need customized implementation for model testing in {self.args.engine} engine")
 
-                test_loss, acc, acc_5, testResults = test_res
-                logging.info("After aggregation round {}, CumulTime {}, eval_time {}, test_loss {}, test_accuracy {:.2f}%, test_5_accuracy {:.2f}% \n"
-                            .format(self.round, round(time.time() - self.start_run_time, 4), round(time.time() - evalStart, 4), test_loss, acc*100., acc_5*100.))
-                all_test_results.append(testResults)
+                for model_id in model_ids:
+                    test_loss, acc, acc_5, testResults = test_res[model_id]
+                    logging.info("Model {}: After aggregation round {}, CumulTime {}, eval_time {}, test_loss {}, test_accuracy {:.2f}%, test_5_accuracy {:.2f}% \n"
+                                .format(model_id, self.round, round(time.time() - self.start_run_time, 4), round(time.time() - evalStart, 4), test_loss, acc*100., acc_5*100.))
+                    all_test_results[model_id].append(testResults)
         gc.collect()
 
         return all_test_results
 
-    def client_testing(self, args, model_id, evalStart, device, model):
-        all_test_results = []
+    def client_testing(self, args, models, evalStart, device):
+        all_test_results = {model_id: [] for model_id in models}
+        if self.task == 'voice':
+            criterion = CTCLoss(reduction='mean').to(device=device)
+        else:
+            criterion = torch.nn.CrossEntropyLoss().to(device=device)
+
         for client_id in self.client_partition:
             data_loader = select_dataset(client_id, self.client_testing_sets,
                                              batch_size=args.test_bsz, args=args,
                                              isTest=True, collate_fn=self.collate_fn
                                              )
-            if self.task == 'voice':
-                criterion = CTCLoss(reduction='mean').to(device=device)
-            else:
-                criterion = torch.nn.CrossEntropyLoss().to(device=device)
 
             if self.args.engine == commons.PYTORCH:
-                test_res = test_model(client_id, model, data_loader,
+                test_res = test_models(client_id, models, data_loader,
                                           device=device, criterion=criterion, tokenizer=tokenizer)
             else:
                 raise Exception(f"Need customized implementation for model testing in {self.args.engine} engine")
 
-            test_loss, acc, acc_5, testResults = test_res
-            logging.info("Client {} at model {}: After aggregation round {}, CumulTime {}, eval_time {}, test_loss {}, test_accuracy {:.2f}%, test_5_accuracy {:.2f}% \n"
-                             .format(client_id, model_id, self.round, round(time.time() - self.start_run_time, 4), round(time.time() - evalStart, 4), test_loss, acc*100., acc_5*100.))
-            all_test_results.append(testResults)
+            for model_id in models:
+                test_loss, acc, acc_5, testResults = test_res[model_id]
+                logging.info("Client {} at model {}: After aggregation round {}, CumulTime {}, eval_time {}, test_loss {}, test_accuracy {:.2f}%, test_5_accuracy {:.2f}% \n"
+                                 .format(client_id, model_id, self.round, round(time.time() - self.start_run_time, 4), round(time.time() - evalStart, 4), test_loss, acc*100., acc_5*100.))
+                all_test_results[model_id].append(testResults)
         return all_test_results
 
     def client_register(self):
@@ -442,6 +749,9 @@ class Executor(object):
     def client_ping(self):
         """Ping the aggregator for new task
         """
+        if self.control_batch_size > 0:
+            self.flush_reports()
+            return
         response = self.aggregator_communicator.stub.CLIENT_PING(job_api_pb2.PingRequest(
             client_id=self.executor_id,
             executor_id=self.executor_id
@@ -466,12 +776,13 @@ class Executor(object):
                     client_id, train_res = self.Train(train_config)
 
                     # Upload model updates
-                    future_call = self.aggregator_communicator.stub.CLIENT_EXECUTE_COMPLETION.future(
-                        job_api_pb2.CompleteRequest(client_id=str(client_id), executor_id=self.executor_id,
-                                                    event=commons.UPLOAD_MODEL, status=True, msg=None,
-                                                    meta_result=None, data_result=self.serialize_response(train_res)
-                                                    ))
-                    future_call.add_done_callback(lambda _response: self.dispatch_worker_events(_response.result()))
+                    if self.pre_aggregation and train_config.get('executor_plan') is not None \
+                            and can_pre_aggregate(train_res):
+                        partial = self.pre_aggregation_handler(train_config, train_res)
+                        if partial is not None:
+                            self.upload_results(client_id, commons.UPLOAD_PARTIAL, partial)
+                    else:
+                        self.upload_results(client_id, commons.UPLOAD_MODEL, train_res)
 
                 elif current_event == commons.MODEL_TEST:
                     config = self.deserialize_response(request.meta)
@@ -479,17 +790,21 @@ class Executor(object):
                     self.Test(config)
 
                 elif current_event == commons.UPDATE_MODEL:
-                    broadcast_config = self.deserialize_response(request.data)
-                    self.UpdateModel(broadcast_config)
+                    self.UpdateModel(self.deserialize_models(request.data))
 
                 elif current_event == commons.SHUT_DOWN:
                     self.Stop()
 
                 elif current_event == commons.DUMMY_EVENT:
                     pass
+            elif len(self.pending_reports) > 0:
+                # nothing left to run, send the buffered reports for the next events
+                self.flush_reports()
             else:
-                time.sleep(1)
-                self.client_ping()
+                # wait for the responses of the calls in flight, and ping if none comes
+                self.events_ready.clear()
+                if len(self.event_queue) == 0 and not self.events_ready.wait(1):
+                    self.client_ping()
 
 
 if __name__ == "__main__":
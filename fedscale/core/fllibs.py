@@ -32,8 +32,10 @@ from fedscale.core.client_manager import clientManager
 # libs from fedscale
 from fedscale.core.config_parser import args
 from fedscale.dataloaders.divide_data import DataPartitioner, select_dataset
-from fedscale.dataloaders.utils_data import get_data_transform
-from fedscale.utils.model_test_module import test_model
+from fedscale.dataloaders.image_cache import CachedImageDataset
+from fedscale.dataloaders.utils_data import (get_data_transform,
+                                             get_tensor_data_transform)
+from fedscale.utils.model_test_module import test_model, test_models
 # FedScale model libs
 from fedscale.utils.models.model_provider import get_cv_model
 
@@ -328,6 +330,13 @@ def init_dataset():
             test_dataset = FEMNIST(
                 args.data_dir, dataset='test', transform=test_transform)
 
+            if args.image_cache_dir is not None:
+                train_transform, test_transform = get_tensor_data_transform('mnist')
+                train_dataset = CachedImageDataset(
+                    train_dataset, args.image_cache_dir, 'femnist_train', (28, 28), transform=train_transform)
+                test_dataset = CachedImageDataset(
+                    test_dataset, args.image_cache_dir, 'femnist_test', (28, 28), transform=test_transform)
+
         elif args.data_set == 'openImg':
             from fedscale.dataloaders.openimage import OpenImage
 
@@ -337,6 +346,13 @@ def init_dataset():
             test_dataset = OpenImage(
                 args.data_dir, dataset='test', transform=test_transform)
 
+            if args.image_cache_dir is not None:
+                train_transform, test_transform = get_tensor_data_transform('openImg')
+                train_dataset = CachedImageDataset(
+                    train_dataset, args.image_cache_dir, 'openImg_train', (256, 256), transform=train_transform)
+                test_dataset = CachedImageDataset(
+                    test_dataset, args.image_cache_dir, 'openImg_test', (256, 256), transform=test_transform)
+
         elif args.data_set == 'blog':
             train_dataset = load_and_cache_examples(
                 args, tokenizer, evaluate=False)
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class AvailabilityTraces(object):
+    """Periodic client availability traces compiled into flat sorted interval arrays.
+
+    Trace i repeats every periods[i] seconds, and is online during [starts[j], ends[j]]
+    (in time modulo the period) for j in offsets[i]:offsets[i+1]. The intervals of
+    trace i are shifted by bases[i] into a range disjoint from all other traces, so a
+    single searchsorted answers queries over many traces at once. Queries are stateless,
+    so virtual time can jump arbitrarily far between them.
+
+    Args:
+        starts (np.ndarray): interval start times, sorted within each trace.
+        ends (np.ndarray): interval end times.
+        offsets (np.ndarray): CSR offsets of the intervals of each trace.
+        periods (np.ndarray): period (finish_time) of each trace.
+        shifted_starts (np.ndarray, optional): starts shifted by the base of their trace,
+            computed if not given (e.g., a memory-mapped column of DeviceProfileStore).
+
+    """
+
+    def __init__(self, starts, ends, offsets, periods, shifted_starts=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.periods = np.asarray(periods, dtype=np.float64)
+
+        self.bases = np.cumsum(self.periods + 1.) - (self.periods + 1.)
+        if shifted_starts is None:
+            shifted_starts = self.starts + np.repeat(self.bases, np.diff(self.offsets))
+        self.shifted_starts = np.asarray(shifted_starts, dtype=np.float64)
+
+    @property
+    def num_traces(self):
+        return len(self.periods)
+
+    @classmethod
+    def from_traces(cls, traces):
+        """Compile traces in the FedScale format, i.e., dictionaries of
+        {'active': [start times], 'inactive': [end times], 'finish_time': period}"""
+        counts = np.array([len(trace['active']) for trace in traces], dtype=np.int64)
+        offsets = np.zeros(len(traces) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        periods = np.array([trace['finish_time'] for trace in traces], dtype=np.float64)
+
+        starts = np.fromiter((start for trace in traces for start in trace['active']),
+                             dtype=np.float64, count=offsets[-1])
+        ends = np.fromiter((end for trace in traces for end in trace['inactive'][:len(trace['active'])]),
+                           dtype=np.float64, count=offsets[-1])
+
+        # sort the intervals within each trace by start time
+        order = np.lexsort((starts, np.repeat(np.arange(len(traces)), counts)))
+        return cls(starts[order], ends[order], offsets, periods)
+
+    def get_trace(self, trace_row):
+        """Return trace trace_row in the FedScale format"""
+        first, last = self.offsets[trace_row], self.offsets[trace_row + 1]
+        return {'active': self.starts[first:last].tolist(), 'inactive': self.ends[first:last].tolist(),
+                'finish_time': self.periods[trace_row].item()}
+
+    def query(self, trace_rows, cur_time):
+        """Which traces are online at cur_time, and until when.
+
+        Args:
+            trace_rows (np.ndarray of int): traces to query, -1 for clients that are always online.
+            cur_time (float or np.ndarray): query time, a scalar or one per trace.
+
+        Returns:
+            tuple of np.ndarray: (online, online_until). online_until is the time the current
+            online interval ends, inf for always-online clients, and cur_time for offline ones.
+        """
+        trace_rows = np.asarray(trace_rows, dtype=np.int64)
+        cur_time = np.broadcast_to(np.asarray(cur_time, dtype=np.float64), trace_rows.shape)
+        online = np.ones(trace_rows.shape, dtype=bool)
+        online_until = np.full(trace_rows.shape, np.inf)
+
+        has_trace = trace_rows >= 0
+        if not has_trace.any():
+            return online, online_until
+
+        rows, times = trace_rows[has_trace], cur_time[has_trace]
+        norm_time = np.mod(times, self.periods[rows])
+        pos = np.searchsorted(self.shifted_starts, self.bases[rows] + norm_time, side='right') - 1
+        # the interval found must belong to the queried trace
+        in_trace = pos >= self.offsets[rows]
+        ends = self.ends[np.maximum(pos, 0)] if len(self.ends) > 0 else np.full(len(rows), -np.inf)
+
+        traced_online = in_trace & (norm_time <= ends)
+        online[has_trace] = traced_online
+        online_until[has_trace] = np.where(traced_online, times - norm_time + ends, times)
+        return online, online_until
@@ -1,3 +1,5 @@
+import bisect
+
 
 class Client(object):
 
@@ -9,7 +11,6 @@ class Client(object):
         self.macs = speed['macs']
         self.score = 0
         self.traces = traces
-        self.behavior_index = 0
 
     def get_capacity(self):
         return self.macs
@@ -26,15 +27,10 @@ class Client(object):
 
         norm_time = cur_time % self.traces['finish_time']
 
-        if norm_time > self.traces['inactive'][self.behavior_index]:
-            self.behavior_index += 1
-
-        self.behavior_index %= len(self.traces['active'])
-
-        if (self.traces['active'][self.behavior_index] <= norm_time <= self.traces['inactive'][self.behavior_index]):
-            return True
+        # the last interval starting before norm_time, so virtual time can jump by any amount
+        index = bisect.bisect_right(self.traces['active'], norm_time) - 1
 
-        return False
+        return index >= 0 and norm_time <= self.traces['inactive'][index]
 
     def getCompletionTime(self, batch_size, upload_step, upload_size, download_size, augmentation_factor=3.0):
         """
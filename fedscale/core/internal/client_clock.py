@@ -0,0 +1,80 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class ClientClock(Mapping):
+    """Simulated execution latency of the clients of a round, kept as parallel arrays.
+
+    It is a read-only mapping of client id to {'computation': ..., 'communication': ...},
+    so per-client lookups keep working, while the arrays are used for bulk accounting.
+
+    Args:
+        client_ids (np.ndarray of int): client ids.
+        computation (np.ndarray): computation latency of each client.
+        communication (np.ndarray): communication latency of each client.
+        capacity (np.ndarray, optional): hardware capacity (MACs) of each client.
+
+    """
+
+    def __init__(self, client_ids, computation, communication, capacity=None):
+        self.client_ids = np.asarray(client_ids, dtype=np.int64)
+        self.computation = np.asarray(computation, dtype=np.float64)
+        self.communication = np.asarray(communication, dtype=np.float64)
+        self.capacity = None if capacity is None else np.asarray(capacity, dtype=np.float64)
+
+        self._order = np.argsort(self.client_ids, kind='stable')
+        self._sorted_ids = self.client_ids[self._order]
+
+    @property
+    def durations(self):
+        return self.computation + self.communication
+
+    def index(self, client_id):
+        """Position of client_id in the arrays"""
+        client_id = int(client_id)
+        pos = np.searchsorted(self._sorted_ids, client_id)
+        if pos == len(self._sorted_ids) or self._sorted_ids[pos] != client_id:
+            raise KeyError(client_id)
+        return self._order[pos]
+
+    def __getitem__(self, client_id):
+        index = self.index(client_id)
+        return {'computation': self.computation[index].item(),
+                'communication': self.communication[index].item()}
+
+    def __contains__(self, client_id):
+        try:
+            self.index(client_id)
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.client_ids.tolist())
+
+    def __len__(self):
+        return len(self.client_ids)
+
+    def get_capacities(self):
+        """Read-only mapping of client id to its capacity"""
+        return ClientCapacity(self)
+
+
+class ClientCapacity(Mapping):
+    """Client id to capacity view over a ClientClock"""
+
+    def __init__(self, clock):
+        self._clock = clock
+
+    def __getitem__(self, client_id):
+        return self._clock.capacity[self._clock.index(client_id)].item()
+
+    def __contains__(self, client_id):
+        return client_id in self._clock
+
+    def __iter__(self):
+        return iter(self._clock)
+
+    def __len__(self):
+        return len(self._clock)
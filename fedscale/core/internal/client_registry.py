@@ -0,0 +1,215 @@
+import numpy as np
+
+from fedscale.core.internal.client import Client
+
+
+class ClientView(Client):
+    """Per-client view over a row of the ClientRegistry, keeping the Client API"""
+
+    def __init__(self, registry, row):
+        self._registry = registry
+        self._row = row
+
+    def _get(self, column):
+        return getattr(self._registry, column)[self._row].item()
+
+    def _set(self, column, value):
+        getattr(self._registry, column)[self._row] = value
+
+    hostId = property(lambda self: self._get('host_ids'))
+    clientId = property(lambda self: self._get('client_ids'))
+    compute_speed = property(lambda self: self._get('compute_speeds'),
+                             lambda self, value: self._set('compute_speeds', value))
+    bandwidth = property(lambda self: self._get('bandwidths'),
+                         lambda self, value: self._set('bandwidths', value))
+    macs = property(lambda self: self._get('macs'),
+                    lambda self, value: self._set('macs', value))
+    size = property(lambda self: self._get('sizes'))
+    score = property(lambda self: self._get('scores'),
+                     lambda self, value: self._set('scores', value))
+
+    @property
+    def traces(self):
+        trace_row = self._get('trace_rows')
+        return None if trace_row < 0 else self._registry.availability.get_trace(trace_row)
+
+    def isActive(self, cur_time):
+        online, _ = self._registry.is_active([self._get('client_ids')], cur_time)
+        return bool(online[0])
+
+
+class ClientRegistry(object):
+    """Columnar (struct-of-arrays) registry of client system profiles.
+
+    Clients are stored in dense rows in registration order, and each profile
+    attribute is a NumPy column, so bulk queries over many clients are array
+    operations. Client ids are mapped to rows through an id-indexed array.
+    Infeasible clients keep their row, but are hidden from the mapping API.
+
+    Args:
+        availability (AvailabilityTraces): availability traces that clients refer to by trace row.
+
+    """
+
+    def __init__(self, availability=None, capacity=1024):
+        self.availability = availability
+        self.num_clients = 0
+        self.id_to_row = np.full(capacity, -1, dtype=np.int64)
+
+        self.host_ids = np.zeros(capacity, dtype=np.int64)
+        self.client_ids = np.zeros(capacity, dtype=np.int64)
+        self.compute_speeds = np.zeros(capacity, dtype=np.float64)
+        self.bandwidths = np.ones(capacity, dtype=np.float64)
+        self.macs = np.zeros(capacity, dtype=np.float64)
+        self.sizes = np.zeros(capacity, dtype=np.int64)
+        self.feasible = np.zeros(capacity, dtype=bool)
+        self.scores = np.zeros(capacity, dtype=np.float64)
+        self.trace_rows = np.full(capacity, -1, dtype=np.int64)
+
+    _columns = ('host_ids', 'client_ids', 'compute_speeds', 'bandwidths', 'macs',
+                'sizes', 'feasible', 'scores', 'trace_rows')
+
+    def _reserve(self, num_rows, max_client_id):
+        """Grow the columns and the id mapping (by doubling) to fit the new clients"""
+        capacity = len(self.client_ids)
+        if num_rows > capacity:
+            new_capacity = max(num_rows, 2 * capacity)
+            for column in self._columns:
+                array = getattr(self, column)
+                grown = np.zeros(new_capacity, dtype=array.dtype)
+                if column == 'trace_rows':
+                    grown.fill(-1)
+                grown[:capacity] = array
+                setattr(self, column, grown)
+
+        if max_client_id >= len(self.id_to_row):
+            grown = np.full(max(max_client_id + 1, 2 * len(self.id_to_row)), -1, dtype=np.int64)
+            grown[:len(self.id_to_row)] = self.id_to_row
+            self.id_to_row = grown
+
+    def register(self, host_id, client_id, speed, size, trace_row=-1, feasible=True):
+        """Add a client, or overwrite the profile of a registered one
+
+        Returns:
+            int: the row of this client
+        """
+        client_id = int(client_id)
+        self._reserve(self.num_clients + 1, client_id)
+        row = self.id_to_row[client_id]
+        if row < 0:
+            row = self.num_clients
+            self.num_clients += 1
+            self.id_to_row[client_id] = row
+
+        self.host_ids[row] = int(host_id)
+        self.client_ids[row] = client_id
+        self.compute_speeds[row] = speed['computation']
+        self.bandwidths[row] = speed['communication']
+        self.macs[row] = speed['macs']
+        self.sizes[row] = size
+        self.feasible[row] = feasible
+        self.trace_rows[row] = trace_row
+        return row
+
+    def register_bulk(self, host_id, client_ids, speeds, sizes, trace_rows=None, feasible=None):
+        """Add many clients at once, or overwrite the profiles of registered ones
+
+        Args:
+            host_id (int): executor id of these clients.
+            client_ids (np.ndarray of int): unique client ids.
+            speeds (dict of np.ndarray): 'computation', 'communication' and 'macs' of each client.
+            sizes (np.ndarray of int): number of samples of each client.
+            trace_rows (np.ndarray of int, optional): availability trace of each client, -1 for none.
+            feasible (np.ndarray of bool, optional): whether each client is feasible.
+
+        Returns:
+            np.ndarray: the rows of these clients
+        """
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        if len(client_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        self._reserve(self.num_clients + len(client_ids), int(client_ids.max()))
+        rows = self.id_to_row[client_ids]
+        new_clients = rows < 0
+        rows[new_clients] = np.arange(self.num_clients, self.num_clients + new_clients.sum())
+        self.num_clients += int(new_clients.sum())
+        self.id_to_row[client_ids] = rows
+
+        self.host_ids[rows] = int(host_id)
+        self.client_ids[rows] = client_ids
+        self.compute_speeds[rows] = speeds['computation']
+        self.bandwidths[rows] = speeds['communication']
+        self.macs[rows] = speeds['macs']
+        self.sizes[rows] = sizes
+        self.feasible[rows] = True if feasible is None else feasible
+        self.trace_rows[rows] = -1 if trace_rows is None else trace_rows
+        return rows
+
+    def get_rows(self, client_ids):
+        """Map client ids to their rows
+
+        Args:
+            client_ids (list or np.ndarray of int): client ids.
+
+        Returns:
+            np.ndarray: rows of these clients in the columns.
+        """
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        if client_ids.size > 0 and (client_ids.max() >= len(self.id_to_row) or client_ids.min() < 0):
+            raise KeyError(f"Clients {client_ids} are not registered")
+        rows = self.id_to_row[client_ids]
+        if (rows < 0).any():
+            raise KeyError(f"Clients {client_ids[rows < 0]} are not registered")
+        return rows
+
+    def get_capacity(self, client_ids):
+        return self.macs[self.get_rows(client_ids)]
+
+    def get_size(self, client_ids):
+        return self.sizes[self.get_rows(client_ids)]
+
+    def get_completion_time(self, client_ids, batch_size, upload_step, upload_size, download_size, augmentation_factor=3.0):
+        """Batch version of Client.getCompletionTime
+
+        Returns:
+            tuple of np.ndarray: (computation, communication) latency of each client.
+        """
+        rows = self.get_rows(client_ids)
+        computation = augmentation_factor * batch_size * upload_step * self.compute_speeds[rows] / 1000.
+        communication = (upload_size + download_size) / self.bandwidths[rows]
+        return computation, communication
+
+    def is_active(self, client_ids, cur_time):
+        """Which of these clients are online at cur_time (a scalar or one per client), and until when
+
+        Returns:
+            tuple of np.ndarray: (online, online_until), see AvailabilityTraces.query.
+        """
+        rows = self.get_rows(client_ids)
+        if self.availability is None:
+            return np.ones(len(rows), dtype=bool), np.full(len(rows), np.inf)
+        return self.availability.query(self.trace_rows[rows], cur_time)
+
+    def _row_of(self, client_id):
+        client_id = int(client_id)
+        if 0 <= client_id < len(self.id_to_row):
+            row = self.id_to_row[client_id]
+            if row >= 0 and self.feasible[row]:
+                return row
+        return -1
+
+    def __contains__(self, client_id):
+        return self._row_of(client_id) >= 0
+
+    def __getitem__(self, client_id):
+        row = self._row_of(client_id)
+        if row < 0:
+            raise KeyError(client_id)
+        return ClientView(self, row)
+
+    def __len__(self):
+        return int(self.feasible[:self.num_clients].sum())
+
+    def keys(self):
+        return [str(client_id) for client_id in self.client_ids[:self.num_clients][self.feasible[:self.num_clients]]]
@@ -0,0 +1,96 @@
+import heapq
+import itertools
+
+import numpy as np
+
+# event kinds, in the order they are processed at the same virtual time
+START, FINISH, OFFLINE = 0, 1, 2
+
+
+class EventClock(object):
+    """Discrete-event virtual clock over client start, finish and offline events.
+
+    A client scheduled at start_time with a training duration either finishes at
+    start_time + duration, or goes offline at the end of its current online interval
+    if that comes first. Events are kept in a heap, and consuming them advances the
+    clock, so synchronous rounds and asynchronous aggregation share the same timeline.
+
+    Args:
+        start_time (float): Initial virtual time.
+
+    """
+
+    def __init__(self, start_time=0.):
+        self.now = float(start_time)
+        self._events = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._events)
+
+    def schedule(self, client_ids, start_times, durations, online_until=None):
+        """Schedule the start and the finish (or offline) events of many clients
+
+        Args:
+            client_ids (np.ndarray of int): client ids.
+            start_times (float or np.ndarray): virtual time each client starts at.
+            durations (np.ndarray): execution latency of each client.
+            online_until (np.ndarray, optional): time each client stays online until, inf if None.
+
+        Returns:
+            np.ndarray of float: time of the finish or offline event of each client.
+        """
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        start_times = np.broadcast_to(np.asarray(start_times, dtype=np.float64), client_ids.shape)
+        finish_times = start_times + np.asarray(durations, dtype=np.float64)
+        if online_until is None:
+            completes = np.ones(len(client_ids), dtype=bool)
+            end_times = finish_times
+        else:
+            online_until = np.asarray(online_until, dtype=np.float64)
+            completes = finish_times <= online_until
+            end_times = np.where(completes, finish_times, np.maximum(start_times, online_until))
+
+        self._events.extend(zip(start_times.tolist(), itertools.repeat(START), self._seq, client_ids.tolist()))
+        self._events.extend(zip(end_times.tolist(), np.where(completes, FINISH, OFFLINE).tolist(),
+                                self._seq, client_ids.tolist()))
+        heapq.heapify(self._events)
+        return end_times
+
+    def peek(self):
+        """Virtual time of the next event, or None"""
+        return self._events[0][0] if len(self._events) > 0 else None
+
+    def pop(self):
+        """Consume the next event and advance the clock to it
+
+        Returns:
+            tuple: (time, kind, client_id)
+        """
+        time, kind, _, client_id = heapq.heappop(self._events)
+        self.now = max(self.now, time)
+        return time, kind, client_id
+
+    def collect(self, num_clients_to_collect, deadline=None):
+        """Run a synchronous round: consume events until num_clients_to_collect clients
+        finish, or until the deadline, whichever comes first. If nobody finishes by the
+        deadline, the round waits for the first finish, so that it always makes progress.
+        Clients still running at the end are stragglers, and their results are not waited for.
+
+        Returns:
+            tuple: (finished client ids, their finish times, stragglers still running in the order
+            they would finish, dropped clients)
+        """
+        finished, finish_times, dropped = [], [], []
+        while len(self._events) > 0 and len(finished) < num_clients_to_collect:
+            if deadline is not None and self.peek() > deadline and len(finished) > 0:
+                break
+            time, kind, client_id = self.pop()
+            if kind == FINISH:
+                finished.append(client_id)
+                finish_times.append(time)
+            elif kind == OFFLINE:
+                dropped.append(client_id)
+
+        stragglers = [event[3] for event in sorted(event for event in self._events if event[1] == FINISH)]
+        return finished, np.array(finish_times, dtype=np.float64), stragglers, dropped
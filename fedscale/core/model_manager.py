@@ -178,18 +178,16 @@ class SuperModel:
         self.model_update_size = sys.getsizeof(pickle.dumps(torch_model)) // 1024.0 * 8.0
         self.client_records = {}
         self.count = collections.OrderedDict()
+        # params aggregated from deltas in this round, to add back to the global weights
+        self.delta_params = set()
         self.trained_round = 1
         self.inherit = {}
-        self.utilities = defaultdict(int)
         self.average_loss = .0
         if rank == 0:
             for layer in self.get_weighted_layers():
                 self.inherit[layer[1]] = 0
         self.optimizer = ServerOptimizer(self.args.gradient_policy, self.args, self.device)
     
-    def load_utilities(self, utilities: dict):
-        self.utilities = deepcopy(utilities)
-
     def load_inherit(self, inherit):
         self.inherit = inherit
 
@@ -259,94 +257,124 @@ class SuperModel:
 
         # logging.info(f"(DEBUG) tasks required on model {self.rank}: {self.task_round}")
         for p in results['update_weight']:
-            # not add hard model parameters
-            if self.rank != model_id and ('total_ops' in p or 'total_params' in p):
-                continue
+            self.accumulate_weight(p, results['update_weight'][p], model_id, similarity,
+                                   delta=results.get('delta', False))
+        # deltas that are all zeros are not uploaded, but the client still counts in the average
+        for p, shape in results.get('unchanged_weight', {}).items():
+            self.accumulate_weight(p, None, model_id, similarity, delta=True, shape=shape)
 
-            weights = results['update_weight'][p]
-
-            matched = False
-            for param_name in self.model_weights:
-                param_name_prefix = ".".join(param_name.split('.')[:-1])
-                p_prefix = ".".join(p.split('.')[:-1])
-                param_name_surfix = param_name.split('.')[-1]
-                p_surfix = p.split('.')[-1]
-                if p_prefix in param_name_prefix and p_surfix == param_name_surfix:
-                    if p_prefix != param_name_prefix:
-                        tail = param_name_prefix[:len(p_prefix)]
-                        if tail[1] == '0':
-                            # inserted layer is composed by a module list
-                            matched = True
-                            p = param_name
-                            break
-                    else:
-                        matched = True
-                        break
-                
-            if not matched:
-                continue
+        # update gradient buffer and current loss if necessary
+        if model_id == self.rank:
+            self.curr_loss[client_id] = results['moving_loss']
+            self.update_gradient_buffer(cap, results)
 
-            assert p in self.model_weights
+        # aggregate weights
+        self.weighted_average_weights()
 
-            d_type = self.model_weights[p].data.dtype
+    def partial_weight_aggregation(self, partial, model_id, similarity):
+        """Aggregate a PartialAggregate, i.e., the summed updates of several clients of model_id,
+        as if the updates of its clients were aggregated one by one"""
+        if self.converging and model_id != self.rank:
+            return
 
-            # init count and model weights
-            if self.model_in_update == 1 or p not in self.count:
-                self.count[p] = torch.zeros_like(self.model_weights[p].data)
-                self.model_weights[p].data = torch.zeros_like(self.model_weights[p].data)
+        if model_id > self.rank or self.task_round == 0:
+            return
 
-            if self.model_weights[p].data.dim() == 0:
-                self.count[p] = torch.tensor(0)
-                self.model_weights[p].data = weights
-            elif self.model_weights[p].data.dim() == 1:
-                dim1 = weights.shape[0]
-                if self.rank == model_id:
-                    self.count[p][:dim1] += torch.ones(dim1)
-                    self.model_weights[p].data[:dim1] += weights
-                else:
-                    if self.args.agg_mode == "nodecay":
-                        self.count[p][:dim1] += torch.ones(dim1)
-                        self.model_weights[p].data[:dim1] += (weights).to(dtype=d_type)
-                    else:
-                        self.count[p][:dim1] += torch.ones(dim1) * similarity / float(self.trained_round)
-                        self.model_weights[p].data[:dim1] += (weights * similarity / float(self.trained_round)).to(dtype=d_type)
-            elif self.model_weights[p].data.dim() == 2:
-                dim1, dim2 = weights.shape
-                if self.rank == model_id:
-                    self.count[p][:dim1, :dim2] += torch.ones((dim1, dim2))
-                    self.model_weights[p].data[:dim1, :dim2] += weights
-                else:
-                    if self.args.agg_mode == "nodecay":
-                        self.count[p][:dim1, :dim2] += torch.ones((dim1, dim2))
-                        self.model_weights[p].data[:dim1, :dim2] += (weights).to(dtype=d_type)
-                    else:
-                        self.count[p][:dim1, :dim2] += torch.ones((dim1, dim2)) * similarity / float(self.trained_round)
-                        self.model_weights[p].data[:dim1, :dim2] += (weights * similarity / float(self.trained_round)).to(dtype=d_type)
-            elif self.model_weights[p].data.dim() == 4:
-                dim1, dim2, dim3, dim4 = weights.shape
-                if self.rank == model_id:
-                    self.count[p][:dim1, :dim2, :dim3, :dim4] += torch.ones((dim1, dim2, dim3, dim4))
-                    self.model_weights[p].data[:dim1, :dim2, :dim3, :dim4] += weights
-                else:
-                    if self.args.agg_mode == "nodecay":
-                        self.count[p][:dim1, :dim2, :dim3, :dim4] += torch.ones((dim1, dim2, dim3, dim4))
-                        self.model_weights[p].data[:dim1, :dim2, :dim3, :dim4] += (weights).to(dtype=d_type)
-                    else:
-                        self.count[p][:dim1, :dim2, :dim3, :dim4] += torch.ones((dim1, dim2, dim3, dim4)) \
-                                                                    * similarity / float(self.trained_round)
-                        self.model_weights[p].data[:dim1, :dim2, :dim3, :dim4] += (weights * similarity / float(
-                            self.trained_round)).to(dtype=d_type)
-            else:
-                raise Exception(f"model manager does not support the aggregation of weights of dim {self.model_weights[p].data.dim()}")
+        # clients with a NaN loss were left out of the sums
+        if len(partial.skipped) > 0:
+            logging.info(f"skip aggregation of clients {[client['clientId'] for client in partial.skipped]} "
+                         f"with unexpected training loss")
+            self.task_round -= len(partial.skipped)
+        if len(partial.clients) == 0:
+            self.weighted_average_weights()
+            return
+
+        for client in partial.clients:
+            if client['clientId'] not in self.client_records:
+                self.client_records[client['clientId']] = ClientRecord([], 0)
+            self.client_records[client['clientId']].training_loss.append(client['moving_loss'])
+
+        # buffers are reset by the first update of the round
+        self.model_in_update += 1
+        for p in partial.weight_sums:
+            self.accumulate_weight(p, partial.weight_sums[p], model_id, similarity,
+                                   delta=partial.delta, num=partial.counts[p])
+        for p, (shape, num) in partial.unchanged.items():
+            self.accumulate_weight(p, None, model_id, similarity, delta=True, num=num, shape=shape)
+        self.model_in_update += len(partial.clients) - 1
 
-        # update gradient buffer and current loss if necessary
         if model_id == self.rank:
-            self.curr_loss[client_id] = results['moving_loss']
-            self.update_gradient_buffer(cap, results)
+            for client in partial.clients:
+                self.curr_loss[client['clientId']] = client['moving_loss']
+                self.update_gradient_buffer(client['cap'], client)
 
-        # aggregate weights
         self.weighted_average_weights()
 
+    def match_param(self, p):
+        """Name of the weight of this model that the weight p of a (smaller) model is aggregated into, or None"""
+        for param_name in self.model_weights:
+            param_name_prefix = ".".join(param_name.split('.')[:-1])
+            p_prefix = ".".join(p.split('.')[:-1])
+            param_name_surfix = param_name.split('.')[-1]
+            p_surfix = p.split('.')[-1]
+            if p_prefix in param_name_prefix and p_surfix == param_name_surfix:
+                if p_prefix != param_name_prefix:
+                    tail = param_name_prefix[:len(p_prefix)]
+                    if tail[1] == '0':
+                        # inserted layer is composed by a module list
+                        return param_name
+                else:
+                    return p
+        return None
+
+    def accumulate_weight(self, p, weights, model_id, similarity, delta=False, num=1, shape=None):
+        """Add the weights p of a client of model_id (or the sum of num clients) into the
+        aggregation buffer of the overlapping slice, and count the contributions per element.
+        With weights None, only count num clients whose delta of p (of the given shape) is zero."""
+        # not add hard model parameters
+        if self.rank != model_id and ('total_ops' in p or 'total_params' in p):
+            return
+
+        p = self.match_param(p)
+        if p is None:
+            return
+
+        assert p in self.model_weights
+        if delta:
+            self.delta_params.add(p)
+
+        d_type = self.model_weights[p].data.dtype
+
+        # init count and model weights
+        if self.model_in_update == 1 or p not in self.count:
+            self.count[p] = torch.zeros_like(self.model_weights[p].data)
+            self.model_weights[p].data = torch.zeros_like(self.model_weights[p].data)
+
+        if self.model_weights[p].data.dim() == 0:
+            self.count[p] = torch.tensor(0)
+            if weights is not None:
+                self.model_weights[p].data = weights
+            return
+        if weights is not None:
+            shape = weights.shape
+        if len(shape) != self.model_weights[p].data.dim():
+            raise Exception(f"model manager does not support the aggregation of weights of dim {len(shape)} "
+                            f"into dim {self.model_weights[p].data.dim()}")
+
+        overlap = tuple(slice(0, dim) for dim in shape)
+        if self.rank == model_id:
+            self.count[p][overlap] += num
+            if weights is not None:
+                self.model_weights[p].data[overlap] += weights
+        elif self.args.agg_mode == "nodecay":
+            self.count[p][overlap] += num
+            if weights is not None:
+                self.model_weights[p].data[overlap] += (weights).to(dtype=d_type)
+        else:
+            self.count[p][overlap] += num * similarity / float(self.trained_round)
+            if weights is not None:
+                self.model_weights[p].data[overlap] += (weights * similarity / float(self.trained_round)).to(dtype=d_type)
+
     def weighted_average_weights(self):
         if self.model_in_update == self.task_round:
             self.trained_round += 1
@@ -360,6 +388,12 @@ class SuperModel:
                     self.model_weights[p].data = torch.div(
                         self.model_weights[p].data,
                         self.count[p].to(dtype=d_type)).to(dtype=d_type)
+            # averaged deltas are applied to the global weights, which stay in torch_model during the round
+            if len(self.delta_params) > 0:
+                global_weights = self.torch_model.state_dict()
+                for p in self.delta_params:
+                    self.model_weights[p].data = global_weights[p].data + self.model_weights[p].data
+                self.delta_params = set()
             # calculate average gradient
             for l in self.model_grads_buffer:
                 if self.gradient_in_update > 0:
@@ -659,11 +693,31 @@ class Model_Manager():
         self.models = []
         self.args = args
         self.device = device
+        # utilities[client_id, model_id], grown by a row block on new clients and by a column on new models
+        self.utilities = np.zeros((1024, 0), dtype=np.float32)
         self.add_model(init_model)
         self.similarities = [[1]]
 
     def add_model(self, torch_model):
         self.models.append(SuperModel(torch_model, self.args, len(self.models), self.device, set()))
+        self.add_utility_column()
+
+    def add_utility_column(self, parent_id=None):
+        """Add the utility column of a new model, inherited from model parent_id if given"""
+        column = self.utilities[:, parent_id:parent_id+1] if parent_id is not None \
+            else np.zeros((len(self.utilities), 1), dtype=np.float32)
+        self.utilities = np.concatenate([self.utilities, column], axis=1)
+
+    def reserve_clients(self, max_client_id):
+        """Grow the utility rows (by doubling) to fit client max_client_id"""
+        if max_client_id >= len(self.utilities):
+            grown = np.zeros((max(max_client_id + 1, 2 * len(self.utilities)), self.utilities.shape[1]), dtype=np.float32)
+            grown[:len(self.utilities)] = self.utilities
+            self.utilities = grown
+
+    def get_utility(self, client_id, model_id):
+        client_id = int(client_id)
+        return self.utilities[client_id, model_id].item() if client_id < len(self.utilities) else 0.
 
     def get_latest_model(self):
         return self.models[-1].torch_model
@@ -683,6 +737,7 @@ class Model_Manager():
         # TODO: do not drop the last model
         self.models[-1] = None
         self.models.append(SuperModel(new_model, self.args, len(self.models), self.device, last_scaled_layer))
+        self.add_utility_column()
         return self.models[-1].torch_model
     
     def model_scale(self):
@@ -702,9 +757,9 @@ class Model_Manager():
         new_inherit = self.generate_inherit(new_super_model, super_model)
 
         new_super_model.load_inherit(new_inherit)
-        new_super_model.load_utilities(super_model.utilities)
 
         self.models.append(new_super_model)
+        self.add_utility_column(parent_id=super_model.rank)
 
         self.similarities.append([])
 
@@ -727,6 +782,7 @@ class Model_Manager():
         new_super_model.load_inherit(new_inherit)
 
         self.models.append(new_super_model)
+        self.add_utility_column()
 
         self.similarities.append([])
 
@@ -843,6 +899,18 @@ class Model_Manager():
             model.soft_weight_aggregation(results, model_id, similarity)
                 # self.models[idx] = None
 
+    def partial_aggregation(self, partial, model_id):
+        """Aggregate the summed updates of several clients of model_id (see weight_aggregation)"""
+        for idx, model in enumerate(self.models):
+            assert isinstance(model, SuperModel)
+            if model.converged:
+                model.terminate()
+                continue
+            similarity = self.similarities[model_id][idx]
+            if not self.args.soft_agg:
+                similarity = 1.
+            model.partial_weight_aggregation(partial, model_id, similarity)
+
 
     def save_last_param(self):
         for super_model in self.models:
@@ -990,30 +1058,18 @@ class Model_Manager():
         return assignment, model_training
 
     def get_probabilities(self, client_id, candidate_models):
-        utilities = {}
-        for model_id, super_model in candidate_models:
-            utilities[model_id] = super_model.utilities[client_id]
-            if utilities[model_id] == 0:
-                utilities[model_id] = 0.1
-                # normalize utility
-        base = .0
-        max_shift = max([utilities[model_id] for model_id in utilities])
-        for model_id in utilities:
-            utilities[model_id] -= max_shift
-        for model_id in utilities:
-            base += math.exp(utilities[model_id])
-        for model_id in utilities:
-            utilities[model_id] = math.exp(utilities[model_id]) / base
-        # logging.info(f"normalized utility for client {client_id}: {utilities}")
-                # generate probabilities
-        utilities_list = [[model_id, utilities[model_id]] for model_id in utilities]
-        models_ids = []
-        probabilities = []
-        for model_id, probability in utilities_list:
-            models_ids.append(model_id)
-            probabilities.append(probability)
+        models_ids = [model_id for model_id, _ in candidate_models]
+        client_id = int(client_id)
+        if client_id < len(self.utilities):
+            utilities = self.utilities[client_id, models_ids].astype(np.float64)
+        else:
+            utilities = np.zeros(len(models_ids))
+        utilities[utilities == 0] = 0.1
+        # normalize utility
+        utilities = np.exp(utilities - utilities.max())
+        probabilities = utilities / utilities.sum()
         # logging.info(f"soft clustering probabilities {probabilities}")
-        return models_ids, probabilities
+        return models_ids, probabilities.tolist()
 
     def standardize_loss(self, clients_loss: dict):
         mean = np.mean(list(clients_loss.values()))
@@ -1035,33 +1091,24 @@ class Model_Manager():
                 continue
             loss = self.models[model_id].curr_loss[client_id]
             clients_loss[client_id] = loss
+        if len(clients_loss) == 0:
+            return
         # self.reset_all_curr_loss()
         clients_loss = self.standardize_loss(clients_loss)
-        
-        for client_id in assignment:
-            model_id = assignment[client_id]
-            super_model = self.models[model_id]
-            assert isinstance(super_model, SuperModel)
-            if super_model.is_converged():
-                logging.info(f"skip update utility of client {client_id} at model {model_id} as model {model_id} is converged")
-                continue
-            loss = clients_loss[client_id]
-            candidate_models = []
-            client_cap = clients_cap[client_id]
-            for idx, super_model in enumerate(self.models):
-                assert isinstance(super_model, SuperModel)
-                if super_model.macs <= client_cap:
-                    candidate_models.append([idx, super_model])
-            if len(candidate_models) == 0:
-                # logging.info(f"no candidate model for client {client_id}, using the default model (0)")
-                # candidate_models = [[model_id, self.models[model_id]]]
-                continue
-            # logging.info(f"calculating utility for client on {len(candidate_models)} models")
-            for candidate_model in candidate_models:
-                reward = loss * self.similarities[model_id][candidate_model[0]]
-                # logging.info(f"Reward of client {client_id} model {candidate_model[1].rank} {reward}")
-                candidate_model[1].utilities[client_id] -= reward
-                # logging.info(f"Utility of client {client_id} model {candidate_model[1].rank} {candidate_model[1].utilities[client_id]}")
+
+        client_ids = list(clients_loss)
+        rows = np.array([int(client_id) for client_id in client_ids], dtype=np.int64)
+        self.reserve_clients(int(rows.max()))
+        model_ids = np.array([assignment[client_id] for client_id in client_ids], dtype=np.int64)
+        losses = np.array([clients_loss[client_id] for client_id in client_ids], dtype=np.float64)
+        caps = np.array([clients_cap[client_id] for client_id in client_ids], dtype=np.float64)
+        macs = np.array([super_model.macs for super_model in self.models], dtype=np.float64)
+        similarities = np.array(self.similarities, dtype=np.float64)
+
+        # propagate the reward of each client to all candidate models that fit its capacity
+        candidates = macs[None, :] <= caps[:, None]
+        rewards = losses[:, None] * similarities[model_ids] * candidates
+        self.utilities[rows, :len(self.models)] -= rewards.astype(np.float32)
 
     def get_all_models(self):
         models = []
@@ -1124,12 +1171,8 @@ class Model_Manager():
         # for super_model in self.models:
         #     assert isinstance(super_model, SuperModel)
         #     logging.info(f"(MODEL MANAGER STATUS) length of gradient buffer of model {super_model.rank}: {len(super_model.model_grads_buffer)}")
-        # utilities
-        utilities = []
-        for super_model in self.models:
-            assert isinstance(super_model, SuperModel)
-            # logging.info(f"(MODEL MANAGER STATUS) utilities of model {super_model.rank}: {super_model.utilities}")
-            utilities.append(super_model.utilities)
+        # utilities, indexed by [client_id, model_id]
+        utilities = self.utilities
         # curr_loss:
         curr_loss = []
         avg_loss = []
@@ -1,3 +1,4 @@
+import collections
 import threading
 
 from fedscale.core import commons
@@ -10,13 +11,24 @@ class ResourceManager(object):
 
         self.client_run_queue = []
         self.client_run_queue_idx = 0
+        # executor id -> queue of client ids, if clients are pinned to executors
+        self.executor_run_queues = None
         self.experiment_mode = experiment_mode
         self.update_lock = threading.Lock()
 
-    def register_tasks(self, clientsToRun):
+    def register_tasks(self, clientsToRun, executor_tasks=None):
+        """Register the clients to run in this round
+
+        Args:
+            clientsToRun (list of int): Clients ordered by the completion time.
+            executor_tasks (dictionary): executor id -> clients that must run on that executor,
+                e.g., when each executor only holds the data of its own clients.
+        """
         # TODO: append new checkin client
         self.client_run_queue = clientsToRun.copy()
         self.client_run_queue_idx = 0
+        self.executor_run_queues = None if executor_tasks is None else {
+            executor_id: collections.deque(tasks) for executor_id, tasks in executor_tasks.items()}
 
     def get_task_length(self) -> int:
         """Number of tasks left in the queue
@@ -37,7 +49,9 @@ class ResourceManager(object):
     def has_next_task(self, client_id=None):
         # TODO: always has next task
         exist_next_task = False
-        if self.experiment_mode == commons.SIMULATION_MODE:
+        if self.executor_run_queues is not None:
+            exist_next_task = len(self.executor_run_queues.get(client_id, ())) > 0
+        elif self.experiment_mode == commons.SIMULATION_MODE:
             exist_next_task = self.client_run_queue_idx < len(
                 self.client_run_queue)
         else:
@@ -48,7 +62,10 @@ class ResourceManager(object):
         # TODO: remove client id when finish
         next_task_id = None
         self.update_lock.acquire()
-        if self.experiment_mode == commons.SIMULATION_MODE:
+        if self.executor_run_queues is not None:
+            if self.has_next_task(client_id):
+                next_task_id = self.executor_run_queues[client_id].popleft()
+        elif self.experiment_mode == commons.SIMULATION_MODE:
             if self.has_next_task(client_id):
                 next_task_id = self.client_run_queue[self.client_run_queue_idx]
                 self.client_run_queue_idx += 1
@@ -0,0 +1,187 @@
+import csv
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+from fedscale.core.internal.availability import AvailabilityTraces
+
+PROFILE_COLUMNS = ('computation', 'communication', 'macs')
+TRACE_COLUMNS = ('starts', 'ends', 'offsets', 'periods', 'shifted_starts')
+MANIFEST_FILE = 'manifest.json'
+
+
+def get_source_manifest(device_info_file, device_cap_file, device_avail_file=None):
+    """Path, size and modification time of the files a store is converted from, so that
+    a store converted from other or modified files is detected
+
+    Returns:
+        dictionary: JSON-serializable manifest, with None for a missing availability file.
+    """
+    manifest = {}
+    for key, path in (('device_info_file', device_info_file), ('device_cap_file', device_cap_file),
+                      ('device_avail_file', device_avail_file)):
+        if path is None:
+            manifest[key] = None
+            continue
+        stat = os.stat(path)
+        manifest[key] = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return manifest
+
+
+def read_manifest(store_path):
+    """Manifest of the store, or None if it has none (or it cannot be read)"""
+    try:
+        with open(os.path.join(store_path, MANIFEST_FILE)) as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return None
+
+
+def convert_device_profiles(store_path, device_info_file, device_cap_file, device_avail_file=None):
+    """Convert the pickled device profiles, the capacity csv and (optionally) the pickled
+    availability traces into a columnar store of .npy files.
+
+    Only clients whose id is covered by the capacity file are kept, and client i
+    gets the capacity in row i-1, the same as Aggregator.load_client_profile.
+    The source files are recorded in manifest.json (see get_source_manifest).
+
+    Args:
+        store_path (string): Directory of the store.
+        device_info_file (string): Pickled {clientId: {'computation': ..., 'communication': ...}}.
+        device_cap_file (string): Csv of client capacity (MACs), with a header row.
+        device_avail_file (string, optional): Pickled {clientId: {'active', 'inactive', 'finish_time'}}.
+
+    """
+    logging.info(f"Converting device profiles into {store_path} ...")
+    manifest = get_source_manifest(device_info_file, device_cap_file, device_avail_file)
+    cap = {}
+    with open(device_cap_file) as fin:
+        reader = csv.reader(fin)
+        _ = next(reader)
+        for row in reader:
+            cap[int(row[0])] = float(row[1])
+
+    with open(device_info_file, 'rb') as fin:
+        raw_profiles = pickle.load(fin)
+
+    client_ids = sorted(int(client_id) for client_id in raw_profiles if int(client_id) <= len(cap))
+    profiles = {int(client_id): profile for client_id, profile in raw_profiles.items()}
+    columns = {
+        'client_ids': np.array(client_ids, dtype=np.int64),
+        'computation': np.array([profiles[i]['computation'] for i in client_ids], dtype=np.float64),
+        'communication': np.array([profiles[i]['communication'] for i in client_ids], dtype=np.float64),
+        'macs': np.array([cap[i-1] for i in client_ids], dtype=np.float64),
+    }
+    del raw_profiles, profiles
+
+    if device_avail_file is not None:
+        with open(device_avail_file, 'rb') as fin:
+            user_trace = pickle.load(fin)
+        traces = AvailabilityTraces.from_traces([user_trace[key] for key in user_trace])
+        del user_trace
+        for column in TRACE_COLUMNS:
+            columns[f'trace_{column}'] = getattr(traces, column)
+
+    parent_dir = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=parent_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(temp_dir, f'{name}.npy'), column)
+    with open(os.path.join(temp_dir, MANIFEST_FILE), 'w') as fout:
+        json.dump(manifest, fout, indent=2)
+
+    try:
+        # other jobs on this host may have converted the same profiles concurrently
+        os.rename(temp_dir, store_path)
+    except OSError:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class DeviceProfileStore(Mapping):
+    """Memory-mapped columnar store of device profiles and availability traces.
+
+    Columns are opened with mmap_mode='r', so jobs on the same host share the pages.
+    It is a read-only mapping of client id to {'computation', 'communication', 'macs'},
+    and get_profiles looks up many clients at once.
+
+    Args:
+        store_path (string): Directory written by convert_device_profiles.
+
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.client_ids = self._load('client_ids')
+        self.columns = {column: self._load(column) for column in PROFILE_COLUMNS}
+
+    def _load(self, name):
+        return np.load(os.path.join(self.store_path, f'{name}.npy'), mmap_mode='r')
+
+    def has_availability(self):
+        return os.path.exists(os.path.join(self.store_path, 'trace_offsets.npy'))
+
+    def availability(self):
+        """Availability traces of the store, or None if it holds no traces"""
+        if not self.has_availability():
+            return None
+        return AvailabilityTraces(*[self._load(f'trace_{column}') for column in TRACE_COLUMNS])
+
+    def _positions(self, client_ids):
+        """Positions of client_ids in the store, and whether each of them is present"""
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        pos = np.searchsorted(self.client_ids, client_ids)
+        pos = np.minimum(pos, max(len(self.client_ids) - 1, 0))
+        found = (self.client_ids[pos] == client_ids) if len(self.client_ids) > 0 \
+            else np.zeros(len(client_ids), dtype=bool)
+        return pos, found
+
+    def get_profiles(self, client_ids, default_profile):
+        """Profiles of many clients as arrays, with default_profile for missing clients
+
+        Returns:
+            dictionary: 'computation', 'communication' and 'macs' arrays.
+        """
+        pos, found = self._positions(client_ids)
+        return {column: np.where(found, self.columns[column][pos], default_profile[column])
+                for column in PROFILE_COLUMNS}
+
+    def __getitem__(self, client_id):
+        pos, found = self._positions([int(client_id)])
+        if not found[0]:
+            raise KeyError(client_id)
+        return {column: self.columns[column][pos[0]].item() for column in PROFILE_COLUMNS}
+
+    def __iter__(self):
+        return iter(self.client_ids.tolist())
+
+    def __len__(self):
+        return len(self.client_ids)
+
+
+def load_device_profile_store(args):
+    """Open the device profile store of args.device_profile_store, converting
+    the profile, capacity and availability files on first use, or again if the
+    store was converted from other or modified files"""
+    store_path = os.path.expanduser(args.device_profile_store)
+    if os.path.exists(store_path):
+        manifest = get_source_manifest(args.device_conf_file, args.device_cap_file, args.device_avail_file)
+        if read_manifest(store_path) != manifest:
+            logging.info(f"Device profile store {store_path} does not match its source files")
+            # move it aside first, as other jobs may still map its columns
+            stale_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(store_path)))
+            try:
+                os.rename(store_path, os.path.join(stale_dir, 'store'))
+            except OSError:
+                # another job moved it already
+                pass
+            shutil.rmtree(stale_dir, ignore_errors=True)
+    if not os.path.exists(store_path):
+        convert_device_profiles(store_path, args.device_conf_file, args.device_cap_file,
+                                args.device_avail_file)
+    return DeviceProfileStore(store_path)
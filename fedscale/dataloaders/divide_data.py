@@ -1,17 +1,40 @@
 # -*- coding: utf-8 -*-
 import csv
+import fcntl
+import hashlib
 import logging
-import random
+import os
+import shutil
+import tempfile
 import time
 from collections import defaultdict
 from random import Random
 
 import numpy as np
+import pandas as pd
 from torch.utils.data import DataLoader
 
 #from argParser import args
 
 
+def get_client_partition(rank, num_executors, num_clients):
+    """Clients (1-based ids) whose data is held by executor rank (1-based).
+    Clients are split into contiguous ranges, and the last executor takes the remainder."""
+    clients_per_executor = num_clients // num_executors
+    first_client = (rank - 1) * clients_per_executor + 1
+    if rank != num_executors:
+        return range(first_client, rank * clients_per_executor + 1)
+    return range(first_client, num_clients + 1)
+
+
+def get_client_executor(client_id, num_executors, num_clients):
+    """Rank of the executor that holds the data of client_id, see get_client_partition"""
+    clients_per_executor = num_clients // num_executors
+    if clients_per_executor == 0:
+        return num_executors
+    return min((client_id - 1) // clients_per_executor + 1, num_executors)
+
+
 class Partition(object):
     """ Dataset partitioning helper """
 
@@ -27,13 +50,94 @@ class Partition(object):
         return self.data[data_idx]
 
 
+def hash_data_map(data_map_file, chunk_size=1 << 24):
+    """Return the sha1 digest of a data map file, used as the key of its cached partition map"""
+    digest = hashlib.sha1()
+    with open(data_map_file, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_data_map(data_map_file):
+    """Parse data_map_file into a CSR-style partition map.
+
+    Returns:
+        tuple of np.ndarray: (index, offsets, label_num). The sample ids of client i are
+        index[offsets[i]:offsets[i+1]], in file order, and label_num[i] is its number of unique labels.
+        Client ids are numbered in order of first appearance, as in the data map.
+    """
+    with open(data_map_file) as csv_file:
+        header = next(csv.reader(csv_file, delimiter=','))
+    logging.info(f'Trace names are {", ".join(header)}')
+
+    trace = pd.read_csv(data_map_file, usecols=[0, len(header)-1], dtype=str,
+                        keep_default_na=False)
+    client_codes, client_ids = pd.factorize(trace.iloc[:, 0], sort=False)
+    label_codes, labels = pd.factorize(trace.iloc[:, -1], sort=False)
+    num_clients = len(client_ids)
+
+    client_codes = client_codes.astype(np.int64)
+    index = np.argsort(client_codes, kind='stable')
+    offsets = np.zeros(num_clients + 1, dtype=np.int64)
+    np.cumsum(np.bincount(client_codes, minlength=num_clients), out=offsets[1:])
+
+    client_labels = np.unique(client_codes * max(len(labels), 1) + label_codes)
+    label_num = np.bincount(client_labels // max(len(labels), 1), minlength=num_clients)
+
+    return index, offsets, label_num
+
+
+def load_partition_map(data_map_file, cache_dir=None):
+    """Load the partition map of data_map_file, parsing the csv only on cache miss.
+
+    The parsed map is cached as .npy arrays under cache_dir/<sha1 of csv>, and is
+    memory-mapped read-only, so all executors on a host share the same pages, and only
+    read the pages of the clients they use. On a cache miss, one executor of the host
+    parses the csv while the others wait for it.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(data_map_file)), '.partition_cache')
+    names = ('index', 'offsets', 'label_num')
+
+    try:
+        map_dir = os.path.join(cache_dir, hash_data_map(data_map_file))
+        if not os.path.exists(map_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(f'{map_dir}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not os.path.exists(map_dir):
+                    partition_map = parse_data_map(data_map_file)
+                    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+                    for name, array in zip(names, partition_map):
+                        np.save(os.path.join(temp_dir, f'{name}.npy'), array)
+                    try:
+                        # executors on other hosts may have completed the same map concurrently
+                        os.rename(temp_dir, map_dir)
+                    except OSError:
+                        shutil.rmtree(temp_dir, ignore_errors=True)
+        else:
+            logging.info(f"Loading cached partition map {map_dir} ...")
+
+        return tuple(np.load(os.path.join(map_dir, f'{name}.npy'), mmap_mode='r') for name in names)
+    except OSError as e:
+        logging.warning(f"Failed to cache partition map of {data_map_file} in {cache_dir}: {e}")
+        return parse_data_map(data_map_file)
+
+
 class DataPartitioner(object):
-    """Partition data by trace or random"""
+    """Partition data by trace or random.
+
+    Partitions are stored CSR-style: the sample ids of client i are
+    partition_index[partition_offsets[i]:partition_offsets[i+1]].
+    """
 
     def __init__(self, data, args, numOfClass=0, seed=10, isTest=False):
-        self.partitions = []
+        self.partition_index = np.zeros(0, dtype=np.int64)
+        self.partition_offsets = np.zeros(1, dtype=np.int64)
         self.rng = Random()
         self.rng.seed(seed)
+        self.np_rng = np.random.RandomState(seed)
 
         self.data = data
         self.labels = self.data.targets
@@ -44,7 +148,9 @@ class DataPartitioner(object):
         self.data_len = len(self.data)
         self.task = args.task
         self.numOfLabels = numOfClass
-        self.client_label_cnt = defaultdict(set)
+        self.client_label_num = None
+        # partitions [first, last) whose sample ids are kept in partition_index
+        self.retained_partitions = None
 
     def getNumOfLabels(self):
         return self.numOfLabels
@@ -53,112 +159,184 @@ class DataPartitioner(object):
         return self.data_len
 
     def getClientLen(self):
-        return len(self.partitions)
+        return len(self.partition_offsets) - 1
 
     def getClientLabel(self):
-        return [len(self.client_label_cnt[i]) for i in range(self.getClientLen())]
-
-    def trace_partition(self, data_map_file):
+        if self.client_label_num is None:
+            return [0] * self.getClientLen()
+        return self.client_label_num.tolist()
+
+    def get_partition(self, partition):
+        """Return the sample ids of a partition as an array"""
+        base = 0
+        if self.retained_partitions is not None:
+            first, last = self.retained_partitions
+            assert first <= partition < last, f"Partition {partition} is not held by this partitioner"
+            base = self.partition_offsets[first]
+        return self.partition_index[self.partition_offsets[partition]-base:self.partition_offsets[partition+1]-base]
+
+    def retain_partitions(self, first, last):
+        """Only keep the sample ids of partitions [first, last), while the sizes of all partitions
+        are still reported by getSize. Partitions must be retained before any other is used."""
+        assert self.retained_partitions is None, "Partitions have been retained already"
+        first = min(max(first, 0), self.getClientLen())
+        last = min(max(last, first), self.getClientLen())
+        self.partition_index = np.array(
+            self.partition_index[self.partition_offsets[first]:self.partition_offsets[last]])
+        self.retained_partitions = (first, last)
+
+    def get_held_partitions(self, num_clients, executor):
+        """Partitions [first, last) of the clients held by executor (see get_client_partition),
+        or all of them if executor is None"""
+        if executor is None:
+            return 0, num_clients
+        clients = get_client_partition(executor[0], executor[1], num_clients)
+        return min(clients.start - 1, num_clients), min(max(clients.stop - 1, clients.start - 1), num_clients)
+
+    def trace_partition(self, data_map_file, executor=None):
         """Read data mapping from data_map_file. Format: <client_id, sample_name, sample_category, category_id>"""
         logging.info(f"Partitioning data by profile {data_map_file}...")
 
-        clientId_maps = {}
-        unique_clientIds = {}
-        # load meta data from the data_map_file
-        with open(data_map_file) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            read_first = True
-            sample_id = 0
-
-            for row in csv_reader:
-                if read_first:
-                    logging.info(f'Trace names are {", ".join(row)}')
-                    read_first = False
-                else:
-                    client_id = row[0]
-
-                    if client_id not in unique_clientIds:
-                        unique_clientIds[client_id] = len(unique_clientIds)
-
-                    clientId_maps[sample_id] = unique_clientIds[client_id]
-                    self.client_label_cnt[unique_clientIds[client_id]].add(
-                        row[-1])
-                    sample_id += 1
-
-        # Partition data given mapping
-        self.partitions = [[] for _ in range(len(unique_clientIds))]
-
-        for idx in range(sample_id):
-            self.partitions[clientId_maps[idx]].append(idx)
+        self.partition_index, self.partition_offsets, self.client_label_num = load_partition_map(
+            data_map_file, cache_dir=self.args.partition_cache_dir)
+        if executor is not None:
+            # only the pages of the sample ids of held clients are read from the cached map
+            self.retain_partitions(*self.get_held_partitions(self.getClientLen(), executor))
 
     def cifar_noniid_partition(self, num_clients: int, label_split=None):
         logging.info(num_clients)
         num_class = 10
         class_per_client = 2
-        shard_per_class = num_clients * class_per_client // num_class
-        assert shard_per_class % 1 == 0
-        label_idx_split = {}
-        for i in range(len(self.labels)):
-            label_i = self.labels[i]
-            if label_i not in label_idx_split:
-                label_idx_split[label_i] = []
-            label_idx_split[label_i].append(i)
-        for label in label_idx_split:
-            label_idx = label_idx_split[label]
-            num_leftover = len(label_idx) % shard_per_class
-            leftover = label_idx[-num_leftover:] if num_leftover > 0 else []
-            new_label_idx = np.array(label_idx[:-num_leftover]) if num_leftover > 0 else np.array(label_idx)
-            new_label_idx = new_label_idx.reshape((shard_per_class, -1)).tolist()
-            for i, leftover_label_idx in enumerate(leftover):
-                new_label_idx[i] = np.concatenate([new_label_idx[i], [leftover_label_idx]])
-            label_idx_split[label] = new_label_idx
-
-        if label_split == None:
-            label_split = [list(range(num_class)) for _ in range(num_clients * class_per_client)]
-            for i in range(len(label_split)):
-                random.shuffle(label_split[i])
-            label_split = np.array(label_split)
-            label_split = label_split.reshape(-1,2)
-        
-        self.partitions = []
-        for client_idx in range(num_clients):
-            label_partition = label_split[client_idx]
-            resultIdx = []
-            for label in label_partition:
-                resultIdx += label_idx_split[label][0]
-                label_idx_split[label].pop(0)
-            self.partitions.append(resultIdx)
+        # rounded up, so a last partial permutation of the classes still finds its shards
+        shard_per_class = -(-num_clients * class_per_client // num_class)
+        assert shard_per_class > 0, "Need at least one client for non-iid partition"
+
+        labels = np.asarray(self.labels, dtype=np.int64)
+        label_order = np.argsort(labels, kind='stable')
+        class_size = np.bincount(labels, minlength=num_class)
+        class_start = np.cumsum(class_size) - class_size
+        shard_len = class_size // shard_per_class
+
+        if label_split is None:
+            # consecutive clients walk through random permutations of the classes, so every
+            # num_class // class_per_client clients take each class exactly once
+            label_split = np.argsort(self.np_rng.random_sample(
+                (shard_per_class, num_class)), axis=1).reshape(-1, class_per_client)
+        label_split = np.asarray(label_split)
+
+        # the k-th client taking a class gets the k-th shard of that class
+        client_labels = label_split[:num_clients].reshape(-1)
+        occurrence = np.argsort(client_labels, kind='stable')
+        shard_id = np.empty_like(client_labels)
+        shard_id[occurrence] = np.arange(len(client_labels)) - \
+            np.searchsorted(client_labels[occurrence], client_labels[occurrence])
+        assert (shard_id < shard_per_class).all(), "Not enough shards for the label split"
+
+        # shard s of a class holds samples [s*shard_len, (s+1)*shard_len) of that class,
+        # plus its s-th leftover sample if the class does not split evenly
+        base_len = shard_len[client_labels]
+        shard_size = base_len + (shard_id < class_size[client_labels] % shard_per_class)
+        shard = np.repeat(np.arange(len(client_labels)), shard_size)
+        position = np.arange(shard_size.sum()) - np.repeat(np.cumsum(shard_size) - shard_size, shard_size)
+        sample_pos = class_start[client_labels[shard]] + np.where(
+            position < base_len[shard], shard_id[shard] * base_len[shard] + position,
+            shard_per_class * base_len[shard] + shard_id[shard])
+
+        self.partition_index = label_order[sample_pos]
+        self.partition_offsets = np.zeros(num_clients + 1, dtype=np.int64)
+        np.cumsum(shard_size.reshape(num_clients, class_per_client).sum(axis=1), out=self.partition_offsets[1:])
         return label_split
 
-
-    def partition_data_helper(self, num_clients, data_map_file=None, is_hetero_cifar=False, label_split=None):
-
+    def dirichlet_partition(self, num_clients, alpha, executor=None):
+        """Label skew: the samples of each class are split across clients by proportions drawn from Dir(alpha)"""
+        logging.info(f"Partitioning {self.getDataLen()} samples with label skew Dir({alpha})... Test is {self.isTest}")
+        _, labels = np.unique(np.asarray(self.labels), return_inverse=True)
+        num_class = labels.max() + 1 if len(labels) > 0 else 0
+        class_size = np.bincount(labels, minlength=num_class)
+        class_start = np.cumsum(class_size) - class_size
+
+        # samples sorted by class, in random order within each class
+        order = np.lexsort((self.np_rng.random_sample(len(labels)), labels))
+
+        # classes are split one at a time, so that only the sizes of all clients and
+        # the samples of held clients are kept
+        first, last = self.get_held_partitions(num_clients, executor)
+        client_size = np.zeros(num_clients, dtype=np.int64)
+        sample_ids, sample_clients = [], []
+        for label in range(num_class):
+            # client k gets samples [bounds[k-1], bounds[k]) of the class
+            proportions = self.np_rng.dirichlet(np.full(num_clients, alpha))
+            bounds = np.floor(np.cumsum(proportions) * class_size[label]).astype(np.int64)
+            bounds[-1] = class_size[label]
+            client_size += np.diff(bounds, prepend=0)
+
+            start = bounds[first - 1] if first > 0 else 0
+            stop = bounds[last - 1] if last > 0 else 0
+            positions = np.arange(start, stop)
+            sample_ids.append(order[class_start[label] + positions])
+            sample_clients.append(np.searchsorted(bounds[first:last], positions, side='right'))
+
+        sample_ids = np.concatenate(sample_ids) if num_class > 0 else np.zeros(0, dtype=np.int64)
+        sample_clients = np.concatenate(sample_clients) if num_class > 0 else np.zeros(0, dtype=np.int64)
+        self.partition_index = sample_ids[np.argsort(sample_clients, kind='stable')]
+        self.partition_offsets = np.zeros(num_clients + 1, dtype=np.int64)
+        np.cumsum(client_size, out=self.partition_offsets[1:])
+        if executor is not None:
+            self.retained_partitions = (first, last)
+
+    def quantity_skew_partition(self, num_clients, alpha, executor=None):
+        """Quantity skew: client data sizes are proportional to a draw from Dir(alpha)"""
+        data_len = self.getDataLen()
+        logging.info(f"Partitioning {data_len} samples with quantity skew Dir({alpha})... Test is {self.isTest}")
+
+        proportions = self.np_rng.dirichlet(np.full(num_clients, alpha))
+        self.partition_offsets = np.zeros(num_clients + 1, dtype=np.int64)
+        self.partition_offsets[1:] = np.floor(np.cumsum(proportions) * data_len)
+        self.partition_offsets[-1] = data_len
+        first, last = self.get_held_partitions(num_clients, executor)
+        self.partition_index = self.np_rng.permutation(data_len)[
+            self.partition_offsets[first]:self.partition_offsets[last]].copy()
+        if executor is not None:
+            self.retained_partitions = (first, last)
+
+    def partition_data_helper(self, num_clients, data_map_file=None, is_hetero_cifar=False, label_split=None,
+                              partition_method='uniform', executor=None):
+        """Partition the data across clients
+
+        Args:
+            executor (tuple of int, optional): (rank, number of executors). Only the sample ids of
+                the clients held by executor rank (see get_client_partition) are built, while the
+                sizes of all clients are still reported by getSize.
+        """
         if is_hetero_cifar:
-            return self.cifar_noniid_partition(num_clients=num_clients, label_split=label_split)
+            label_split = self.cifar_noniid_partition(num_clients=num_clients, label_split=label_split)
+            if executor is not None:
+                self.retain_partitions(*self.get_held_partitions(num_clients, executor))
+            return label_split
         # read mapping file to partition trace
         if data_map_file is not None:
-            self.trace_partition(data_map_file)
+            self.trace_partition(data_map_file, executor=executor)
+        elif partition_method == 'dirichlet':
+            self.dirichlet_partition(num_clients=num_clients, alpha=self.args.partition_alpha, executor=executor)
+        elif partition_method == 'quantity':
+            self.quantity_skew_partition(num_clients=num_clients, alpha=self.args.partition_alpha, executor=executor)
         else:
-            self.uniform_partition(num_clients=num_clients)
-
+            self.uniform_partition(num_clients=num_clients, executor=executor)
 
-
-    def uniform_partition(self, num_clients):
+    def uniform_partition(self, num_clients, executor=None):
         # random partition
-        numOfLabels = self.getNumOfLabels()
         data_len = self.getDataLen()
         logging.info(f"Randomly partitioning data, {data_len} samples... Test is {self.isTest}")
 
-        indexes = list(range(data_len))
-        self.rng.shuffle(indexes)
-
-        for _ in range(num_clients):
-            part_len = int(1./num_clients * data_len)
-            self.partitions.append(indexes[0:part_len])
-            indexes = indexes[part_len:]
+        part_len = int(1./num_clients * data_len)
+        first, last = self.get_held_partitions(num_clients, executor)
+        self.partition_index = self.np_rng.permutation(data_len)[first * part_len:last * part_len].copy()
+        self.partition_offsets = np.arange(num_clients + 1, dtype=np.int64) * part_len
+        if executor is not None:
+            self.retained_partitions = (first, last)
 
     def use(self, partition, istest):
-        resultIndex = self.partitions[partition]
+        resultIndex = self.get_partition(partition).tolist()
 
         # exeuteLength = len(resultIndex) if not istest else int(
         #     len(resultIndex) * self.args.test_ratio)
@@ -170,7 +348,7 @@ class DataPartitioner(object):
 
     def getSize(self):
         # return the size of samples
-        return {'size': [len(partition) for partition in self.partitions]}
+        return {'size': np.diff(self.partition_offsets).tolist()}
 
 
 def select_dataset(rank, partition, batch_size, args, isTest=False, collate_fn=None):
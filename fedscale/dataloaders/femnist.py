@@ -69,15 +69,8 @@ class FEMNIST():
             tuple: (image, target) where target is index of the target class.
         """
 
-        imgName, target = self.data[index], int(self.targets[index])
-
-        # doing this so that it is consistent with all other datasets
-        # to return a PIL Image
-        img = Image.open(os.path.join(self.root, imgName))
-
-        # avoid channel error
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        target = int(self.targets[index])
+        img = self.load_image(index)
 
         if self.transform is not None:
             img = self.transform(img)
@@ -87,6 +80,17 @@ class FEMNIST():
 
         return img, target
 
+    def load_image(self, index):
+        """Decode the image of a sample as an RGB PIL Image, without any transform"""
+        # doing this so that it is consistent with all other datasets
+        # to return a PIL Image
+        img = Image.open(os.path.join(self.root, self.data[index]))
+
+        # avoid channel error
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img
+
     def __len__(self):
         return len(self.data)
 
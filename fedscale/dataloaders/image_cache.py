@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+from torchvision import transforms
+
+
+def get_source_fingerprint(dataset):
+    """Where the images of dataset come from: its image directory and sample list
+    (client_data_mapping/<split>.csv), with their size and modification time, so that
+    a cache built from other or modified data is not reused.
+
+    Args:
+        dataset (FEMNIST or OpenImage): Dataset providing root and data_file.
+
+    Returns:
+        dictionary: JSON-serializable fingerprint of the source.
+    """
+    fingerprint = {'samples': len(dataset)}
+    for key, path in (('image_dir', os.path.join(dataset.processed_folder, dataset.data_file)),
+                      ('mapping_file', os.path.join(dataset.processed_folder, 'client_data_mapping',
+                                                    dataset.data_file + '.csv'))):
+        stat = os.stat(path)
+        fingerprint[key] = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return fingerprint
+
+
+def build_image_cache(dataset, cache_path, image_size, fingerprint=None):
+    """Decode and resize every image of dataset once into a uint8 array of shape (N, H, W, 3).
+
+    Args:
+        dataset (FEMNIST or OpenImage): Dataset providing load_image(index) and targets.
+        cache_path (string): Directory to store images.npy and targets.npy.
+        image_size (tuple of int): (H, W) of the cached images.
+        fingerprint (dictionary, optional): Source of the images (see get_source_fingerprint),
+            stored as manifest.json in the cache.
+
+    """
+    logging.info(f"Building image cache {cache_path} for {len(dataset)} samples ...")
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+
+    resize = transforms.Resize(image_size)
+    images = np.lib.format.open_memmap(os.path.join(temp_dir, 'images.npy'), mode='w+', dtype=np.uint8,
+                                       shape=(len(dataset), image_size[0], image_size[1], 3))
+    for index in range(len(dataset)):
+        images[index] = np.asarray(resize(dataset.load_image(index)), dtype=np.uint8)
+    images.flush()
+    del images
+    np.save(os.path.join(temp_dir, 'targets.npy'), np.asarray(dataset.targets, dtype=np.int64))
+    if fingerprint is not None:
+        with open(os.path.join(temp_dir, 'manifest.json'), 'w') as manifest:
+            json.dump(fingerprint, manifest, indent=2, sort_keys=True)
+
+    try:
+        # other executors on this host may have completed the same cache concurrently
+        os.rename(temp_dir, cache_path)
+    except OSError:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class CachedImageDataset(object):
+    """Serve an image dataset from the uint8 memory-mapped cache built by build_image_cache.
+
+    Samples are read from the page cache without opening or decoding image files,
+    and transforms (e.g., random flips and normalization) are applied on the float tensors.
+    Caches are keyed by a hash of the source of the images (see get_source_fingerprint),
+    so a change of the data directory or of the data builds a new cache.
+
+    Args:
+        dataset (FEMNIST or OpenImage): The dataset to cache, only used when the cache does not exist.
+        cache_dir (string): Root directory of image caches.
+        name (string): Name of the cache, e.g., femnist_train.
+        image_size (tuple of int): (H, W) of the cached images.
+        transform (callable, optional): Transform on the CHW float tensor in [0, 1].
+        target_transform (callable, optional): Transform on the target.
+
+    """
+
+    def __init__(self, dataset, cache_dir, name, image_size, transform=None, target_transform=None):
+        fingerprint = get_source_fingerprint(dataset)
+        digest = hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:12]
+        self.cache_path = os.path.join(os.path.expanduser(cache_dir),
+                                       f'{name}_{image_size[0]}x{image_size[1]}_{digest}')
+        if not os.path.exists(self.cache_path):
+            build_image_cache(dataset, self.cache_path, image_size, fingerprint=fingerprint)
+
+        self.images = np.load(os.path.join(self.cache_path, 'images.npy'), mmap_mode='r')
+        self.targets = np.load(os.path.join(self.cache_path, 'targets.npy')).tolist()
+        self.transform = transform
+        self.target_transform = target_transform
+
+    def __getitem__(self, index):
+        img = torch.from_numpy(np.array(self.images[index])).permute(2, 0, 1).float().div_(255.)
+        target = self.targets[index]
+
+        if self.transform is not None:
+            img = self.transform(img)
+
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return img, target
+
+    def __len__(self):
+        return len(self.targets)
@@ -158,3 +158,35 @@ def get_data_transform(data: str):
         sys.exit(-1)
 
     return train_transform, test_transform
+
+
+def get_tensor_data_transform(data: str):
+    """Transforms applied on cached images, i.e., CHW float tensors in [0, 1] that
+    have been resized already (see fedscale.dataloaders.image_cache)"""
+    if data == 'mnist':
+        train_transform = transforms.Compose([
+            transforms.RandomHorizontalFlip(),
+            transforms.Normalize((0.1307,), (0.3081,))
+        ])
+
+        test_transform = transforms.Compose([
+            transforms.RandomHorizontalFlip(),
+            transforms.Normalize((0.1307,), (0.3081,))
+        ])
+
+    elif data == 'openImg':
+        train_transform = transforms.Compose([
+            transforms.RandomHorizontalFlip(),
+            transforms.Normalize((0.4914, 0.4822, 0.4465),
+                                 (0.2023, 0.1994, 0.2010)),
+        ])
+
+        test_transform = transforms.Compose([
+            transforms.Normalize((0.4914, 0.4822, 0.4465),
+                                 (0.2023, 0.1994, 0.2010)),
+        ])
+    else:
+        print('Cached data must be {} or {} !'.format('mnist', 'openImg'))
+        sys.exit(-1)
+
+    return train_transform, test_transform
@@ -0,0 +1,93 @@
+import collections
+
+import numpy as np
+
+# A compressed tensor, decoded by the codec named codec into a float32 array of shape
+EncodedTensor = collections.namedtuple('EncodedTensor', ['codec', 'shape', 'dtype', 'payload'])
+
+
+def get_codecs():
+    from fedscale.utils.compressor.qsgd import QSGDCompressor
+    from fedscale.utils.compressor.topk import TopKCompressor
+
+    return {QSGDCompressor.name: QSGDCompressor, TopKCompressor.name: TopKCompressor}
+
+
+def decode_tensor(encoded):
+    """Decode an EncodedTensor into a float32 numpy array"""
+    return get_codecs()[encoded.codec].decompress(encoded)
+
+
+class UpdateCompressor(object):
+    """Encodes the model update of a client as compressed deltas against the downloaded model.
+
+    Only floating point tensors of at least min_size elements are encoded, the rest
+    (e.g., biases, num_batches_tracked) are uploaded as they are. With error feedback,
+    the compression error of each client is kept, and added to its next update.
+
+    Args:
+        codec (QSGDCompressor or TopKCompressor): Codec of the deltas.
+        error_feedback (bool): Whether to keep the compression error per client.
+        min_size (int): Tensors with fewer elements are not compressed.
+
+    """
+
+    def __init__(self, codec, error_feedback=False, min_size=256):
+        self.codec = codec
+        self.error_feedback = error_feedback
+        self.min_size = min_size
+        # (client id, param name) -> residual error
+        self.residuals = {}
+
+    def compression_ratio(self):
+        """Upload size w.r.t. uncompressed float32 weights"""
+        return self.codec.compression_ratio()
+
+    def encode(self, client_id, weights, base_weights=None):
+        """Encode the trained weights of client_id
+
+        Args:
+            client_id (int): Client id, which keys the residual error.
+            weights (dict of np.ndarray): Trained weights, or their deltas if base_weights is None.
+            base_weights (dict of np.ndarray, optional): Weights of the downloaded model.
+
+        Returns:
+            dict: EncodedTensor of the delta of each encoded weight, and the other weights as they are.
+        """
+        update = {}
+        for p, weight in weights.items():
+            if weight.dtype.kind != 'f' or weight.size < self.min_size:
+                update[p] = weight
+                continue
+            if base_weights is None:
+                delta = weight.astype(np.float32)
+            else:
+                base = base_weights.get(p)
+                if base is None or base.shape != weight.shape:
+                    update[p] = weight
+                    continue
+                delta = weight.astype(np.float32) - base
+            if self.error_feedback:
+                residual = self.residuals.get((client_id, p))
+                if residual is not None and residual.shape == delta.shape:
+                    delta += residual
+            encoded = self.codec.compress(delta)
+            if self.error_feedback:
+                self.residuals[(client_id, p)] = delta - decode_tensor(encoded)
+            update[p] = encoded
+        return update
+
+
+def load_compressor(args):
+    """Create the upload compressor of args.compressor, or None without compression"""
+    if args.compressor == 'none':
+        return None
+
+    codecs = get_codecs()
+    if args.compressor == 'qsgd':
+        codec = codecs['qsgd'](bits=args.quantize_bits, seed=args.this_rank)
+    elif args.compressor == 'topk':
+        codec = codecs['topk'](ratio=args.topk_ratio)
+    else:
+        raise ValueError(f"Unknown compressor {args.compressor}")
+    return UpdateCompressor(codec, error_feedback=args.error_feedback)
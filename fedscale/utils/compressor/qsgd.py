@@ -0,0 +1,60 @@
+import numpy as np
+
+from fedscale.utils.compressor.codec import EncodedTensor
+
+
+class QSGDCompressor(object):
+    """Stochastic uniform quantization of a tensor to int8 or packed 4-bit levels.
+
+    Each element is scaled by the max magnitude of the tensor, and rounded up or down
+    at random in proportion to its distance to the two nearest levels, so the
+    quantization is unbiased. (QSGD, Alistarh et al., NeurIPS 2017)
+
+    Args:
+        bits (int): Bits per element, 8 or 4.
+        seed (int): Seed of the stochastic rounding.
+
+    """
+    name = 'qsgd'
+
+    def __init__(self, bits=8, seed=None):
+        assert bits in (4, 8), f"QSGD supports 4 or 8 bits, not {bits}"
+        self.bits = bits
+        self.levels = 2 ** (bits - 1) - 1
+        self.rng = np.random.RandomState(seed)
+
+    def compression_ratio(self):
+        return self.bits / 32.
+
+    def compress(self, tensor):
+        flat = tensor.astype(np.float32, copy=False).ravel()
+        max_norm = float(np.abs(flat).max()) if flat.size > 0 else 0.
+        if max_norm == 0.:
+            levels = np.zeros(flat.size, dtype=np.int8)
+        else:
+            scaled = np.abs(flat) * (self.levels / max_norm)
+            levels = np.floor(scaled + self.rng.random_sample(flat.size)).astype(np.int8)
+            levels = np.copysign(levels, flat).astype(np.int8)
+
+        if self.bits == 4:
+            # two levels in [-7, 7] per byte, offset to [1, 15]
+            nibbles = (levels + 8).astype(np.uint8)
+            if nibbles.size % 2 == 1:
+                nibbles = np.append(nibbles, np.uint8(8))
+            levels = (nibbles[0::2] << 4) | nibbles[1::2]
+
+        return EncodedTensor(self.name, tensor.shape, tensor.dtype.str,
+                             {'bits': self.bits, 'scale': max_norm / self.levels, 'levels': levels})
+
+    @staticmethod
+    def decompress(encoded):
+        payload = encoded.payload
+        levels = payload['levels']
+        size = int(np.prod(encoded.shape))
+        if payload['bits'] == 4:
+            nibbles = np.empty(2 * levels.size, dtype=np.int8)
+            nibbles[0::2] = (levels >> 4).astype(np.int8)
+            nibbles[1::2] = (levels & 0x0F).astype(np.int8)
+            levels = nibbles[:size] - 8
+        tensor = levels.astype(np.float32) * np.float32(payload['scale'])
+        return tensor.reshape(encoded.shape)
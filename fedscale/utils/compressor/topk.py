@@ -0,0 +1,40 @@
+import math
+
+import numpy as np
+
+from fedscale.utils.compressor.codec import EncodedTensor
+
+
+class TopKCompressor(object):
+    """Top-k sparsification: keep the k elements of largest magnitude and their indices.
+
+    Args:
+        ratio (float): Fraction of the elements to keep.
+
+    """
+    name = 'topk'
+
+    def __init__(self, ratio=0.01):
+        assert 0. < ratio <= 1., f"Top-k ratio should be in (0, 1], not {ratio}"
+        self.ratio = ratio
+
+    def compression_ratio(self):
+        # a float32 value and an int32 index per kept element
+        return min(1., 2. * self.ratio)
+
+    def compress(self, tensor):
+        flat = tensor.astype(np.float32, copy=False).ravel()
+        k = min(flat.size, max(1, int(math.ceil(self.ratio * flat.size))))
+        if k < flat.size:
+            indices = np.argpartition(np.abs(flat), flat.size - k)[flat.size - k:]
+        else:
+            indices = np.arange(flat.size)
+        index_type = np.int32 if flat.size < 2 ** 31 else np.int64
+        return EncodedTensor(self.name, tensor.shape, tensor.dtype.str,
+                             {'indices': indices.astype(index_type), 'values': flat[indices]})
+
+    @staticmethod
+    def decompress(encoded):
+        tensor = np.zeros(int(np.prod(encoded.shape)), dtype=np.float32)
+        tensor[encoded.payload['indices']] = encoded.payload['values']
+        return tensor.reshape(encoded.shape)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import collections
 import logging
 
 import numpy as np
@@ -25,6 +26,9 @@ if args.task == "detection":
     from fedscale.dataloaders.rcnn.lib.roi_data_layer.roidb import \
         combined_roidb
 
+if args.task == "voice":
+    from fedscale.dataloaders.decoder import GreedyDecoder
+
 
 def cal_accuracy(targets, outputs):
     temp_acc = 0
@@ -312,6 +316,180 @@ def test_model(rank, model, test_data, device='cpu', criterion=nn.NLLLoss(), tok
     return test_loss, acc, acc_5, testRes
 
 
+def test_models(rank, models, test_data, device='cpu', criterion=nn.NLLLoss(), tokenizer=None):
+    """Evaluate several models with a single pass over test_data.
+
+    Each batch is loaded, pre-processed (e.g., token masking in nlp, target unflattening
+    in voice) and moved to the device once, then fed through every model, so the data
+    loading cost does not grow with the number of models. Detection is still evaluated
+    by test_model per model, as its evaluation keeps per-image boxes of each model.
+    A model that fails on a batch is no longer fed and keeps the results of the batches
+    before, as in test_model, while the other models go on. models is not modified.
+
+    Returns:
+        dictionary: model_id -> (test_loss, acc, acc_5, testRes), as in test_model
+    """
+    if args.task == 'detection':
+        logging.info(f"Detection models are tested one by one, with {len(models)} passes over the test data")
+        return {model_id: test_model(rank, model, test_data, device=device,
+                                     criterion=criterion, tokenizer=tokenizer)
+                for model_id, model in models.items()}
+
+    models = {model_id: model.to(device=device) for model_id, model in models.items()}
+    stats = {model_id: collections.defaultdict(float) for model_id in models}
+    # predicted and true labels of each sample in tag
+    preds = {model_id: [] for model_id in models}
+    targets_list = []
+    # models that failed on a batch
+    failed = set()
+
+    decoders = {}
+    for model_id in models:
+        models[model_id].eval()
+        if args.task == 'voice':
+            decoders[model_id] = GreedyDecoder(
+                models[model_id].labels, blank_index=models[model_id].labels.index('_'))
+
+    with torch.no_grad():
+        for data, target in test_data:
+            try:
+                # pre-process the batch once for all models
+                if args.task == 'nlp':
+                    # every model is tested on the same masked tokens
+                    data, target = mask_tokens(
+                        data, tokenizer, args, device=device)
+                    data, target = Variable(data).to(
+                        device=device), Variable(target).to(device=device)
+
+                elif args.task == 'text_clf' and args.model == 'albert-base-v2':
+                    (inputs, masks) = data
+                    (inputs, masks, target) = (Variable(inputs).to(device=device),
+                                               Variable(masks).to(device=device), Variable(target).to(device=device))
+
+                elif args.task == 'voice':
+                    (inputs, target, input_percentages, target_sizes) = data
+
+                    input_sizes = input_percentages.mul_(
+                        int(inputs.size(3))).int()
+                    inputs = Variable(inputs).to(device=device)
+
+                    # unflatten targets
+                    split_targets = []
+                    offset = 0
+                    for size in target_sizes:
+                        split_targets.append(target[offset:offset + size])
+                        offset += size
+                    # models of a job share the labels of the dataset
+                    target_strings = next(iter(decoders.values())).convert_to_strings(split_targets)
+
+                else:
+                    data, target = Variable(data).to(
+                        device=device), Variable(target).to(device=device)
+                    if args.task == 'speech':
+                        data = torch.unsqueeze(data, 1)
+                    if args.task == 'tag':
+                        batch_targets = [torch.nonzero(target[idx]).flatten().cpu().numpy().tolist()
+                                         for idx in range(len(target))]
+
+            except Exception as ex:
+                logging.info(f"Testing of failed as {ex}")
+                break
+
+            for model_id, model in models.items():
+                if model_id in failed:
+                    continue
+                model_stats = stats[model_id]
+                acc = None
+                try:
+                    if args.task == 'nlp':
+                        outputs = model(data, labels=target)
+
+                        loss = outputs[0]
+                        model_stats['test_loss'] += loss.data.item()
+                        acc = accuracy(
+                            outputs[1].reshape(-1, outputs[1].shape[2]), target.reshape(-1), topk=(1, 5))
+
+                    elif args.task == 'text_clf' and args.model == 'albert-base-v2':
+                        outputs = model(inputs, token_type_ids=None,
+                                        attention_mask=masks, labels=target)
+
+                        model_stats['test_loss'] += outputs.loss.item()
+                        acc = accuracy(outputs.logits, target, topk=(1, 2))
+
+                    elif args.task == 'voice':
+                        out, output_sizes = model(inputs, input_sizes)
+
+                        decoded_output, _ = decoders[model_id].decode(out, output_sizes)
+                        for x in range(len(target_strings)):
+                            transcript, reference = decoded_output[x][0], target_strings[x][0]
+                            model_stats['total_wer'] += decoders[model_id].wer(transcript, reference)
+                            model_stats['total_cer'] += decoders[model_id].cer(transcript, reference)
+                            model_stats['num_tokens'] += len(reference.split())
+
+                        outputs = out.transpose(0, 1)
+                        outputs = outputs.float()
+                        loss = criterion(
+                            outputs, target, output_sizes, target_sizes)
+                        model_stats['test_loss'] += loss.data.item()
+
+                    elif args.task == 'tag':
+                        output = model(data)
+                        loss = criterion(output, target)
+
+                        # we have to scan the sample one by one
+                        for idx, sample in enumerate(output):
+                            preds[model_id] += [sample.topk(len(batch_targets[idx]))[1].cpu().numpy().tolist()]
+                        model_stats['test_loss'] += loss.data.item()
+
+                    else:
+                        output = model(data)
+
+                        loss = criterion(output, target)
+                        model_stats['test_loss'] += loss.data.item()  # Variable.data
+                        acc = accuracy(output, target, topk=(1, 5))
+
+                    if acc is not None:
+                        model_stats['correct'] += acc[0].item()
+                        model_stats['top_5'] += acc[1].item()
+
+                except Exception as ex:
+                    logging.error(f"Testing of model {model_id} failed as {ex}")
+                    failed.add(model_id)
+                    continue
+                model_stats['test_len'] += len(target)
+
+            if args.task == 'tag':
+                targets_list += batch_targets
+            if len(failed) == len(models):
+                break
+
+    results = {}
+    for model_id in models:
+        model_stats = stats[model_id]
+        correct, top_5, model_len = model_stats['correct'], model_stats['top_5'], model_stats['test_len']
+        if args.task == 'voice':
+            correct, top_5, model_len = model_stats['total_wer'], model_stats['total_cer'], model_stats['num_tokens']
+
+        model_len = max(model_len, 1)
+        # loss function averages over batch size
+        model_loss = model_stats['test_loss'] / len(test_data)
+        sum_loss = model_loss * model_len
+
+        acc = round(correct / model_len, 4)
+        acc_5 = round(top_5 / model_len, 4)
+
+        if args.task == 'tag':
+            # a failed model only has the predictions of the samples before
+            top_5, correct, model_len = cal_accuracy(targets_list[:len(preds[model_id])], preds[model_id])
+
+        testRes = {'top_1': correct, 'top_5': top_5,
+                   'test_loss': sum_loss, 'test_len': model_len,
+                   'client_id': rank, 'acc': acc, 'acc_5': acc_5}
+        results[model_id] = (round(model_loss, 4), acc, acc_5, testRes)
+
+    return results
+
+
 def accuracy(output, target, topk=(1,)):
     """Computes the accuracy over the k top predictions for the specified values of k"""
     with torch.no_grad():
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from fedscale.dataloaders.divide_data import DataPartitioner
+
+
+class _Dataset(object):
+    def __init__(self, targets):
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.targets)
+
+
+def make_partitioner(samples_per_class=100, num_class=10, seed=10):
+    data = _Dataset(np.repeat(np.arange(num_class), samples_per_class).tolist())
+    return DataPartitioner(data, SimpleNamespace(task='cv'), numOfClass=num_class, seed=seed)
+
+
+@pytest.mark.parametrize('num_clients', [5, 10, 13, 50, 100])
+@pytest.mark.parametrize('seed', [0, 10, 233])
+def test_cifar_noniid_partition(num_clients, seed):
+    partitioner = make_partitioner(seed=seed)
+    label_split = partitioner.cifar_noniid_partition(num_clients)
+    labels = np.asarray(partitioner.labels)
+
+    assert partitioner.getClientLen() == num_clients
+    seen = []
+    for client in range(num_clients):
+        samples = partitioner.get_partition(client)
+        assert set(labels[samples]) <= set(label_split[client])
+        assert label_split[client][0] != label_split[client][1]
+        seen.append(samples)
+    seen = np.concatenate(seen)
+    assert len(np.unique(seen)) == len(seen)
+
+
+def test_cifar_noniid_partition_reuses_label_split():
+    train = make_partitioner(samples_per_class=100)
+    label_split = train.cifar_noniid_partition(50)
+    test = make_partitioner(samples_per_class=20, seed=1)
+    assert (test.cifar_noniid_partition(50, label_split=label_split) == label_split).all()
+    for client in range(50):
+        assert len(test.get_partition(client)) == 2 * 20 // 10
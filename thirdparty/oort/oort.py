@@ -123,10 +123,12 @@ class _testing_selector:
 
 class _training_selector(object):
     """Oort's training selector
+
+    The state of arms is kept in parallel arrays indexed by the dense index of
+    clients (in registration order), so that scoring and sampling are array operations.
     """
-    def __init__(self, args, sample_seed=233):
+    def __init__(self, args, sample_seed=233, capacity=1024):
 
-        self.totalArms = OrderedDict()
         self.training_round = 0
 
         self.exploration = args.exploration_factor
@@ -136,7 +138,6 @@ class _training_selector(object):
 
         self.rng = Random()
         self.rng.seed(sample_seed)
-        self.unexplored = set()
         self.args = args
         self.round_threshold = args.round_threshold
         self.round_prefer_duration = float('inf')
@@ -145,32 +146,97 @@ class _training_selector(object):
         self.sample_window = self.args.sample_window
         self.exploitUtilHistory = []
         self.exploreUtilHistory = []
-        self.exploitClients = []
-        self.exploreClients = []
-        self.successfulClients = set()
+        self.exploitClients = np2.zeros(0, dtype=np2.int64)
+        self.exploreClients = np2.zeros(0, dtype=np2.int64)
         self.blacklist = None
 
+        # arms: [client id, reward, duration, time_stamp, # of trials, status, explored, succeeded in last round]
+        self.num_arms = 0
+        self.id_to_idx = np2.full(capacity, -1, dtype=np2.int64)
+        self.client_ids = np2.zeros(capacity, dtype=np2.int64)
+        self.reward = np2.zeros(capacity, dtype=np2.float64)
+        self.duration = np2.zeros(capacity, dtype=np2.float64)
+        self.time_stamp = np2.zeros(capacity, dtype=np2.float64)
+        self.count = np2.zeros(capacity, dtype=np2.int64)
+        self.status = np2.zeros(capacity, dtype=bool)
+        self.explored = np2.zeros(capacity, dtype=bool)
+        self.successful = np2.zeros(capacity, dtype=bool)
+
         np2.random.seed(sample_seed)
 
+    _columns = ('client_ids', 'reward', 'duration', 'time_stamp', 'count', 'status', 'explored', 'successful')
+
+    def _reserve(self, num_arms, max_client_id):
+        """Grow the arm arrays and the id mapping (by doubling)"""
+        capacity = len(self.client_ids)
+        if num_arms > capacity:
+            new_capacity = max(num_arms, 2 * capacity)
+            for column in self._columns:
+                array = getattr(self, column)
+                grown = np2.zeros(new_capacity, dtype=array.dtype)
+                grown[:capacity] = array
+                setattr(self, column, grown)
+
+        if max_client_id >= len(self.id_to_idx):
+            grown = np2.full(max(max_client_id + 1, 2 * len(self.id_to_idx)), -1, dtype=np2.int64)
+            grown[:len(self.id_to_idx)] = self.id_to_idx
+            self.id_to_idx = grown
+
+    def _index_of(self, clientId):
+        clientId = int(clientId)
+        if 0 <= clientId < len(self.id_to_idx):
+            return self.id_to_idx[clientId]
+        return -1
+
+    def _indices_of(self, client_ids):
+        """Dense indices of the registered clients among client_ids"""
+        if isinstance(client_ids, (set, frozenset)):
+            client_ids = np2.fromiter(client_ids, dtype=np2.int64, count=len(client_ids))
+        client_ids = np2.asarray(client_ids, dtype=np2.int64)
+        client_ids = client_ids[(client_ids >= 0) & (client_ids < len(self.id_to_idx))]
+        indices = self.id_to_idx[client_ids]
+        return indices[indices >= 0]
+
     def register_client(self, clientId, feedbacks):
         # Initiate the score for arms. [score, time_stamp, # of trials, size of client, auxi, duration]
-        if clientId not in self.totalArms:
-            self.totalArms[clientId] = {}
-            self.totalArms[clientId]['reward'] = feedbacks['reward']
-            self.totalArms[clientId]['duration'] = feedbacks['duration']
-            self.totalArms[clientId]['time_stamp'] = self.training_round
-            self.totalArms[clientId]['count'] = 0
-            self.totalArms[clientId]['status'] = True
-
-            self.unexplored.add(clientId)
-
-    def calculateSumUtil(self, clientList):
-        cnt, cntUtil = 1e-4, 0
-
-        for client in clientList:
-            if client in self.successfulClients:
-                cnt += 1
-                cntUtil += self.totalArms[client]['reward']
+        if self._index_of(clientId) < 0:
+            self._reserve(self.num_arms + 1, int(clientId))
+            idx = self.num_arms
+            self.num_arms += 1
+            self.id_to_idx[int(clientId)] = idx
+
+            self.client_ids[idx] = int(clientId)
+            self.reward[idx] = feedbacks['reward']
+            self.duration[idx] = feedbacks['duration']
+            self.time_stamp[idx] = self.training_round
+            self.count[idx] = 0
+            self.status[idx] = True
+            self.explored[idx] = False
+
+    def register_clients(self, client_ids, feedbacks):
+        """Batch version of register_client, feedbacks holds arrays of 'reward' and 'duration'"""
+        client_ids = np2.asarray(client_ids, dtype=np2.int64)
+        if len(client_ids) == 0:
+            return
+        self._reserve(self.num_arms + len(client_ids), int(client_ids.max()))
+        new_clients = self.id_to_idx[client_ids] < 0
+        client_ids = client_ids[new_clients]
+        idx = np2.arange(self.num_arms, self.num_arms + len(client_ids))
+        self.num_arms += len(client_ids)
+        self.id_to_idx[client_ids] = idx
+
+        self.client_ids[idx] = client_ids
+        self.reward[idx] = np2.asarray(feedbacks['reward'])[new_clients]
+        self.duration[idx] = np2.asarray(feedbacks['duration'])[new_clients]
+        self.time_stamp[idx] = self.training_round
+        self.count[idx] = 0
+        self.status[idx] = True
+        self.explored[idx] = False
+
+    def calculateSumUtil(self, clientIdx):
+        successful = self.successful[clientIdx]
+        cnt = 1e-4 + successful.sum()
+        cntUtil = self.reward[clientIdx][successful].sum()
 
         return cntUtil/cnt
 
@@ -182,7 +248,7 @@ class _training_selector(object):
         self.exploreUtilHistory.append(lastExplorationUtil)
         self.exploitUtilHistory.append(lastExploitationUtil)
 
-        self.successfulClients = set()
+        self.successful[:] = False
 
         if self.training_round >= 2 * self.args.pacer_step and self.training_round % self.args.pacer_step == 0:
 
@@ -213,48 +279,75 @@ class _training_selector(object):
         @ feedbacks['duration']: system utility
         @ feedbacks['count']: times of involved
         '''
-        self.totalArms[clientId]['reward'] = feedbacks['reward']
-        self.totalArms[clientId]['duration'] = feedbacks['duration']
-        self.totalArms[clientId]['time_stamp'] = feedbacks['time_stamp']
-        self.totalArms[clientId]['count'] += 1
-        self.totalArms[clientId]['status'] = feedbacks['status']
-
-        self.unexplored.discard(clientId)
-        self.successfulClients.add(clientId)
-
+        idx = self._index_of(clientId)
+        if idx < 0:
+            raise KeyError(clientId)
+        self.reward[idx] = feedbacks['reward']
+        self.duration[idx] = feedbacks['duration']
+        self.time_stamp[idx] = feedbacks['time_stamp']
+        self.count[idx] += 1
+        self.status[idx] = feedbacks['status']
+
+        self.explored[idx] = True
+        self.successful[idx] = True
 
     def get_blacklist(self):
-        blacklist = []
+        """Mask of the arms that have been trained for more than blacklist_rounds"""
+        blacklist = np2.zeros(self.num_arms, dtype=bool)
 
         if self.args.blacklist_rounds != -1:
-            sorted_client_ids = sorted(list(self.totalArms), reverse=True,
-                                        key=lambda k:self.totalArms[k]['count'])
-
-            for clientId in sorted_client_ids:
-                if self.totalArms[clientId]['count'] > self.args.blacklist_rounds:
-                    blacklist.append(clientId)
-                else:
-                    break
+            count = self.count[:self.num_arms]
+            candidates = np2.flatnonzero(count > self.args.blacklist_rounds)
 
             # we need to back up if we have blacklisted all clients
-            predefined_max_len = self.args.blacklist_max_len * len(self.totalArms)
+            predefined_max_len = int(self.args.blacklist_max_len * self.num_arms)
 
-            if len(blacklist) > predefined_max_len:
+            if len(candidates) > predefined_max_len:
                 logging.warning("Training Selector: exceeds the blacklist threshold")
-                blacklist = blacklist[:predefined_max_len]
+                candidates = candidates[np2.argsort(-count[candidates], kind='stable')[:predefined_max_len]]
+            blacklist[candidates] = True
 
-        return set(blacklist)
+        return blacklist
 
     def select_participant(self, num_of_clients, feasible_clients=None):
         '''
         @ num_of_clients: # of clients selected
         '''
-        viable_clients = feasible_clients if feasible_clients is not None else set([x for x in self.totalArms.keys() if self.totalArms[x]['status']])
+        if feasible_clients is None:
+            viable_clients = self.client_ids[:self.num_arms][self.status[:self.num_arms]]
+        else:
+            viable_clients = feasible_clients
         return self.getTopK(num_of_clients, self.training_round+1, viable_clients)
 
     def update_duration(self, clientId, duration):
-        if clientId in self.totalArms:
-            self.totalArms[clientId]['duration'] = duration
+        idx = self._index_of(clientId)
+        if idx >= 0:
+            self.duration[idx] = duration
+
+    def update_durations(self, client_ids, durations):
+        client_ids = np2.asarray(client_ids, dtype=np2.int64)
+        known = self._index_mask(client_ids)
+        self.duration[self.id_to_idx[client_ids[known]]] = np2.asarray(durations)[known]
+
+    def _index_mask(self, client_ids):
+        """Which of client_ids are registered"""
+        client_ids = np2.asarray(client_ids, dtype=np2.int64)
+        in_range = (client_ids >= 0) & (client_ids < len(self.id_to_idx))
+        known = np2.zeros(len(client_ids), dtype=bool)
+        known[in_range] = self.id_to_idx[client_ids[in_range]] >= 0
+        return known
+
+    def _penalize_duration(self, scores, durations):
+        """Penalize the scores of clients slower than the preferred round duration"""
+        slow = durations > self.round_prefer_duration
+        if slow.any():
+            scores[slow] *= (float(self.round_prefer_duration)/np2.maximum(1e-4, durations[slow])) ** self.args.round_penalty
+        return scores
+
+    def _weighted_sample(self, candidates, weights, size):
+        total = weights.sum()
+        p = weights/total if total > 0 else None
+        return np2.random.choice(candidates, size, p=p, replace=False)
 
     def getTopK(self, numOfSamples, cur_time, feasible_clients):
         self.training_round = cur_time
@@ -262,141 +355,126 @@ class _training_selector(object):
 
         self.pacer()
 
+        n = self.num_arms
+        feasible = np2.zeros(n, dtype=bool)
+        feasible[self._indices_of(feasible_clients)] = True
+
         # normalize the score of all arms: Avg + Confidence
-        scores = {}
-        numOfExploited = 0
+        orderedKeys = np2.flatnonzero(feasible & ~self.blacklist)
         exploreLen = 0
 
-        client_list = list(self.totalArms.keys())
-        orderedKeys = [x for x in client_list if int(x) in feasible_clients and int(x) not in self.blacklist]
-
-
-        if self.round_threshold < 100.:
-            sortedDuration = sorted([self.totalArms[key]['duration'] for key in client_list])
-            self.round_prefer_duration = sortedDuration[min(int(len(sortedDuration) * self.round_threshold/100.), len(sortedDuration)-1)]
+        if self.round_threshold < 100. and n > 0:
+            kth = min(int(n * self.round_threshold/100.), n-1)
+            self.round_prefer_duration = float(np2.partition(self.duration[:n], kth)[kth])
         else:
             self.round_prefer_duration = float('inf')
 
-        moving_reward, staleness, allloss = [], [], {}
-
-        for clientId in orderedKeys:
-            if self.totalArms[clientId]['reward'] > 0:
-                creward = self.totalArms[clientId]['reward']
-                moving_reward.append(creward)
-                staleness.append(cur_time - self.totalArms[clientId]['time_stamp'])
-
+        rewarded = orderedKeys[self.reward[orderedKeys] > 0]
+        moving_reward = self.reward[rewarded]
+        staleness = cur_time - self.time_stamp[rewarded]
 
         max_reward, min_reward, range_reward, avg_reward, clip_value = self.get_norm(moving_reward, self.args.clip_bound)
         max_staleness, min_staleness, range_staleness, avg_staleness, _ = self.get_norm(staleness, thres=1)
 
-        for key in orderedKeys:
-            # we have played this arm before
-            if self.totalArms[key]['count'] > 0:
-                creward = min(self.totalArms[key]['reward'], clip_value)
-                numOfExploited += 1
-
-                sc = (creward - min_reward)/float(range_reward) \
-                    + math.sqrt(0.1*math.log(cur_time)/self.totalArms[key]['time_stamp']) # temporal uncertainty
+        # we have played these arms before
+        clientLakes = orderedKeys[self.count[orderedKeys] > 0]
+        numOfExploited = len(clientLakes)
 
-                # sc = (creward - min_reward)/float(range_reward) \
-                #     + self.alpha*((cur_time-self.totalArms[key]['time_stamp']) - min_staleness)/float(range_staleness)
+        creward = np2.minimum(self.reward[clientLakes], clip_value)
+        scores = (creward - min_reward)/float(range_reward) \
+            + np2.sqrt(0.1*math.log(cur_time)/self.time_stamp[clientLakes]) # temporal uncertainty
+        scores = np2.abs(self._penalize_duration(scores, self.duration[clientLakes]))
 
-                clientDuration = self.totalArms[key]['duration']
-                if clientDuration > self.round_prefer_duration:
-                    sc *= ((float(self.round_prefer_duration)/max(1e-4, clientDuration)) ** self.args.round_penalty)
-
-                if self.totalArms[key]['time_stamp']==cur_time:
-                    allloss[key] = sc
-
-                scores[key] = abs(sc)
-
-
-        clientLakes = list(scores.keys())
         self.exploration = max(self.exploration*self.decay_factor, self.exploration_min)
         explorationLen = int(numOfSamples*self.exploration)
 
         # exploitation
         exploitLen = min(numOfSamples-explorationLen, len(clientLakes))
+        augment_factor = 0
+        self.exploitClients = np2.zeros(0, dtype=np2.int64)
 
-        # take the top-k, and then sample by probability, take 95% of the cut-off loss
-        sortedClientUtil = sorted(scores, key=scores.get, reverse=True)
+        if exploitLen > 0:
+            # take the top-k, and then sample by probability, take 95% of the cut-off loss
+            kth = min(exploitLen, len(scores)-1)
+            cut_off_util = np2.partition(scores, len(scores)-1-kth)[len(scores)-1-kth] * self.args.cut_off_util
 
-        # take cut-off utility
-        cut_off_util = scores[sortedClientUtil[exploitLen]] * self.args.cut_off_util
-
-        tempPickedClients = []
-        for clientId in sortedClientUtil:
             # we want at least 10 times of clients for augmentation
-            if scores[clientId] < cut_off_util and len(tempPickedClients) > 10.*exploitLen:
-                break
-            tempPickedClients.append(clientId)
-
-        augment_factor = len(tempPickedClients)
+            augment_factor = min(max(int((scores >= cut_off_util).sum()), 10*exploitLen+1), len(scores))
+            if augment_factor < len(scores):
+                tempPicked = np2.argpartition(-scores, augment_factor-1)[:augment_factor]
+            else:
+                tempPicked = np2.arange(len(scores))
+            tempPicked = tempPicked[np2.argsort(-scores[tempPicked], kind='stable')]
 
-        totalSc = max(1e-4, float(sum([scores[key] for key in tempPickedClients])))
-        self.exploitClients = list(np2.random.choice(tempPickedClients, exploitLen, p=[scores[key]/totalSc for key in tempPickedClients], replace=False))
-
-        pickedClients = []  
+            self.exploitClients = clientLakes[self._weighted_sample(tempPicked, scores[tempPicked], exploitLen)]
 
         # exploration
-        _unexplored = [x for x in list(self.unexplored) if int(x) in feasible_clients]
+        self.exploreClients = np2.zeros(0, dtype=np2.int64)
+        _unexplored = np2.flatnonzero(feasible & ~self.explored[:n])
         if len(_unexplored) > 0:
-            init_reward = {}
-            for cl in _unexplored:
-                init_reward[cl] = self.totalArms[cl]['reward']
-                clientDuration = self.totalArms[cl]['duration']
-
-                if clientDuration > self.round_prefer_duration:
-                    init_reward[cl] *= ((float(self.round_prefer_duration)/max(1e-4, clientDuration)) ** self.args.round_penalty)
+            init_reward = self._penalize_duration(self.reward[_unexplored].copy(), self.duration[_unexplored])
 
             # prioritize w/ some rewards (i.e., size)
             exploreLen = min(len(_unexplored), numOfSamples-len(self.exploitClients))
-            pickedUnexploredClients = sorted(init_reward, key=init_reward.get, reverse=True)[:min(int(self.sample_window*exploreLen), len(init_reward))]
-
-            unexploredSc = float(sum([init_reward[key] for key in pickedUnexploredClients]))
-
-            pickedUnexplored = list(np2.random.choice(pickedUnexploredClients, exploreLen,
-                            p=[init_reward[key]/max(1e-4, unexploredSc) for key in pickedUnexploredClients], replace=False))
-
-            self.exploreClients = pickedUnexplored
-
-
-        pickedClients = self.exploreClients + self.exploitClients
+            windowLen = min(max(int(self.sample_window*exploreLen), exploreLen), len(_unexplored))
+            if windowLen < len(_unexplored):
+                pickedUnexplored = np2.argpartition(-init_reward, windowLen-1)[:windowLen]
+            else:
+                pickedUnexplored = np2.arange(len(_unexplored))
+            pickedUnexplored = pickedUnexplored[np2.argsort(-init_reward[pickedUnexplored], kind='stable')]
+
+            if exploreLen > 0:
+                self.exploreClients = _unexplored[self._weighted_sample(
+                    pickedUnexplored, init_reward[pickedUnexplored], exploreLen)]
+
+        pickedClients = np2.concatenate([self.exploreClients, self.exploitClients])
         top_k_score = []
-        for i in range(min(3, len(pickedClients))):
-            clientId = pickedClients[i]
-            _score = (self.totalArms[clientId]['reward'] - min_reward)/range_reward
-            _staleness = self.alpha*((cur_time-self.totalArms[clientId]['time_stamp']) - min_staleness)/float(range_staleness) #math.sqrt(0.1*math.log(cur_time)/max(1e-4, self.totalArms[clientId]['time_stamp']))
-            top_k_score.append((self.totalArms[clientId], [_score, _staleness]))
+        for idx in pickedClients[:3]:
+            _score = (self.reward[idx] - min_reward)/range_reward
+            _staleness = self.alpha*((cur_time-self.time_stamp[idx]) - min_staleness)/float(range_staleness)
+            top_k_score.append((self._get_arm(idx), [_score, _staleness]))
 
         logging.info("At round {}, UCB exploited {}, augment_factor {}, exploreLen {}, un-explored {}, exploration {}, round_threshold {}, sampled score is {}"
-            .format(cur_time, numOfExploited, augment_factor/max(1e-4, exploitLen), exploreLen, len(self.unexplored), self.exploration, self.round_threshold, top_k_score))
-        # logging.info("At time {}, all rewards are {}".format(cur_time, allloss))
+            .format(cur_time, numOfExploited, augment_factor/max(1e-4, exploitLen), exploreLen, n - int(self.explored[:n].sum()), self.exploration, self.round_threshold, top_k_score))
 
-        return pickedClients
+        return self.client_ids[pickedClients].tolist()
 
     def get_median_reward(self):
-        feasible_rewards = [self.totalArms[x]['reward'] for x in list(self.totalArms.keys()) if int(x) not in self.blacklist]
+        rewards = self.reward[:self.num_arms]
+        if self.blacklist is not None:
+            rewards = rewards[~self.blacklist[:self.num_arms]]
 
         # we report mean instead of median
-        if len(feasible_rewards) > 0:   
-            return sum(feasible_rewards)/float(len(feasible_rewards))
+        if len(rewards) > 0:
+            return float(rewards.mean())
 
         return 0
 
+    def _get_arm(self, idx):
+        return {'reward': self.reward[idx].item(), 'duration': self.duration[idx].item(),
+                'time_stamp': self.time_stamp[idx].item(), 'count': self.count[idx].item(),
+                'status': bool(self.status[idx])}
+
     def get_client_reward(self, armId):
-        return self.totalArms[armId]
+        idx = self._index_of(armId)
+        if idx < 0:
+            raise KeyError(armId)
+        return self._get_arm(idx)
 
     def getAllMetrics(self):
-        return self.totalArms
+        return OrderedDict((clientId, self._get_arm(idx))
+                           for idx, clientId in enumerate(self.client_ids[:self.num_arms].tolist()))
 
     def get_norm(self, aList, clip_bound=0.95, thres=1e-4):
-        aList.sort()
-        clip_value = aList[min(int(len(aList)*clip_bound), len(aList)-1)]
-
-        _max = aList[-1]
-        _min = aList[0]*0.999
+        aList = np2.asarray(aList, dtype=np2.float64)
+        if len(aList) == 0:
+            return 0., 0., float(thres), 0., 0.
+        kth = min(int(len(aList)*clip_bound), len(aList)-1)
+        clip_value = np2.partition(aList, kth)[kth]
+
+        _max = aList.max()
+        _min = aList.min()*0.999
         _range = max(_max - _min, thres)
-        _avg = sum(aList)/max(1e-4, float(len(aList)))
+        _avg = aList.sum()/max(1e-4, float(len(aList)))
 
         return float(_max), float(_min), float(_range), float(_avg), float(clip_value)